@@ -0,0 +1,435 @@
+"""Online snapshots of invoices.db and clients.json, with rotation and verified restore.
+
+A snapshot is a folder in backup_dir named after its time, holding
+invoices.db.gz, clients.json.gz and a manifest.json with the SHA-256 and
+size of each file before compression plus row counts. The database is
+copied with SQLite's backup API a few MB at a time while the app keeps
+running: in WAL mode the copy reads from one snapshot of the database, so
+writers are never blocked and the copy never has to start over. Each
+snapshot is built in a temporary folder and renamed into place once
+complete, so an interrupted run leaves nothing that looks like a backup.
+
+    python -m invoice_maker backup                   take a snapshot, then rotate old ones
+    python -m invoice_maker backup --list
+    python -m invoice_maker backup --verify all
+    python -m invoice_maker backup --restore latest  verify, keep the current data, restore
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from config import app_config
+from db import ClientDB, InvoiceDB
+from file_lock import FileLock
+from tracing import span
+
+FORMAT_VERSION = 1
+# Pages copied per backup step; 1024 pages of 4 KB is 4 MB
+BACKUP_STEP_PAGES = 1024
+# Without WAL each step lets waiting writers in, and every write restarts the
+# copy; after this many restarts the copy holds its read lock to finish
+BACKUP_MAX_RESTARTS = 3
+BACKUP_STEP_PAUSE_S = 0.01
+CHUNK_SIZE = 1024 * 1024
+LOCK_TIMEOUT_S = 60.0
+NAME_FORMAT = "%Y%m%d-%H%M%S"
+DB_FILE = "invoices.db"
+CLIENTS_FILE = "clients.json"
+MANIFEST = "manifest.json"
+
+
+class _Restarted(Exception):
+    pass
+
+
+def backup_dir():
+    return app_config.get_str("backup_dir", "backups")
+
+
+def snapshot_time(name):
+    return datetime.strptime(name[:15], NAME_FORMAT)
+
+
+def list_snapshots(directory=None):
+    """Names of complete snapshots, oldest first"""
+    directory = directory or backup_dir()
+    if not os.path.isdir(directory):
+        return []
+    names = []
+    for name in os.listdir(directory):
+        if name.startswith(".") or not os.path.isfile(os.path.join(directory, name, MANIFEST)):
+            continue
+        try:
+            snapshot_time(name)
+        except ValueError:
+            continue
+        names.append(name)
+    return sorted(names)
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def resolve(name, directory=None):
+    """Path of a snapshot given its name or "latest" """
+    directory = directory or backup_dir()
+    names = list_snapshots(directory)
+    if name == "latest":
+        if not names:
+            raise ValueError(f"No snapshots in {directory}")
+        name = names[-1]
+    if name not in names:
+        raise ValueError(f"No snapshot named {name} in {directory}")
+    return os.path.join(directory, name)
+
+
+def copy_database(target_path, step_pages=BACKUP_STEP_PAGES):
+    """Copy invoices.db to target_path with the backup API; returns the number of steps"""
+    source = InvoiceDB.connect()
+    target = sqlite3.connect(target_path)
+    steps = 0
+    try:
+        wal = source.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+        hold = wal
+        while True:
+            if hold:
+                # Pins one snapshot of the database for the whole copy
+                source.execute("BEGIN")
+                source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            restarts = 0
+            last_left = None
+
+            def progress(status, left, total):
+                nonlocal steps, restarts, last_left
+                steps += 1
+                # A write by another connection sends the copy back to the start
+                if last_left is not None and left >= last_left:
+                    restarts += 1
+                    if restarts > BACKUP_MAX_RESTARTS:
+                        raise _Restarted()
+                last_left = left
+                if not hold:
+                    time.sleep(BACKUP_STEP_PAUSE_S)
+
+            try:
+                source.backup(target, pages=step_pages, progress=progress)
+                return steps
+            except _Restarted:
+                hold = True
+            finally:
+                if source.in_transaction:
+                    source.rollback()
+    finally:
+        target.close()
+        source.close()
+
+
+def compress(source_path, archive_path, level):
+    """gzip source_path into archive_path; returns (sha256, size) of the uncompressed data"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(source_path, "rb") as src, gzip.open(archive_path, "wb", compresslevel=level) as dst:
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+            dst.write(chunk)
+    return digest.hexdigest(), size
+
+
+def extract(archive_path, target_path):
+    """Decompress archive_path into target_path; returns (sha256, size) of the result"""
+    digest = hashlib.sha256()
+    size = 0
+    with gzip.open(archive_path, "rb") as src, open(target_path, "wb") as dst:
+        while True:
+            chunk = src.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+            dst.write(chunk)
+    return digest.hexdigest(), size
+
+
+def table_counts(conn):
+    return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                                         "AND name NOT LIKE 'sqlite_%' ORDER BY name").fetchall()}
+
+
+def create_snapshot(directory=None, level=None, skip_unchanged=True):
+    """Take a snapshot; returns its path, or None when nothing changed since the latest one"""
+    directory = directory or backup_dir()
+    level = level if level is not None else app_config.get_int("backup_compress_level", 1)
+    os.makedirs(directory, exist_ok=True)
+    with FileLock(os.path.join(directory, "snapshots"), LOCK_TIMEOUT_S):
+        # Leftovers of runs that were interrupted
+        for name in os.listdir(directory):
+            if name.startswith(".tmp-"):
+                shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+        started = datetime.now()
+        name = started.strftime(NAME_FORMAT)
+        suffix = 1
+        while os.path.exists(os.path.join(directory, name)):
+            suffix += 1
+            name = f"{started.strftime(NAME_FORMAT)}-{suffix}"
+        work_dir = os.path.join(directory, f".tmp-{name}")
+        os.makedirs(work_dir)
+        try:
+            manifest = {"format": FORMAT_VERSION, "created_at": started.isoformat(), "files": {}}
+            copy_path = os.path.join(work_dir, DB_FILE)
+            with span("backup.copy"):
+                manifest["steps"] = copy_database(copy_path)
+            conn = sqlite3.connect(copy_path)
+            try:
+                manifest["page_size"] = conn.execute("PRAGMA page_size").fetchone()[0]
+                manifest["counts"] = table_counts(conn)
+            finally:
+                conn.close()
+            with span("backup.compress"):
+                sha256, size = compress(copy_path, copy_path + ".gz", level)
+            os.remove(copy_path)
+            manifest["files"][DB_FILE] = {"archive": DB_FILE + ".gz", "sha256": sha256, "size": size}
+
+            clients_path = app_config["clients_db"]
+            if os.path.exists(clients_path):
+                # clients.json is always replaced whole, so a plain read is consistent
+                archive = os.path.join(work_dir, CLIENTS_FILE + ".gz")
+                sha256, size = compress(clients_path, archive, level)
+                manifest["files"][CLIENTS_FILE] = {"archive": CLIENTS_FILE + ".gz", "sha256": sha256, "size": size}
+
+            names = list_snapshots(directory)
+            if skip_unchanged and names:
+                latest = read_manifest(os.path.join(directory, names[-1]))
+                if all(latest["files"].get(file, {}).get("sha256") == entry["sha256"]
+                       for file, entry in manifest["files"].items()) and \
+                        latest["files"].keys() == manifest["files"].keys():
+                    return None
+
+            manifest["seconds"] = round((datetime.now() - started).total_seconds(), 2)
+            with open(os.path.join(work_dir, MANIFEST), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            path = os.path.join(directory, name)
+            os.rename(work_dir, path)
+            return path
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def rotate(directory=None, keep_recent=None, keep_daily=None, now=None):
+    """Delete snapshots outside the retention policy; returns the names removed.
+
+    The newest keep_recent snapshots are kept, plus the newest snapshot of
+    each of the last keep_daily days.
+    """
+    directory = directory or backup_dir()
+    keep_recent = keep_recent if keep_recent is not None else app_config.get_int("backup_keep_recent", 24)
+    keep_daily = keep_daily if keep_daily is not None else app_config.get_int("backup_keep_daily", 14)
+    now = now or datetime.now()
+    names = list_snapshots(directory)
+    keep = set(names[-keep_recent:]) if keep_recent > 0 else set()
+    first_day = (now - timedelta(days=keep_daily - 1)).date()
+    newest_per_day = {}
+    for name in names:
+        day = snapshot_time(name).date()
+        if day >= first_day:
+            newest_per_day[day] = name
+    keep.update(newest_per_day.values())
+    removed = [name for name in names if name not in keep]
+    with FileLock(os.path.join(directory, "snapshots"), LOCK_TIMEOUT_S):
+        for name in removed:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    return removed
+
+
+def verify_file(path, manifest, file, target_path):
+    """Extract one file of the snapshot to target_path and check it against the manifest"""
+    entry = manifest["files"][file]
+    try:
+        sha256, size = extract(os.path.join(path, entry["archive"]), target_path)
+    except (OSError, EOFError) as e:
+        raise ValueError(f"{file}: cannot read the archive: {str(e)}")
+    if (sha256, size) != (entry["sha256"], entry["size"]):
+        raise ValueError(f"{file}: checksum does not match the manifest")
+
+
+def verify_database(path, target_path):
+    """Check that target_path is an intact copy of the snapshot's database"""
+    manifest = read_manifest(path)
+    verify_file(path, manifest, DB_FILE, target_path)
+    conn = sqlite3.connect(target_path)
+    try:
+        problems = [row[0] for row in conn.execute("PRAGMA integrity_check(20)")]
+        if problems != ["ok"]:
+            raise ValueError(f"{DB_FILE}: integrity check failed: {'; '.join(problems)}")
+        if table_counts(conn) != manifest["counts"]:
+            raise ValueError(f"{DB_FILE}: row counts do not match the manifest")
+    finally:
+        conn.close()
+
+
+def read_clients(path):
+    """The snapshot's client list after checking its checksum, or None if it has none"""
+    manifest = read_manifest(path)
+    if CLIENTS_FILE not in manifest["files"]:
+        return None
+    try:
+        with gzip.open(os.path.join(path, manifest["files"][CLIENTS_FILE]["archive"]), "rb") as f:
+            data = f.read()
+    except (OSError, EOFError) as e:
+        raise ValueError(f"{CLIENTS_FILE}: cannot read the archive: {str(e)}")
+    if hashlib.sha256(data).hexdigest() != manifest["files"][CLIENTS_FILE]["sha256"]:
+        raise ValueError(f"{CLIENTS_FILE}: checksum does not match the manifest")
+    return json.loads(data)
+
+
+def verify_snapshot(path):
+    """Raise ValueError unless every file in the snapshot is intact"""
+    scratch = os.path.join(os.path.dirname(path), f".verify-{os.path.basename(path)}.db")
+    try:
+        verify_database(path, scratch)
+    finally:
+        if os.path.exists(scratch):
+            os.remove(scratch)
+    read_clients(path)
+
+
+def restore_snapshot(path, safety_snapshot=True, directory=None):
+    """Verify the snapshot, snapshot the current data, then restore both stores.
+
+    The database is restored through the backup API in a single step, so
+    other connections see either the old or the restored contents.
+    Returns the path of the safety snapshot, if one was taken.
+    """
+    manifest = read_manifest(path)
+    db_path = app_config["invoices_db"]
+    scratch = os.path.join(os.path.dirname(os.path.abspath(db_path)), f".restore-{os.path.basename(path)}.db")
+    try:
+        with span("backup.verify"):
+            verify_database(path, scratch)
+            clients = read_clients(path)
+        safety = create_snapshot(directory) if safety_snapshot and os.path.exists(db_path) else None
+
+        source = sqlite3.connect(scratch)
+        target = InvoiceDB.connect()
+        try:
+            with span("backup.restore"):
+                source.backup(target)
+            counts = table_counts(target)
+            check = target.execute("PRAGMA quick_check").fetchone()[0]
+        except sqlite3.Error as e:
+            raise ValueError(f"Could not restore {db_path}: {str(e)}")
+        finally:
+            target.close()
+            source.close()
+        if check != "ok" or counts != manifest["counts"]:
+            raise ValueError(f"{db_path} does not match the snapshot after restoring; "
+                             f"restore {safety or 'a newer snapshot'} to undo")
+    finally:
+        if os.path.exists(scratch):
+            os.remove(scratch)
+    if clients is not None:
+        ClientDB.save_clients(clients)
+    return safety
+
+
+def latest_clients(directory=None):
+    """(snapshot name, clients) from the newest snapshot with an intact copy, or None"""
+    directory = directory or backup_dir()
+    for name in reversed(list_snapshots(directory)):
+        try:
+            clients = read_clients(os.path.join(directory, name))
+        except ValueError:
+            continue
+        if clients is not None:
+            return name, clients
+    return None
+
+
+def keep_damaged_file(path, directory=None):
+    """Move a file that could not be read into the backup folder; returns its new path"""
+    directory = directory or backup_dir()
+    os.makedirs(directory, exist_ok=True)
+    stem, extension = os.path.splitext(os.path.basename(path))
+    target = os.path.join(directory, f"{stem}-damaged-{datetime.now().strftime(NAME_FORMAT)}{extension}")
+    os.replace(path, target)
+    return target
+
+
+def describe(path):
+    manifest = read_manifest(path)
+    stored = sum(os.path.getsize(os.path.join(path, entry["archive"])) for entry in manifest["files"].values())
+    original = sum(entry["size"] for entry in manifest["files"].values())
+    counts = manifest.get("counts", {})
+    return (f"{os.path.basename(path):<20}{original / 1024 / 1024:>10.1f} MB{stored / 1024 / 1024:>10.1f} MB"
+            f"{counts.get('invoices', 0):>10} invoices  {manifest.get('seconds', 0):>6.1f} s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m invoice_maker backup",
+                                     description="Snapshot, verify and restore invoices.db and clients.json")
+    parser.add_argument("--list", action="store_true", help="show the snapshots")
+    parser.add_argument("--verify", metavar="NAME", help='check a snapshot\'s checksums, or "all"')
+    parser.add_argument("--restore", metavar="NAME", help='restore a snapshot, or "latest"')
+    parser.add_argument("--no-safety-snapshot", action="store_true",
+                        help="don't snapshot the current data before restoring")
+    parser.add_argument("--dir", help="snapshot folder instead of backup_dir")
+    args = parser.parse_args(argv)
+    directory = args.dir or backup_dir()
+
+    InvoiceDB.initialize()
+    try:
+        if args.list:
+            print(f"{'snapshot':<20}{'original':>13}{'stored':>13}")
+            for name in list_snapshots(directory):
+                print(describe(os.path.join(directory, name)))
+            return
+        if args.verify:
+            names = list_snapshots(directory) if args.verify == "all" else [args.verify]
+            failed = 0
+            for name in names:
+                try:
+                    verify_snapshot(resolve(name, directory))
+                    print(f"{name}: ok")
+                except ValueError as e:
+                    failed += 1
+                    print(f"{name}: {str(e)}")
+            if failed:
+                raise SystemExit(1)
+            return
+        if args.restore:
+            path = resolve(args.restore, directory)
+            safety = restore_snapshot(path, not args.no_safety_snapshot, directory)
+            print(f"Restored {os.path.basename(path)}")
+            if safety:
+                print(f"The data it replaced is in snapshot {os.path.basename(safety)}")
+            return
+
+        path = create_snapshot(directory)
+        if path is None:
+            print("Nothing changed since the latest snapshot")
+        else:
+            print(describe(path))
+        removed = rotate(directory)
+        if removed:
+            print(f"Removed {len(removed)} old snapshot(s)")
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+from db import InvoiceDB
+from renderer import get_temp_root
+
+PDF_HEADER = b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n"
+
+
+def invoice_ids_for_filters(filters=None, order_by="invoice_date DESC"):
+    return [row[0] for row in InvoiceDB.get_all_invoices(filters, order_by)]
+
+
+class PdfConcatenator:
+    """Writes source PDFs into one file as they are added, with a bookmark per source.
+
+    Each page and everything it uses is copied straight to the output
+    with renumbered objects, so only the current source is held in
+    memory. Identical self-contained streams (embedded fonts, logos) are
+    written once and shared. What is kept for the end (page and bookmark
+    numbers, object offsets, one hash per shared stream) is a few bytes
+    per object.
+    """
+
+    def __init__(self, f):
+        from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+        self._types = ArrayObject, DictionaryObject, IndirectObject, StreamObject
+        self.f = f
+        self.offsets = [None]
+        self.page_numbers = []
+        self.bookmarks = []
+        self.shared = {}
+        f.write(PDF_HEADER)
+        self.pages_number = self._reserve()
+
+    def _reserve(self):
+        self.offsets.append(None)
+        return len(self.offsets) - 1
+
+    def _write(self, number, data):
+        self.offsets[number] = self.f.tell()
+        self.f.write(b"%d 0 obj\n" % number + data + b"\nendobj\n")
+
+    @staticmethod
+    def _serialize(obj):
+        buffer = io.BytesIO()
+        obj.write_to_stream(buffer)
+        return buffer.getvalue()
+
+    def _has_references(self, obj):
+        ArrayObject, DictionaryObject, IndirectObject, _ = self._types
+        if isinstance(obj, IndirectObject):
+            return True
+        if isinstance(obj, DictionaryObject):
+            return any(self._has_references(value) for key, value in obj.items() if key != "/Length")
+        if isinstance(obj, ArrayObject):
+            return any(self._has_references(value) for value in obj)
+        return False
+
+    def _remap(self, obj, mapping):
+        """Point obj's references at output objects, copying them first; the reader is thrown away after"""
+        ArrayObject, DictionaryObject, IndirectObject, StreamObject = self._types
+        if isinstance(obj, IndirectObject):
+            return IndirectObject(self._copy(obj, mapping), 0, None)
+        if isinstance(obj, DictionaryObject):
+            if isinstance(obj, StreamObject):
+                # Written from the data on output
+                obj.pop("/Length", None)
+            # Links back into the source page tree; pages get the output tree as parent
+            obj.pop("/Parent", None)
+            obj.pop("/P", None)
+            for key, value in list(obj.items()):
+                obj[key] = self._remap(value, mapping)
+        elif isinstance(obj, ArrayObject):
+            for index, value in enumerate(obj):
+                obj[index] = self._remap(value, mapping)
+        return obj
+
+    def _copy(self, reference, mapping):
+        key = (reference.idnum, reference.generation)
+        if key in mapping:
+            return mapping[key]
+        obj = reference.get_object()
+        if obj is None:
+            return self._null(mapping, key)
+        if isinstance(obj, self._types[3]) and not self._has_references(obj):
+            obj.pop("/Length", None)
+            data = self._serialize(obj)
+            digest = hashlib.sha256(data).digest()
+            number = self.shared.get(digest)
+            if number is None:
+                number = self.shared[digest] = self._reserve()
+                self._write(number, data)
+            mapping[key] = number
+            return number
+        number = mapping[key] = self._reserve()
+        self._write(number, self._serialize(self._remap(obj, mapping)))
+        return number
+
+    def _null(self, mapping, key):
+        number = mapping[key] = self._reserve()
+        self._write(number, b"null")
+        return number
+
+    def append(self, path, bookmark):
+        from pypdf import PdfReader
+        from pypdf.generic import IndirectObject, NameObject
+        reader = PdfReader(path)
+        pages = list(reader.pages)
+        if not pages:
+            return
+        mapping = {}
+        # Reserved up front so links between pages point at the copies
+        numbers = []
+        for page in pages:
+            ref = page.indirect_reference
+            number = self._reserve()
+            if ref is not None:
+                mapping[(ref.idnum, ref.generation)] = number
+            numbers.append(number)
+        for page, number in zip(pages, numbers):
+            self._remap(page, mapping)
+            page[NameObject("/Parent")] = IndirectObject(self.pages_number, 0, None)
+            self._write(number, self._serialize(page))
+        self.page_numbers.extend(numbers)
+        self.bookmarks.append((bookmark, numbers[0]))
+
+    def close(self):
+        """Write the page tree, bookmarks, catalog and cross-reference table"""
+        from pypdf.generic import TextStringObject
+        kids = b" ".join(b"%d 0 R" % number for number in self.page_numbers)
+        self._write(self.pages_number, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.page_numbers)))
+
+        outline_number = self._reserve()
+        first_item = len(self.offsets)
+        count = len(self.bookmarks)
+        for index, (title, page_number) in enumerate(self.bookmarks):
+            number = self._reserve()
+            links = b""
+            if index > 0:
+                links += b" /Prev %d 0 R" % (number - 1)
+            if index < count - 1:
+                links += b" /Next %d 0 R" % (number + 1)
+            self._write(number, b"<< /Title %s /Parent %d 0 R /Dest [%d 0 R /Fit]%s >>" % (
+                self._serialize(TextStringObject(title)), outline_number, page_number, links))
+        if count:
+            self._write(outline_number, b"<< /Type /Outlines /First %d 0 R /Last %d 0 R /Count %d >>" % (
+                first_item, first_item + count - 1, count))
+        else:
+            self._write(outline_number, b"<< /Type /Outlines /Count 0 >>")
+        catalog_number = self._reserve()
+        self._write(catalog_number, b"<< /Type /Catalog /Pages %d 0 R /Outlines %d 0 R /PageMode /UseOutlines >>"
+                    % (self.pages_number, outline_number))
+
+        xref_offset = self.f.tell()
+        self.f.write(b"xref\n0 %d\n0000000000 65535 f \n" % len(self.offsets))
+        for offset in self.offsets[1:]:
+            self.f.write(b"%010d 00000 n \n" % offset)
+        self.f.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                     % (len(self.offsets), catalog_number, xref_offset))
+
+
+def merge_invoices(invoice_ids, output_path, renderer, cache=None, progress=None, cancel_event=None):
+    """Write the given invoices into one PDF with a bookmark per invoice_id.
+
+    Each invoice comes from the render cache when possible and is rendered
+    from its recorded data otherwise. Invoices are streamed into the output
+    one at a time (see PdfConcatenator), so memory doesn't grow with the
+    number of invoices. Returns the invoice IDs that could not be included,
+    or None if cancel_event was set (in which case nothing is written).
+    """
+    try:
+        import pypdf  # noqa: F401
+    except ImportError:  # optional, only needed for merged output
+        raise RuntimeError("Merged PDF output requires the pypdf package (pip install pypdf)")
+
+    skipped = []
+    job_dir = tempfile.mkdtemp(prefix="invoice-batch-", dir=get_temp_root())
+    # Write next to the destination and rename so a crash never leaves half a file
+    partial_path = f"{output_path}.partial"
+    try:
+        with open(partial_path, "wb") as f:
+            output = PdfConcatenator(f)
+            for index, invoice_id in enumerate(invoice_ids, start=1):
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
+                pdf_path = _invoice_pdf(invoice_id, renderer, cache, job_dir)
+                if pdf_path is None:
+                    skipped.append(invoice_id)
+                else:
+                    output.append(pdf_path, invoice_id)
+                    os.remove(pdf_path)
+                if progress is not None:
+                    progress(index, len(invoice_ids))
+            output.close()
+        os.replace(partial_path, output_path)
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+    return skipped
+
+
+def _invoice_pdf(invoice_id, renderer, cache, job_dir):
+    """A private copy of the invoice's PDF in job_dir, or None without render data"""
+    content_hash, render_data = InvoiceDB.get_render_data(invoice_id)
+    items = render_data.get("items", ()) if render_data else ()
+    key = renderer.cache_key(render_data["placeholders"], items) if render_data else None
+    pdf_path = os.path.join(job_dir, f"{invoice_id}.pdf")
+    if cache is not None:
+        # Copied rather than read in place, so an eviction mid-export is just a miss
+        for candidate in filter(None, (content_hash, key)):
+            if cache.fetch(candidate, pdf_path):
+                return pdf_path
+    if not render_data:
+        return None
+
+    renderer.render(render_data["placeholders"], pdf_path, items=items)
+    if cache is not None:
+        cache.store(key, pdf_path)
+    return pdf_path
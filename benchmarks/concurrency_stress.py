@@ -0,0 +1,113 @@
+"""Stress clients.json and invoices.db from several processes at once.
+
+Every process adds its own clients and invoices and also bumps one shared
+client and one shared invoice, so a lost update shows up as a missing
+record or a counter below processes * iterations. Runs in a scratch
+directory and exits with status 1 if anything was lost:
+
+    python benchmarks/concurrency_stress.py --processes 8 --iterations 50
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COUNTER_INVOICE = "INV-STRESS-COUNTER"
+
+
+def worker(workdir, worker_no, iterations, counter_client_id):
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    from db import ClientDB, ClientConflictError, InvoiceDB
+
+    conflicts = 0
+    for i in range(iterations):
+        ClientDB.add_client({"name": f"Stress {worker_no}-{i}"})
+        InvoiceDB.save_invoice({
+            "invoice_id": f"INV-STRESS-{worker_no:03d}-{i:05d}",
+            "client_name": f"Stress {worker_no}-{i}",
+            "total_amount": 1.0,
+        })
+        InvoiceDB.run_write(lambda c: c.execute(
+            "UPDATE invoices SET total_amount = total_amount + 1 WHERE invoice_id = ?",
+            (COUNTER_INVOICE,)))
+        # Optimistic read-modify-write, retried until our version wins
+        while True:
+            client = ClientDB.get_client(counter_client_id)
+            try:
+                ClientDB.update_client(counter_client_id, {"phone": str(int(client["phone"]) + 1)},
+                                       client.get("version", 0))
+                break
+            except ClientConflictError:
+                conflicts += 1
+    return conflicts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=25)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory for inspection")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="invoice-stress-")
+    with open(os.path.join(workdir, "app_config.json"), "w") as f:
+        json.dump({"clients_db": os.path.join(workdir, "clients.json"),
+                   "invoices_db": os.path.join(workdir, "invoices.db")}, f)
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    from db import ClientDB, InvoiceDB
+
+    InvoiceDB.initialize()
+    counter_client_id = ClientDB.add_client({"name": "Shared Counter", "phone": "0"})
+    InvoiceDB.save_invoice({"invoice_id": COUNTER_INVOICE, "client_name": "Shared Counter",
+                            "total_amount": 1.0})
+
+    start = time.perf_counter()
+    # spawn so each worker is a fresh interpreter, like a separate workstation
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(args.processes) as pool:
+        conflicts = pool.starmap(worker, [(workdir, n, args.iterations, counter_client_id)
+                                          for n in range(args.processes)])
+    elapsed = time.perf_counter() - start
+
+    expected = args.processes * args.iterations
+    clients = ClientDB.load_clients()
+    stress_clients = sum(1 for client in clients if client["name"].startswith("Stress "))
+    counter_client = ClientDB.get_client(counter_client_id)
+    stress_invoices = InvoiceDB.count_invoices({"client_name": "Stress "})
+    counter_total = InvoiceDB.get_invoice_details(COUNTER_INVOICE)[6]
+
+    checks = [
+        ("clients added", stress_clients, expected),
+        ("client counter", int(counter_client["phone"]), expected),
+        ("client version", counter_client["version"], expected + 1),
+        ("invoices added", stress_invoices, expected),
+        ("invoice counter", int(counter_total) - 1, expected),
+    ]
+    print(json.dumps({
+        "processes": args.processes,
+        "iterations": args.iterations,
+        "seconds": round(elapsed, 2),
+        "version_conflicts_retried": sum(conflicts),
+        "checks": {name: {"got": got, "expected": want} for name, got, want in checks},
+    }, indent=2))
+
+    os.chdir(REPO_DIR)
+    if args.keep:
+        print(f"Scratch directory kept at {workdir}")
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    failed = [name for name, got, want in checks if got != want]
+    if failed:
+        print(f"Lost updates: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Deterministic synthetic clients.json and invoices.db for benchmarks.
+
+The same size and seed always produce byte-identical clients.json and the
+same invoice rows, so timings from different revisions compare like with
+like:
+
+    python benchmarks/datasets.py --size 100k --out /tmp/bench-100k
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Preset name -> (clients, invoices)
+SIZES = {
+    "1k": (1_000, 1_000),
+    "100k": (10_000, 100_000),
+    "1m": (100_000, 1_000_000),
+}
+DEFAULT_SEED = 1234
+BASE_DATE = datetime(2023, 1, 1)
+STATUSES = ("pending", "paid", "overdue")
+PAYMENT_TERMS_DAYS = 30
+INSERT_CHUNK = 10_000
+
+FIRST_NAMES = ("Ana", "Manuel", "Lucía", "Jorge", "Élodie", "Pablo", "Marta", "Øyvind",
+               "Sofía", "David", "Carmen", "Javier", "Noa", "Hugo", "Irene", "Tomás")
+LAST_NAMES = ("Tárraga", "García", "Martínez", "López", "Sánchez", "Pérez", "Gómez",
+              "Fernández", "Ruiz", "Díaz", "Moreno", "Muñoz", "Álvarez", "Romero")
+COMPANY_SUFFIXES = ("", "", "", " S.L.", " S.A.", " & Co", " Studio", " Consulting")
+PAYMENT_METHODS = ("Transfer", "Card", "Cash", "PayPal")
+
+
+def generate_clients(count, seed=DEFAULT_SEED):
+    rng = random.Random(seed)
+    clients = []
+    for n in range(count):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}{rng.choice(COMPANY_SUFFIXES)}"
+        created = BASE_DATE + timedelta(minutes=n)
+        clients.append({
+            "id": f"CLI-{n:07d}",
+            "name": name,
+            "email": f"client{n}@example.com",
+            "phone": f"+34 6{rng.randrange(10**8):08d}",
+            "address": f"Calle {rng.choice(LAST_NAMES)} {rng.randrange(1, 200)}, Madrid",
+            "created_at": created.isoformat(),
+        })
+    return clients
+
+
+def write_clients(path, count, seed=DEFAULT_SEED):
+    clients = generate_clients(count, seed)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(clients, f, indent=2, ensure_ascii=False)
+    return clients
+
+
+def generate_invoice_rows(count, clients, seed=DEFAULT_SEED):
+    """Yield invoice rows in the column order used by write_invoices"""
+    rng = random.Random(seed + 1)
+    for n in range(count):
+        client = clients[rng.randrange(len(clients))]
+        date = BASE_DATE + timedelta(minutes=n * 7 + rng.randrange(7))
+        subtotal = rng.randrange(1_000, 500_000) / 100
+        tax = round(subtotal * 0.21, 2)
+        stamp = date.isoformat()
+        yield (
+            f"INV-{date:%y%m%d}-{n:07d}", client["name"], client["email"], client["phone"],
+            client["address"], round(subtotal + tax, 2), tax, date.strftime("%Y-%m-%d %H:%M"),
+            rng.choice(PAYMENT_METHODS), "Bank", rng.choice(STATUSES), stamp, stamp,
+            (date + timedelta(days=PAYMENT_TERMS_DAYS)).strftime("%Y-%m-%d"), PAYMENT_TERMS_DAYS,
+        )
+
+
+def write_invoices(path, count, clients, seed=DEFAULT_SEED):
+    """Create invoices.db with the app's own schema and fill it in bulk"""
+    if os.path.exists(path):
+        os.remove(path)
+    sys.path.insert(0, REPO_DIR)
+    from config import app_config
+    from db import InvoiceDB
+
+    previous = app_config["invoices_db"]
+    app_config["invoices_db"] = path
+    try:
+        InvoiceDB.initialize()
+    finally:
+        app_config["invoices_db"] = previous
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA synchronous = OFF")
+        rows = generate_invoice_rows(count, clients, seed)
+        while True:
+            chunk = [row for _, row in zip(range(INSERT_CHUNK), rows)]
+            if not chunk:
+                break
+            conn.executemany(
+                """INSERT INTO invoices
+                   (invoice_id, client_name, client_email, client_phone, client_address,
+                    total_amount, tax_amount, invoice_date, payment_method, payment_entity,
+                    status, created_at, updated_at, due_date, payment_terms_days)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                chunk,
+            )
+            conn.commit()
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def build_dataset(out_dir, size, seed=DEFAULT_SEED):
+    """Write clients.json and invoices.db for a SIZES preset into out_dir"""
+    client_count, invoice_count = SIZES[size]
+    os.makedirs(out_dir, exist_ok=True)
+    clients_path = os.path.join(out_dir, "clients.json")
+    invoices_path = os.path.join(out_dir, "invoices.db")
+    clients = write_clients(clients_path, client_count, seed)
+    write_invoices(invoices_path, invoice_count, clients, seed)
+    return clients_path, invoices_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", choices=sorted(SIZES), default="1k")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--out", required=True, help="directory to write the dataset into")
+    args = parser.parse_args()
+    clients_path, invoices_path = build_dataset(args.out, args.size, args.seed)
+    print(f"Wrote {clients_path} and {invoices_path}")
+
+
+if __name__ == "__main__":
+    main()
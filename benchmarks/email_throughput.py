@@ -0,0 +1,92 @@
+"""Measure email delivery throughput against a local aiosmtpd server.
+
+Queues --messages invoices in a scratch database (with a small stand-in
+PDF already in the render cache, so only delivery is timed), drains the
+queue with mailer.EmailWorker and prints messages per second as JSON.
+Needs aiosmtpd (pip install aiosmtpd):
+
+    python benchmarks/email_throughput.py --messages 2000 --batch-size 50
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_PDF = b"%PDF-1.4\n" + b"0" * 30000 + b"\n%%EOF\n"
+
+
+class CountingHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=0, help="messages per second limit (0: none)")
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+
+    try:
+        from aiosmtpd.controller import Controller
+    except ImportError:
+        sys.exit("aiosmtpd is required: pip install aiosmtpd")
+
+    workdir = tempfile.mkdtemp(prefix="invoice-mail-")
+    with open(os.path.join(workdir, "app_config.json"), "w") as f:
+        json.dump({"clients_db": os.path.join(workdir, "clients.json"),
+                   "invoices_db": os.path.join(workdir, "invoices.db"),
+                   "render_cache_dir": os.path.join(workdir, "render_cache"),
+                   "email_enabled": True, "smtp_host": "127.0.0.1", "smtp_port": args.port}, f)
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+    from db import InvoiceDB
+    from mailer import EmailWorker
+
+    InvoiceDB.initialize()
+    worker = EmailWorker(batch_size=args.batch_size, rate_per_s=args.rate)
+    pdf_path = os.path.join(workdir, "invoice.pdf")
+    with open(pdf_path, "wb") as f:
+        f.write(FAKE_PDF)
+    worker.cache.store("0" * 64, pdf_path)
+    InvoiceDB.run_write(lambda c: InvoiceDB.insert_invoices(c, [
+        {"invoice_id": f"INV-MAIL-{n:06d}", "client_name": f"Client {n}",
+         "client_email": f"client{n}@example.com", "total_amount": 100.0, "content_hash": "0" * 64}
+        for n in range(args.messages)]))
+
+    handler = CountingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=args.port)
+    controller.start()
+    try:
+        start = time.perf_counter()
+        totals = worker.run(once=True)
+        elapsed = time.perf_counter() - start
+    finally:
+        controller.stop()
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps({
+        "messages": args.messages,
+        "batch_size": args.batch_size,
+        "rate_limit": args.rate or None,
+        "seconds": round(elapsed, 3),
+        "messages_per_s": round(args.messages / elapsed, 1),
+        "results": totals,
+        "received": handler.received,
+    }, indent=2))
+    if handler.received != args.messages:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
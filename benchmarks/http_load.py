@@ -0,0 +1,162 @@
+"""Load-test the HTTP service and report requests per second.
+
+Opens --concurrency keep-alive connections that each send requests
+back to back for --duration seconds, picking a request from the mix
+below. With --spawn the service is started on a generated dataset in a
+scratch directory; otherwise point --url at a running one:
+
+    python benchmarks/http_load.py --spawn --size 100k --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+import datasets
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (name, weight, method, path, body); create_invoice skips rendering so the
+# numbers measure the service rather than Word
+REQUEST_MIX = [
+    ("list_invoices", 40, "GET", "/invoices?limit=50", None),
+    ("filter_invoices", 20, "GET", "/invoices?status=paid&client_name=garc&limit=50", None),
+    ("search_clients", 20, "GET", "/clients?q=gar&limit=10", None),
+    ("invoice_details", 10, "GET", "/invoices/{invoice_id}", None),
+    ("create_invoice", 10, "POST", "/invoices", {
+        "client": {"name": "Load Test"}, "tax_rate": "21", "render": False,
+        "lines": [{"description": "Service", "quantity": "2", "unit_price": "49.95"}],
+    }),
+]
+
+
+async def request(reader, writer, host, method, path, body):
+    payload = json.dumps(body).encode() if body is not None else b""
+    head = (f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(payload)}\r\n"
+            f"Content-Type: application/json\r\n\r\n")
+    writer.write(head.encode() + payload)
+    await writer.drain()
+    status_line = await reader.readline()
+    status = int(status_line.split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def client_loop(url, deadline, invoice_ids, results):
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port)
+    names = [entry[0] for entry in REQUEST_MIX]
+    weights = [entry[1] for entry in REQUEST_MIX]
+    mix = {entry[0]: entry[2:] for entry in REQUEST_MIX}
+    rng = random.Random()
+    try:
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            method, path, body = mix[name]
+            path = path.format(invoice_id=rng.choice(invoice_ids))
+            start = time.perf_counter()
+            status = await request(reader, writer, parts.hostname, method, path, body)
+            results.append((name, status, (time.perf_counter() - start) * 1000))
+    finally:
+        writer.close()
+
+
+async def run_load(url, concurrency, duration, invoice_ids):
+    results = []
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(url, deadline, invoice_ids, results) for _ in range(concurrency)))
+    return results, time.perf_counter() - start
+
+
+def summarize(results, elapsed):
+    def stats(rows):
+        latencies = sorted(ms for _, _, ms in rows)
+        return {
+            "requests": len(rows),
+            "errors": sum(1 for _, status, _ in rows if status >= 400),
+            "p50_ms": round(statistics.median(latencies), 2) if latencies else None,
+            "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2) if latencies else None,
+        }
+
+    summary = stats(results)
+    summary["seconds"] = round(elapsed, 2)
+    summary["requests_per_second"] = round(len(results) / elapsed, 1)
+    summary["by_request"] = {name: stats([row for row in results if row[0] == name])
+                             for name, *_ in REQUEST_MIX}
+    return summary
+
+
+def wait_for_health(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url + "/health", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Service at {url} did not come up")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--spawn", action="store_true", help="start a service on a generated dataset")
+    parser.add_argument("--size", choices=sorted(datasets.SIZES), default="1k")
+    parser.add_argument("--port", type=int, default=8799, help="port for --spawn")
+    args = parser.parse_args()
+
+    server = workdir = None
+    cwd = os.getcwd()
+    url = args.url.rstrip("/")
+    try:
+        if args.spawn:
+            workdir = tempfile.mkdtemp(prefix="invoice-load-")
+            with open(os.path.join(workdir, "app_config.json"), "w") as f:
+                json.dump({"clients_db": os.path.join(workdir, "clients.json"),
+                           "invoices_db": os.path.join(workdir, "invoices.db")}, f)
+            os.chdir(workdir)
+            datasets.build_dataset(workdir, args.size)
+            url = f"http://127.0.0.1:{args.port}"
+            server = subprocess.Popen(
+                [sys.executable, os.path.join(REPO_DIR, "invoice_maker.py"), "serve",
+                 "--port", str(args.port), "--max-inflight", str(max(64, args.concurrency * 2))],
+                cwd=workdir, stdout=subprocess.DEVNULL)
+        wait_for_health(url)
+        with urllib.request.urlopen(url + "/invoices?limit=200") as response:
+            invoice_ids = [row["invoice_id"] for row in json.load(response)["items"]] or ["missing"]
+
+        results, elapsed = asyncio.run(run_load(url, args.concurrency, args.duration, invoice_ids))
+        summary = summarize(results, elapsed)
+        summary["concurrency"] = args.concurrency
+        print(json.dumps(summary, indent=2))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if workdir is not None:
+            os.chdir(cwd)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
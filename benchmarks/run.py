@@ -0,0 +1,251 @@
+"""Time the data and rendering hot paths against a synthetic dataset.
+
+Runs in a scratch directory with its own app_config.json, so real data is
+never touched. Results are JSON; with --compare the run fails (exit 1)
+when any metric's median is slower than the baseline by more than
+--threshold:
+
+    python benchmarks/run.py --size 100k --output baseline.json
+    python benchmarks/run.py --size 100k --compare baseline.json --threshold 0.2
+
+--gui also times InvoiceViewer's first page, which needs a display (or
+xvfb-run).
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import datasets
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Differences smaller than this are treated as noise when comparing
+NOISE_FLOOR_MS = 0.5
+INVOICE_FILTERS = {
+    "none": {},
+    "client_name": {"client_name": "garc"},
+    "status": {"status": "paid"},
+    "date_range": {"date_from": "2023-02-01", "date_to": "2023-02-28T23:59:59"},
+    "combined": {"client_name": "garc", "status": "paid", "date_from": "2023-02-01"},
+}
+
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(min(timings), 3),
+        "runs": repeat,
+    }
+
+
+def bench_clients(results, repeat):
+    from client_index import ClientIndex
+    from db import ClientDB
+
+    results["clients.load"] = measure(ClientDB.load_clients, repeat)
+    results["clients.search"] = measure(lambda: ClientDB.search_clients("gar"), repeat)
+    clients = ClientDB.load_clients()
+    results["clients.index_build"] = measure(lambda: ClientIndex(clients), repeat)
+    index = ClientIndex(clients)
+    results["clients.index_search"] = measure(lambda: index.search("gar", 8), repeat)
+
+    counter = iter(range(10**9))
+    results["clients.add"] = measure(lambda: ClientDB.add_client({
+        "name": f"Bench Client {next(counter)}", "email": "bench@example.com",
+    }), repeat)
+
+
+def bench_invoices(results, repeat, full_fetch):
+    from db import InvoiceDB
+
+    counter = iter(range(10**9))
+
+    def save():
+        n = next(counter)
+        InvoiceDB.save_invoice({
+            "invoice_id": f"BENCH-{n:07d}", "client_name": "Bench Client",
+            "total_amount": 121.0, "tax_amount": 21.0,
+            "invoice_date": "2024-06-01 10:00", "payment_method": "Card",
+        })
+
+    results["invoices.save"] = measure(save, repeat)
+    for name, filters in INVOICE_FILTERS.items():
+        results[f"invoices.page.{name}"] = measure(
+            lambda: InvoiceDB.get_invoices_page(filters, limit=100), repeat)
+        results[f"invoices.count.{name}"] = measure(
+            lambda: InvoiceDB.count_invoices(filters), repeat)
+        if full_fetch:
+            results[f"invoices.all.{name}"] = measure(
+                lambda: InvoiceDB.get_all_invoices(filters), repeat)
+
+
+def bench_totals(results, repeat):
+    import random
+    from totals import compute_totals_batch
+
+    rng = random.Random(datasets.DEFAULT_SEED)
+    count, per_invoice = 10_000, 5
+    quantities = [rng.randrange(1, 10) for _ in range(count * per_invoice)]
+    prices = [f"{rng.randrange(100, 100_000) / 100:.2f}" for _ in range(count * per_invoice)]
+    offsets = list(range(0, count * per_invoice + 1, per_invoice))
+    rates = ["21"] * count
+    results["totals.batch_10k"] = measure(
+        lambda: compute_totals_batch(quantities, prices, offsets, rates), repeat)
+
+
+def bench_render(results, repeat, workdir):
+    try:
+        from docx import Document
+    except ImportError:
+        print("python-docx is not installed, skipping template benchmarks", file=sys.stderr)
+        return
+    from renderer import InvoiceRenderer
+    from totals import invoice_placeholders
+
+    template_path = os.path.join(workdir, "bench_template.docx")
+    doc = Document()
+    doc.add_paragraph("[invoice_id] [date_time]")
+    doc.add_paragraph("[client_name] [client_email] [client_phone] [client_adress]")
+    table = doc.add_table(rows=2, cols=4)
+    for cell, text in zip(table.rows[0].cells, ("Service", "Qty", "Price", "Total")):
+        cell.text = text
+    for cell, text in zip(table.rows[1].cells, ("[item]", "[item_qty]", "[item_price]", "[item_total]")):
+        cell.text = text
+    doc.add_paragraph("[tax_%] [iva] [total_iva]")
+    doc.save(template_path)
+
+    renderer = InvoiceRenderer(template_path)
+    for item_count in (6, 200):
+        lines = [(f"Service {n}", "2", "49.95") for n in range(item_count)]
+        items, placeholders, _ = invoice_placeholders(lines, "21")
+        placeholders.update({"[invoice_id]": "INV-BENCH", "[date_time]": "2024-06-01 10:00",
+                             "[client_name]": "Bench Client", "[tax_%]": "21"})
+        results[f"render.fill_template.{item_count}_items"] = measure(
+            lambda: renderer.render_docx(placeholders, items=items), repeat)
+
+
+def bench_viewer(results, repeat):
+    import customtkinter as ctk
+    from gui.invoice_viewer import InvoiceViewer
+
+    root = ctk.CTk()
+    root.withdraw()
+
+    def first_page():
+        viewer = InvoiceViewer(root)
+        deadline = time.perf_counter() + 60
+        while 0 not in viewer.pages and time.perf_counter() < deadline:
+            root.update()
+            time.sleep(0.001)
+        viewer.destroy()
+
+    results["viewer.first_page"] = measure(first_page, repeat)
+    root.destroy()
+
+
+def compare(results, baseline, threshold):
+    """Print a comparison table and return the names of regressed metrics"""
+    regressions = []
+    for name, metric in sorted(results["metrics"].items()):
+        base = baseline["metrics"].get(name)
+        if base is None:
+            print(f"  {name:<36}{metric['median_ms']:>11.3f} ms  (new)")
+            continue
+        ratio = metric["median_ms"] / base["median_ms"] if base["median_ms"] else 1.0
+        regressed = (ratio > 1 + threshold
+                     and metric["median_ms"] - base["median_ms"] > NOISE_FLOOR_MS)
+        flag = "  REGRESSION" if regressed else ""
+        print(f"  {name:<36}{metric['median_ms']:>11.3f} ms  {ratio:6.2f}x{flag}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", choices=sorted(datasets.SIZES), default="1k")
+    parser.add_argument("--seed", type=int, default=datasets.DEFAULT_SEED)
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per metric")
+    parser.add_argument("--data-dir", help="reuse a dataset from benchmarks/datasets.py instead of generating one")
+    parser.add_argument("--full-fetch", action="store_true",
+                        help="also time get_all_invoices without a LIMIT for every filter")
+    parser.add_argument("--gui", action="store_true", help="also time the invoice viewer (needs a display)")
+    parser.add_argument("--output", help="write results JSON here instead of stdout")
+    parser.add_argument("--compare", help="baseline results JSON to check against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed slowdown as a fraction of the baseline median")
+    args = parser.parse_args()
+    # The benchmarks run from a scratch directory; user paths stay relative to where we started
+    for name in ("data_dir", "output", "compare"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="invoice-bench-")
+    try:
+        if args.data_dir:
+            for name in ("clients.json", "invoices.db"):
+                shutil.copy(os.path.join(args.data_dir, name), workdir)
+        with open(os.path.join(workdir, "app_config.json"), "w") as f:
+            json.dump({"clients_db": os.path.join(workdir, "clients.json"),
+                       "invoices_db": os.path.join(workdir, "invoices.db"),
+                       "render_cache_dir": os.path.join(workdir, "render_cache")}, f)
+        os.chdir(workdir)
+        sys.path.insert(0, REPO_DIR)
+        if not args.data_dir:
+            datasets.build_dataset(workdir, args.size, args.seed)
+
+        metrics = {}
+        bench_clients(metrics, args.repeat)
+        bench_invoices(metrics, args.repeat, args.full_fetch)
+        bench_totals(metrics, args.repeat)
+        bench_render(metrics, args.repeat, workdir)
+        if args.gui:
+            bench_viewer(metrics, min(args.repeat, 5))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "meta": {
+            "size": args.data_dir or args.size,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "metrics": metrics,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    elif not args.compare:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("size") != results["meta"]["size"]:
+            print(f"Warning: baseline size {baseline['meta'].get('size')} "
+                  f"differs from {results['meta']['size']}", file=sys.stderr)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}: "
+                  f"{', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
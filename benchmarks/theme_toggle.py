@@ -0,0 +1,150 @@
+"""Measure InvoiceApp.toggle_theme latency on a fully built main window.
+
+Needs customtkinter and a display; without DISPLAY it starts a virtual
+one through pyvirtualdisplay (pip install pyvirtualdisplay, plus the
+Xvfb package). Runs in a scratch directory with a copy of
+app_config.json so the real config and data files are left alone.
+
+    python benchmarks/theme_toggle.py --runs 30 --rows 20
+    python benchmarks/theme_toggle.py --against HEAD~1     before/after in one run
+
+--against checks the given revision out into a temporary git worktree
+and times both trees, each in its own process.
+"""
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=30, help="number of toggles to time")
+    parser.add_argument("--rows", type=int, default=20, help="service rows to fill before timing")
+    parser.add_argument("--repo", default=REPO_DIR, help="source tree to time (default: this one)")
+    parser.add_argument("--against", metavar="REV", help="also time this git revision and compare")
+    args = parser.parse_args()
+    args.repo = os.path.abspath(args.repo)
+
+    display = _ensure_display()
+    try:
+        if args.against:
+            result = _compare(args)
+        else:
+            result = measure(args.repo, args.runs, args.rows)
+    finally:
+        if display is not None:
+            display.stop()
+    print(json.dumps(result, indent=2))
+
+
+def _ensure_display():
+    """A virtual display when there is no real one; None if one is already there"""
+    if os.environ.get("DISPLAY") or sys.platform in ("win32", "darwin"):
+        return None
+    try:
+        from pyvirtualdisplay import Display
+        return Display(visible=False, size=(1600, 1000)).start()
+    except Exception as e:  # optional, only needed on headless machines
+        raise SystemExit(f"No display: set DISPLAY or install pyvirtualdisplay and Xvfb ({e})")
+
+
+def _compare(args):
+    """Time args.against in a temporary worktree, then args.repo; one process each"""
+    worktree = tempfile.mkdtemp(prefix="theme-bench-rev-")
+    subprocess.run(["git", "-C", args.repo, "worktree", "add", "--detach", worktree, args.against],
+                   check=True, stdout=subprocess.DEVNULL)
+    try:
+        before = _measure_in_child(worktree, args)
+        after = _measure_in_child(args.repo, args)
+    finally:
+        subprocess.run(["git", "-C", args.repo, "worktree", "remove", "--force", worktree], check=False)
+        shutil.rmtree(worktree, ignore_errors=True)
+    return {
+        "before": dict(before, revision=args.against),
+        "after": after,
+        "p50_speedup": round(before["p50_ms"] / after["p50_ms"], 2) if after["p50_ms"] else None,
+    }
+
+
+def _measure_in_child(repo, args):
+    # Both trees define the same modules, so they can't share an interpreter
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--repo", repo,
+                             "--runs", str(args.runs), "--rows", str(args.rows)],
+                            check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output)
+
+
+def measure(repo, runs, rows):
+    workdir = tempfile.mkdtemp(prefix="theme-bench-")
+    config_path = os.path.join(repo, "app_config.json")
+    if os.path.exists(config_path):
+        shutil.copy(config_path, workdir)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    sys.path.insert(0, repo)
+    try:
+        from db import InvoiceDB
+        from gui import InvoiceApp
+
+        # The app logs with print(); keep stdout for the JSON result
+        with contextlib.redirect_stdout(sys.stderr):
+            InvoiceDB.initialize()
+            _allow_zoomed()
+            app = InvoiceApp()
+            app.update()
+            # Filling the last row adds another, so this builds a realistic form
+            for i in range(rows):
+                app.services[-1]["desc"].set(f"Service {i}")
+            app.update()
+
+            timings = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                app.toggle_theme()
+                app.update_idletasks()
+                timings.append((time.perf_counter() - start) * 1000)
+            widget_count = _count_widgets(app)
+            app.destroy()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    timings.sort()
+    return {
+        "widgets": widget_count,
+        "runs": runs,
+        "mean_ms": round(statistics.mean(timings), 2),
+        "p50_ms": round(timings[len(timings) // 2], 2),
+        "p95_ms": round(timings[max(int(len(timings) * 0.95) - 1, 0)], 2),
+    }
+
+
+def _allow_zoomed():
+    """The window opens with state('zoomed'), which X11 Tk rejects; use normal there"""
+    if sys.platform == "win32":
+        return
+    import tkinter
+
+    wm_state = tkinter.Wm.wm_state
+
+    def state(self, newstate=None):
+        return wm_state(self, "normal" if newstate == "zoomed" else newstate)
+
+    tkinter.Wm.wm_state = tkinter.Wm.state = state
+
+
+def _count_widgets(widget):
+    return 1 + sum(_count_widgets(child) for child in widget.winfo_children())
+
+
+if __name__ == "__main__":
+    main()
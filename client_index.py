@@ -0,0 +1,79 @@
+import bisect
+import unicodedata
+
+
+def normalize(text):
+    """Lowercase and strip accents so "tarr" matches "Tárraga" """
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+class ClientIndex:
+    """Sorted prefix index over clients for type-ahead lookups.
+
+    Every client contributes one key per word of its name (so "tarr" finds
+    "Manuel Tárraga") plus its ID. Keys live in a sorted list, so a search is
+    a bisection followed by a scan of at most the matching range, and a
+    single add or remove doesn't require rebuilding the index.
+    """
+
+    def __init__(self, clients=()):
+        self._keys = []
+        self._clients = {}
+        self._keys_by_id = {}
+        entries = []
+        for client in clients:
+            self._clients[client["id"]] = client
+            keys = self._client_keys(client)
+            self._keys_by_id[client["id"]] = keys
+            entries.extend(keys)
+        self._keys = sorted(entries)
+
+    def __len__(self):
+        return len(self._clients)
+
+    def get(self, client_id):
+        return self._clients.get(client_id)
+
+    def add(self, client):
+        if client["id"] in self._clients:
+            self.remove(client["id"])
+        keys = self._client_keys(client)
+        for key in keys:
+            bisect.insort(self._keys, key)
+        self._clients[client["id"]] = client
+        self._keys_by_id[client["id"]] = keys
+
+    def remove(self, client_id):
+        self._clients.pop(client_id, None)
+        for key in self._keys_by_id.pop(client_id, []):
+            index = bisect.bisect_left(self._keys, key)
+            if index < len(self._keys) and self._keys[index] == key:
+                del self._keys[index]
+
+    def search(self, query, limit=10):
+        """Return up to limit clients with a name word or ID starting with query"""
+        prefix = normalize(query).strip()
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        index = bisect.bisect_left(self._keys, (prefix,))
+        while index < len(self._keys) and len(results) < limit:
+            token, _, client_id = self._keys[index]
+            if not token.startswith(prefix):
+                break
+            if client_id not in seen:
+                seen.add(client_id)
+                results.append(self._clients[client_id])
+            index += 1
+        return results
+
+    @staticmethod
+    def _client_keys(client):
+        name = normalize(client["name"])
+        words = name.split()
+        # Suffixes starting at each word let multi-word queries match too
+        tokens = {" ".join(words[i:]) for i in range(len(words))}
+        tokens.add(normalize(client["id"]))
+        return [(token, name, client["id"]) for token in tokens]
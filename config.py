@@ -1,10 +1,48 @@
+import copy
 import json
+import os
+import tempfile
+import threading
+import time
+from collections.abc import MutableMapping
 
 # ============= DEFAULT CONFIGURATION =============
 DEFAULT_CONFIG = {
     "template_path": "invoice_template.docx",
     "clients_db": "clients.json",
     "invoices_db": "invoices.db",
+    "db_journal_mode": "WAL",
+    "render_cache_dir": "render_cache",
+    "render_cache_max_mb": 500,
+    "tracing_enabled": False,
+    "trace_file": "trace.jsonl",
+    "trace_max_mb": 5,
+    "service_token": "",
+    "query_stats_enabled": False,
+    "slow_query_ms": 100,
+    "query_stats_file": "query_stats.json",
+    "slow_query_log": "slow_queries.jsonl",
+    "recurring_auto_run": True,
+    "payment_terms_days": 30,
+    "email_enabled": False,
+    "email_from": "",
+    "email_subject": "Invoice {invoice_id} from {business_name}",
+    "email_body": "Dear {client_name},\n\nPlease find attached invoice {invoice_id} for {total}.\n\n{business_name}",
+    "email_rate_per_minute": 60,
+    "email_max_attempts": 5,
+    "maintenance_enabled": True,
+    "maintenance_idle_s": 30,
+    "integrity_check_hours": 24,
+    "backup_dir": "backups",
+    "backup_keep_recent": 24,
+    "backup_keep_daily": 14,
+    "backup_compress_level": 1,
+    "smtp_host": "localhost",
+    "smtp_port": 25,
+    "smtp_username": "",
+    "smtp_password": "",
+    "smtp_starttls": False,
+    "smtp_ssl": False,
     "business_info": {
         "name": "Your Business Name",
         "email": "business@example.com",
@@ -34,29 +72,184 @@ DEFAULT_CONFIG = {
 }
 
 CONFIG_FILE = "app_config.json"
+# Minimum seconds between checks of the config file's mtime
+CHECK_INTERVAL = 1.0
+
+
+def merge_config(defaults, overrides):
+    """Return defaults with overrides applied, recursing into nested sections"""
+    merged = copy.deepcopy(defaults)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_config(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def diff_config(defaults, config):
+    """Return the parts of config that differ from defaults; the inverse of merge_config"""
+    overrides = {}
+    for key, value in config.items():
+        default = defaults.get(key)
+        if isinstance(value, dict) and isinstance(default, dict):
+            nested = diff_config(default, value)
+            if nested:
+                overrides[key] = nested
+        elif key not in defaults or value != default:
+            overrides[key] = copy.deepcopy(value)
+    return overrides
+
+
+class ConfigStore(MutableMapping):
+    """Shared, in-memory view of app_config.json merged over DEFAULT_CONFIG.
+
+    Every window reads the same store. Writes go to a temp file that
+    replaces the config atomically, so an interrupted save can't leave a
+    truncated file behind. The file's mtime is checked at most every
+    CHECK_INTERVAL seconds and the store reloads itself when it changes on
+    disk; a file that can't be parsed keeps the last good values instead
+    of falling back to the defaults.
+    """
+
+    def __init__(self, path=CONFIG_FILE, defaults=DEFAULT_CONFIG):
+        self.path = path
+        self.defaults = defaults
+        self._lock = threading.RLock()
+        self._data = None
+        self._stamp = None
+        self._checked_at = 0.0
+        self._typed = {}
+        # Bumped on every reload or save so windows can tell their copy is stale
+        self.version = 0
+        self._load()
+
+    def __getitem__(self, key):
+        return self._current()[key]
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            self._current()[key] = value
+            self._typed.clear()
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._current()[key]
+            self._typed.clear()
+
+    def __iter__(self):
+        return iter(list(self._current()))
+
+    def __len__(self):
+        return len(self._current())
+
+    def get_str(self, key, default=""):
+        return self._get_typed(key, str, default)
+
+    def get_int(self, key, default=0):
+        return self._get_typed(key, int, default)
+
+    def get_float(self, key, default=0.0):
+        return self._get_typed(key, float, default)
+
+    def snapshot(self):
+        """Deep copy for editing without touching the shared config"""
+        with self._lock:
+            return copy.deepcopy(self._current())
+
+    def reload_if_changed(self, force=False):
+        """Re-read the file if its mtime or size changed; returns True if it did"""
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._checked_at < CHECK_INTERVAL:
+                return False
+            self._checked_at = now
+            if self._file_stamp() == self._stamp:
+                return False
+            self._load()
+        return True
+
+    def save(self, config=None):
+        """Atomically write the non-default settings, replacing the config with config if given"""
+        with self._lock:
+            if config is not None and config is not self:
+                self._data = merge_config(self.defaults, config)
+                self._typed.clear()
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(prefix=".app_config-", suffix=".tmp", dir=directory)
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(diff_config(self.defaults, self._data), f, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self._stamp = self._file_stamp()
+            self._checked_at = time.monotonic()
+            self.version += 1
+
+    def _current(self):
+        self.reload_if_changed()
+        return self._data
+
+    def _get_typed(self, key, cast, default):
+        with self._lock:
+            data = self._current()
+            cache_key = (key, cast)
+            if cache_key not in self._typed:
+                try:
+                    self._typed[cache_key] = cast(data[key])
+                except (KeyError, TypeError, ValueError):
+                    self._typed[cache_key] = default
+            return self._typed[cache_key]
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        stamp = self._file_stamp()
+        try:
+            with open(self.path, "r") as f:
+                overrides = json.load(f)
+            if not isinstance(overrides, dict):
+                raise ValueError("config root must be an object")
+        except FileNotFoundError:
+            overrides = {}
+        except (OSError, ValueError) as e:
+            # json.JSONDecodeError is a ValueError; a half-written or broken
+            # file must not wipe the settings that are already loaded
+            print(f"Error reading {self.path}: {str(e)}")
+            if self._data is not None:
+                self._stamp = stamp
+                return
+            overrides = {}
+        data = merge_config(self.defaults, overrides)
+        # Set default theme_mode if not present; it is written out with the
+        # next save rather than at load time
+        data.setdefault("theme_mode", "light")
+        self._data = data
+        self._stamp = stamp
+        self._typed.clear()
+        self.version += 1
 
 
 class ConfigHandler:
     @staticmethod
     def load_config():
-        try:
-            with open(CONFIG_FILE, "r") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            with open(CONFIG_FILE, "w") as f:
-                json.dump(DEFAULT_CONFIG, f, indent=2)
-            return DEFAULT_CONFIG
+        app_config.reload_if_changed(force=True)
+        return app_config
 
     @staticmethod
     def save_config(config):
-        with open(CONFIG_FILE, "w") as f:
-            json.dump(config, f, indent=2)
-
+        app_config.save(config)
 
-# Load configuration and ensure theme_mode is set
-app_config = ConfigHandler.load_config()
 
-# Set default theme_mode if not present
-if "theme_mode" not in app_config:
-    app_config["theme_mode"] = "light"
-    ConfigHandler.save_config(app_config)
+# Shared by every module; see ConfigStore
+app_config = ConfigStore()
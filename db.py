@@ -1,10 +1,28 @@
 import json
 import os
+import queue
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 import random
 import string
+import tempfile
+import time
 from config import app_config
+from file_lock import FileLock, replace_file
+from events import bus, CLIENT, INVOICE, RECURRING, CREATED, UPDATED, DELETED
+from tracing import traced
+from query_stats import InstrumentedConnection, query_log
+
+
+# Seconds to wait for another process to finish writing clients.json
+CLIENTS_LOCK_TIMEOUT = 10.0
+# Seconds SQLite waits on a locked database before giving up on a statement
+BUSY_TIMEOUT_S = 5.0
+# Extra attempts for write transactions that still find the database busy
+WRITE_RETRIES = 5
+WRITE_RETRY_DELAY_S = 0.05
+JOURNAL_MODES = ("WAL", "DELETE", "TRUNCATE", "PERSIST")
+CADENCES = ("weekly", "monthly", "quarterly", "yearly")
 
 
 def generate_id(prefix="INV"):
@@ -13,51 +31,28 @@ def generate_id(prefix="INV"):
     return f"{prefix}-{date_str}-{random_str}"
 
 
+class ClientConflictError(ValueError):
+    """The client was changed by another window or process since it was loaded"""
+
+
 class ClientDB:
+    """clients.json store that is safe to share between processes.
+
+    Writers hold an advisory lock on clients.json.lock for the whole
+    read-modify-write and replace the file atomically, so readers never
+    need the lock. Each client carries a version that update_client and
+    delete_client can check to refuse edits based on stale data.
+    """
+
+    # What was done about an unreadable clients.json, for the GUI to show
+    repairs = queue.Queue()
+
     @staticmethod
-    def load_clients():
-        try:
-            with open(app_config["clients_db"], "r", encoding="utf-8") as f:
-                try:
-                    clients = json.load(f)
-                    if not isinstance(clients, list):
-                        clients = []
-                except json.JSONDecodeError:
-                    clients = []
-
-                # Validate and ensure all clients have required fields
-                validated_clients = []
-                for client in clients:
-                    if (
-                        isinstance(client, dict)
-                        and client.get("id")
-                        and client.get("name")
-                    ):
-                        # Ensure all required fields exist
-                        client.setdefault("email", "")
-                        client.setdefault("phone", "")
-                        client.setdefault("address", "")
-                        client.setdefault("created_at", datetime.now().isoformat())
-                        validated_clients.append(client)
-                return validated_clients
-        except FileNotFoundError:
-            # Create the file if it doesn't exist
-            with open(app_config["clients_db"], "w", encoding="utf-8") as f:
-                json.dump([], f, indent=2)
-            return []
-        except json.JSONDecodeError:
-            # Backup corrupted file and create new one
-            backup_name = (
-                f"clients_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            )
-            os.rename(app_config["clients_db"], backup_name)
-            with open(app_config["clients_db"], "w", encoding="utf-8") as f:
-                json.dump([], f, indent=2)
-            return []
+    def _lock():
+        return FileLock(app_config["clients_db"], CLIENTS_LOCK_TIMEOUT)
 
     @staticmethod
-    def save_clients(clients):
-        # Validate clients before saving
+    def _validate(clients):
         validated_clients = []
         for client in clients:
             if isinstance(client, dict) and client.get("id") and client.get("name"):
@@ -67,39 +62,121 @@ class ClientDB:
                 client.setdefault("address", "")
                 client.setdefault("created_at", datetime.now().isoformat())
                 validated_clients.append(client)
+        return validated_clients
+
+    @staticmethod
+    def _read_clients():
+        # Raises FileNotFoundError or json.JSONDecodeError for the caller to handle
+        with open(app_config["clients_db"], "r", encoding="utf-8") as f:
+            clients = json.load(f)
+        if not isinstance(clients, list):
+            clients = []
+        return ClientDB._validate(clients)
 
+    @staticmethod
+    def _write_clients(clients):
+        # Caller holds the lock
+        path = app_config["clients_db"]
+        directory = os.path.dirname(os.path.abspath(path))
         try:
-            with open(app_config["clients_db"], "w", encoding="utf-8") as f:
-                json.dump(validated_clients, f, indent=2, ensure_ascii=False)
+            fd, tmp_path = tempfile.mkstemp(prefix=".clients-", suffix=".tmp", dir=directory)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(ClientDB._validate(clients), f, indent=2, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                replace_file(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
         except Exception as e:
             raise ValueError(f"Failed to save clients: {str(e)}")
 
+    @staticmethod
+    def _read_or_repair():
+        # Caller holds the lock
+        try:
+            return ClientDB._read_clients()
+        except FileNotFoundError:
+            # Create the file if it doesn't exist
+            ClientDB._write_clients([])
+            return []
+        except json.JSONDecodeError:
+            # Keep the damaged file with the backups and start again from the newest snapshot
+            from backup import keep_damaged_file, latest_clients  # backup imports this module
+            damaged = keep_damaged_file(app_config["clients_db"])
+            restored = latest_clients()
+            name, clients = restored if restored else (None, [])
+            message = (f"clients.json could not be read and was moved to {damaged}.\n"
+                       + (f"{len(clients)} clients were restored from backup snapshot {name}; "
+                          "changes made after that snapshot are missing." if name else
+                          "No backup snapshot had a readable copy, so the client list starts empty."))
+            ClientDB.repairs.put(message)
+            ClientDB._write_clients(clients)
+            return ClientDB._validate(clients)
+
+    @staticmethod
+    def _modify(change):
+        """Apply change(clients) to the current file contents under the lock"""
+        with ClientDB._lock():
+            clients = ClientDB._read_or_repair()
+            result = change(clients)
+            ClientDB._write_clients(clients)
+        return result
+
+    @staticmethod
+    @traced("db.clients.load_clients")
+    def load_clients():
+        try:
+            return ClientDB._read_clients()
+        except (FileNotFoundError, json.JSONDecodeError):
+            # Another process may have repaired it while we waited for the lock
+            with ClientDB._lock():
+                return ClientDB._read_or_repair()
+
+    @staticmethod
+    @traced("db.clients.save_clients")
+    def save_clients(clients):
+        """Replace the whole client list; prefer add/update/delete_client, which merge"""
+        with ClientDB._lock():
+            ClientDB._write_clients(clients)
+
+    @staticmethod
+    def _check_version(client, expected_version):
+        if expected_version is not None and client.get("version", 0) != expected_version:
+            raise ClientConflictError(
+                f"Client {client['id']} was changed elsewhere since it was loaded"
+            )
+
     @staticmethod
     def add_client(client_data):
         if not client_data.get("name"):
             raise ValueError("Client name is required")
-        clients = ClientDB.load_clients()
         client_data["id"] = generate_id("CLT")
         client_data["created_at"] = datetime.now().isoformat()
-        clients.append(client_data)
-        ClientDB.save_clients(clients)
+        client_data["version"] = 1
+        ClientDB._modify(lambda clients: clients.append(client_data))
+        bus.publish(CLIENT, CREATED, [client_data["id"]], [dict(client_data)])
         return client_data["id"]
 
     @staticmethod
-    def update_client(client_id, new_data):
-        clients = ClientDB.load_clients()
-        updated = False
-        for client in clients:
-            if client["id"] == client_id:
-                client.update(new_data)
-                client["updated_at"] = datetime.now().isoformat()
-                updated = True
-                break
-        if not updated:
+    def update_client(client_id, new_data, expected_version=None):
+        """Update a client; with expected_version, fail if it changed since it was read"""
+        def change(clients):
+            for client in clients:
+                if client["id"] == client_id:
+                    ClientDB._check_version(client, expected_version)
+                    client.update(new_data)
+                    client["updated_at"] = datetime.now().isoformat()
+                    client["version"] = client.get("version", 0) + 1
+                    return dict(client)
             raise ValueError(f"Client with ID {client_id} not found")
-        ClientDB.save_clients(clients)
+
+        updated = ClientDB._modify(change)
+        bus.publish(CLIENT, UPDATED, [client_id], [updated])
 
     @staticmethod
+    @traced("db.clients.search_clients")
     def search_clients(query):
         clients = ClientDB.load_clients()
         query = query.lower()
@@ -121,20 +198,110 @@ class ClientDB:
         return None
 
     @staticmethod
-    def delete_client(client_id):
-        clients = ClientDB.load_clients()
-        initial_length = len(clients)
-        clients = [client for client in clients if client["id"] != client_id]
-        if len(clients) == initial_length:
+    def delete_client(client_id, expected_version=None):
+        def change(clients):
+            for index, client in enumerate(clients):
+                if client["id"] == client_id:
+                    ClientDB._check_version(client, expected_version)
+                    del clients[index]
+                    return
             raise ValueError(f"Client with ID {client_id} not found")
-        ClientDB.save_clients(clients)
+
+        ClientDB._modify(change)
+        bus.publish(CLIENT, DELETED, [client_id])
+
+
+# Columns the invoice list may be ordered by
+SORTABLE_COLUMNS = (
+    "invoice_id",
+    "client_name",
+    "invoice_date",
+    "total_amount",
+    "tax_amount",
+    "payment_method",
+    "status",
+)
+
+# Columns added after the original schema, as (name, declaration)
+INVOICE_MIGRATIONS = [
+    ("content_hash", "TEXT"),
+    ("render_data", "TEXT"),
+    ("delivery_status", "TEXT"),
+    ("due_date", "TEXT"),
+    ("payment_terms_days", "INTEGER"),
+]
+
+INVOICE_STATUSES = ("pending", "paid", "overdue")
+# Invoices still waiting for payment. Queries repeat this exact condition
+# so SQLite can use the partial index built on it.
+UNPAID_CONDITION = "status IN ('pending', 'overdue')"
+# Job units still to finish, repeated verbatim for the partial index
+OPEN_UNIT_CONDITION = "state IN ('pending', 'rendered')"
+# Days past the due date; "current" is not due yet
+AGING_BUCKETS = ("current", "0-30", "31-60", "60+")
+
+
+def due_date_for(invoice_date, terms_days):
+    """ISO due date terms_days after an invoice date like "2026-10-19 14:30" """
+    try:
+        issued = datetime.strptime(str(invoice_date)[:10], "%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"Invalid invoice date: {invoice_date!r}")
+    return (issued + timedelta(days=int(terms_days))).strftime("%Y-%m-%d")
+
+# Database files already set up by this process
+_initialized_paths = set()
 
 
 class InvoiceDB:
+    @staticmethod
+    def connect(**kwargs):
+        """Open the invoices database, instrumented when query stats are enabled"""
+        if query_log.enabled:
+            kwargs.setdefault("factory", InstrumentedConnection)
+        # Wait for other writers instead of failing with "database is locked"
+        kwargs.setdefault("timeout", BUSY_TIMEOUT_S)
+        return sqlite3.connect(app_config["invoices_db"], **kwargs)
+
+    @staticmethod
+    def run_write(work):
+        """Run work(cursor) in one write transaction and return its result.
+
+        The write lock is taken up front (BEGIN IMMEDIATE) so the busy
+        timeout applies; if the database is still busy after that, the
+        whole transaction is retried a bounded number of times.
+        """
+        for attempt in range(WRITE_RETRIES + 1):
+            conn = InvoiceDB.connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                result = work(conn.cursor())
+                conn.commit()
+                return result
+            except sqlite3.OperationalError as e:
+                message = str(e)
+                if ("locked" not in message and "busy" not in message) or attempt == WRITE_RETRIES:
+                    raise
+            finally:
+                # Closing without a commit rolls the transaction back
+                conn.close()
+            time.sleep(WRITE_RETRY_DELAY_S * 2 ** attempt * random.uniform(0.5, 1.5))
+
     @staticmethod
     def initialize():
-        conn = sqlite3.connect(app_config["invoices_db"])
+        """Create or migrate the invoice tables; runs once per database file"""
+        if app_config["invoices_db"] in _initialized_paths:
+            return
+        conn = InvoiceDB.connect()
         c = conn.cursor()
+        # Only takes effect on a new file; maintenance.py converts existing ones
+        c.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # WAL lets readers carry on while another process writes; it needs
+        # all users on one machine, so shares over a network should use DELETE
+        journal_mode = app_config.get_str("db_journal_mode", "WAL").upper()
+        if journal_mode not in JOURNAL_MODES:
+            raise ValueError(f"Unsupported db_journal_mode {journal_mode!r}")
+        c.execute(f"PRAGMA journal_mode = {journal_mode}")
         c.execute(
             """CREATE TABLE IF NOT EXISTS invoices
                      (id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -152,27 +319,141 @@ class InvoiceDB:
                       created_at TEXT,
                       updated_at TEXT)"""
         )
+        c.execute("PRAGMA table_info(invoices)")
+        columns = {row[1] for row in c.fetchall()}
+        for column, declaration in INVOICE_MIGRATIONS:
+            if column not in columns:
+                c.execute(f"ALTER TABLE invoices ADD COLUMN {column} {declaration}")
+        if "due_date" not in columns:
+            # Existing invoices get the default terms counted from their invoice date
+            terms = app_config.get_int("payment_terms_days", 30)
+            c.execute(
+                """UPDATE invoices SET payment_terms_days = ?,
+                          due_date = date(substr(invoice_date, 1, 10), '+' || ? || ' days')""",
+                (terms, terms),
+            )
+        # Back the viewer's default sort and its filters
+        c.execute("CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices (invoice_date)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_invoices_client ON invoices (client_name)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_invoices_status ON invoices (status)")
+        # Serves the overdue sweep and the aging report; paid invoices stay out of it
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_invoices_unpaid_due ON invoices (due_date) "
+                  f"WHERE {UNPAID_CONDITION}")
+        c.execute(
+            """CREATE TABLE IF NOT EXISTS recurring_invoices
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      client_id TEXT NOT NULL,
+                      lines TEXT NOT NULL,
+                      tax_rate TEXT NOT NULL,
+                      payment TEXT,
+                      cadence TEXT NOT NULL,
+                      anchor_day INTEGER NOT NULL,
+                      next_run TEXT NOT NULL,
+                      active INTEGER DEFAULT 1,
+                      created_at TEXT,
+                      updated_at TEXT)"""
+        )
+        # The scheduler's only query: active definitions due by a date
+        c.execute("CREATE INDEX IF NOT EXISTS idx_recurring_due ON recurring_invoices (next_run) "
+                  "WHERE active = 1")
+        c.execute(
+            """CREATE TABLE IF NOT EXISTS email_queue
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      invoice_id TEXT NOT NULL,
+                      recipient TEXT NOT NULL,
+                      status TEXT DEFAULT 'queued',
+                      attempts INTEGER DEFAULT 0,
+                      next_attempt_at TEXT,
+                      last_error TEXT,
+                      created_at TEXT,
+                      updated_at TEXT,
+                      sent_at TEXT)"""
+        )
+        # The delivery worker only ever looks for queued mail that is ready
+        c.execute("CREATE INDEX IF NOT EXISTS idx_email_queue_ready ON email_queue (next_attempt_at) "
+                  "WHERE status = 'queued'")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_email_queue_invoice ON email_queue (invoice_id)")
+        c.execute(
+            """CREATE TABLE IF NOT EXISTS jobs
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      kind TEXT NOT NULL,
+                      params TEXT,
+                      status TEXT DEFAULT 'pending',
+                      total INTEGER DEFAULT 0,
+                      created_at TEXT,
+                      updated_at TEXT)"""
+        )
+        c.execute(
+            """CREATE TABLE IF NOT EXISTS job_units
+                     (job_id INTEGER NOT NULL,
+                      seq INTEGER NOT NULL,
+                      unit_key TEXT NOT NULL,
+                      payload TEXT,
+                      state TEXT DEFAULT 'pending',
+                      content_hash TEXT,
+                      error TEXT,
+                      updated_at TEXT,
+                      PRIMARY KEY (job_id, seq))"""
+        )
+        # Resuming walks only the unfinished units, in order
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_job_units_open ON job_units (job_id, seq) "
+                  f"WHERE {OPEN_UNIT_CONDITION}")
+        c.execute(
+            """CREATE TABLE IF NOT EXISTS maintenance_runs
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      task TEXT NOT NULL,
+                      started_at TEXT NOT NULL,
+                      duration_ms REAL,
+                      ok INTEGER DEFAULT 1,
+                      result TEXT)"""
+        )
+        c.execute("CREATE INDEX IF NOT EXISTS idx_maintenance_task ON maintenance_runs (task, started_at)")
         conn.commit()
         conn.close()
+        _initialized_paths.add(app_config["invoices_db"])
 
     @staticmethod
+    @traced("db.invoices.save_invoice")
     def save_invoice(invoice_data):
         required_fields = ["invoice_id", "client_name", "total_amount"]
         for field in required_fields:
             if not invoice_data.get(field):
                 raise ValueError(f"{field} is required")
 
-        conn = sqlite3.connect(app_config["invoices_db"])
+        invoice_data["created_at"] = datetime.now().isoformat()
+        invoice_data["updated_at"] = invoice_data["created_at"]
+
         try:
-            c = conn.cursor()
-            invoice_data["created_at"] = datetime.now().isoformat()
-            invoice_data["updated_at"] = invoice_data["created_at"]
+            InvoiceDB.run_write(lambda c: InvoiceDB.insert_invoices(c, [invoice_data]))
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Invoice ID {invoice_data['invoice_id']} already exists")
+        bus.publish(INVOICE, CREATED, [invoice_data["invoice_id"]])
+
+    @staticmethod
+    def insert_invoices(c, invoices, skip_existing=False):
+        """Insert prepared invoices inside the caller's transaction.
+
+        With skip_existing, invoice IDs already in the table are left alone
+        instead of raising IntegrityError. When email delivery is enabled,
+        invoices with a client email are queued for sending in the same
+        transaction. Returns the inserted invoice IDs.
+        """
+        verb = "INSERT OR IGNORE" if skip_existing else "INSERT"
+        email_enabled = app_config.get("email_enabled", False)
+        default_terms = app_config.get_int("payment_terms_days", 30)
+        inserted = []
+        for invoice_data in invoices:
+            created_at = invoice_data.get("created_at") or datetime.now().isoformat()
+            invoice_date = invoice_data.get("invoice_date", datetime.now().isoformat())
+            terms = invoice_data.get("payment_terms_days")
+            terms = default_terms if terms in (None, "") else int(terms)
             c.execute(
-                """INSERT INTO invoices 
+                f"""{verb} INTO invoices 
                          (invoice_id, client_name, client_email, client_phone, client_address,
                           total_amount, tax_amount, invoice_date, payment_method, payment_entity,
-                          status, created_at, updated_at)
-                         VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)""",
+                          status, created_at, updated_at, content_hash, render_data,
+                          due_date, payment_terms_days)
+                         VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)""",
                 (
                     invoice_data["invoice_id"],
                     invoice_data["client_name"],
@@ -181,57 +462,136 @@ class InvoiceDB:
                     invoice_data.get("client_address", ""),
                     invoice_data["total_amount"],
                     invoice_data.get("tax_amount", 0.0),
-                    invoice_data.get("invoice_date", datetime.now().isoformat()),
+                    invoice_date,
                     invoice_data.get("payment_method", ""),
                     invoice_data.get("payment_entity", ""),
                     invoice_data.get("status", "pending"),
-                    invoice_data["created_at"],
-                    invoice_data["updated_at"],
+                    created_at,
+                    invoice_data.get("updated_at") or created_at,
+                    invoice_data.get("content_hash"),
+                    json.dumps(invoice_data["render_data"], ensure_ascii=False)
+                    if invoice_data.get("render_data") else None,
+                    invoice_data.get("due_date") or due_date_for(invoice_date, terms),
+                    terms,
                 ),
             )
-            conn.commit()
-        except sqlite3.IntegrityError:
-            raise ValueError(f"Invoice ID {invoice_data['invoice_id']} already exists")
-        finally:
-            conn.close()
+            if c.rowcount > 0:
+                inserted.append(invoice_data["invoice_id"])
+                if email_enabled and invoice_data.get("client_email"):
+                    EmailQueue.enqueue(c, invoice_data["invoice_id"], invoice_data["client_email"])
+        return inserted
+
+    @staticmethod
+    def _filter_clause(filters):
+        """Build the WHERE clause and parameters for the invoice list filters"""
+        conditions = []
+        params = []
+        if filters:
+            if filters.get("client_name"):
+                conditions.append("client_name LIKE ?")
+                params.append(f"%{filters['client_name']}%")
+            if filters.get("status"):
+                conditions.append("status = ?")
+                params.append(filters["status"])
+            if filters.get("date_from"):
+                conditions.append("invoice_date >= ?")
+                params.append(filters["date_from"])
+            if filters.get("date_to"):
+                conditions.append("invoice_date <= ?")
+                params.append(filters["date_to"])
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return where, params
+
+    @staticmethod
+    def _order_clause(order_by):
+        """Validate an ORDER BY spec like "client_name ASC, invoice_date DESC" """
+        terms = []
+        for term in order_by.split(","):
+            parts = term.split()
+            if (
+                not parts
+                or len(parts) > 2
+                or parts[0] not in SORTABLE_COLUMNS
+                or (len(parts) == 2 and parts[1].upper() not in ("ASC", "DESC"))
+            ):
+                raise ValueError(f"Invalid sort order: {order_by}")
+            terms.append(" ".join([parts[0]] + [p.upper() for p in parts[1:]]))
+        return ", ".join(terms)
 
     @staticmethod
     def get_all_invoices(filters=None, order_by="invoice_date DESC"):
-        conn = sqlite3.connect(app_config["invoices_db"])
+        return InvoiceDB.get_invoices_page(filters, order_by)
+
+    @staticmethod
+    @traced("db.invoices.get_invoices_page")
+    def get_invoices_page(filters=None, order_by="invoice_date DESC", limit=None, offset=0, conn=None):
+        order = InvoiceDB._order_clause(order_by)
+        own_conn = conn is None
+        if own_conn:
+            conn = InvoiceDB.connect()
         try:
             c = conn.cursor()
             query = """SELECT invoice_id, client_name, invoice_date, 
                        total_amount, tax_amount, payment_method, status 
                        FROM invoices"""
-            params = []
-
-            if filters:
-                conditions = []
-                if filters.get("client_name"):
-                    conditions.append("client_name LIKE ?")
-                    params.append(f"%{filters['client_name']}%")
-                if filters.get("status"):
-                    conditions.append("status = ?")
-                    params.append(filters["status"])
-                if filters.get("date_from"):
-                    conditions.append("invoice_date >= ?")
-                    params.append(filters["date_from"])
-                if filters.get("date_to"):
-                    conditions.append("invoice_date <= ?")
-                    params.append(filters["date_to"])
-                if conditions:
-                    query += " WHERE " + " AND ".join(conditions)
-
-            query += f" ORDER BY {order_by}"
+            where, params = InvoiceDB._filter_clause(filters)
+            query += where
+            # id breaks ties so consecutive pages never overlap
+            query += f" ORDER BY {order}, id"
+            if limit is not None:
+                query += " LIMIT ? OFFSET ?"
+                params += [limit, offset]
             c.execute(query, params)
             invoices = c.fetchall()
             return invoices
         finally:
-            conn.close()
+            if own_conn:
+                conn.close()
+
+    @staticmethod
+    @traced("db.invoices.count_invoices")
+    def count_invoices(filters=None, conn=None):
+        own_conn = conn is None
+        if own_conn:
+            conn = InvoiceDB.connect()
+        try:
+            c = conn.cursor()
+            where, params = InvoiceDB._filter_clause(filters)
+            c.execute("SELECT COUNT(*) FROM invoices" + where, params)
+            return c.fetchone()[0]
+        finally:
+            if own_conn:
+                conn.close()
 
     @staticmethod
+    @traced("db.invoices.get_invoices_by_ids")
+    def get_invoices_by_ids(invoice_ids, order_by=None, conn=None):
+        """Return list rows (same columns as get_all_invoices) for the given IDs, in order_by order"""
+        invoice_ids = list(invoice_ids)
+        if not invoice_ids:
+            return []
+        own_conn = conn is None
+        if own_conn:
+            conn = InvoiceDB.connect()
+        try:
+            c = conn.cursor()
+            # One JSON parameter instead of one per ID, so large selections stay
+            # under SQLite's bound-variable limit
+            query = """SELECT invoice_id, client_name, invoice_date, 
+                       total_amount, tax_amount, payment_method, status 
+                       FROM invoices WHERE invoice_id IN (SELECT value FROM json_each(?))"""
+            if order_by:
+                query += f" ORDER BY {InvoiceDB._order_clause(order_by)}, id"
+            c.execute(query, (json.dumps(invoice_ids),))
+            return c.fetchall()
+        finally:
+            if own_conn:
+                conn.close()
+
+    @staticmethod
+    @traced("db.invoices.get_invoice_details")
     def get_invoice_details(invoice_id):
-        conn = sqlite3.connect(app_config["invoices_db"])
+        conn = InvoiceDB.connect()
         try:
             c = conn.cursor()
             c.execute("""SELECT * FROM invoices WHERE invoice_id = ?""", (invoice_id,))
@@ -243,10 +603,143 @@ class InvoiceDB:
             conn.close()
 
     @staticmethod
-    def update_invoice_status(invoice_id, status):
-        conn = sqlite3.connect(app_config["invoices_db"])
+    def get_render_data(invoice_id):
+        """Return (content_hash, render_data) recorded when the invoice was rendered"""
+        conn = InvoiceDB.connect()
         try:
             c = conn.cursor()
+            c.execute(
+                "SELECT content_hash, render_data FROM invoices WHERE invoice_id = ?",
+                (invoice_id,),
+            )
+            row = c.fetchone()
+            if not row:
+                raise ValueError(f"Invoice with ID {invoice_id} not found")
+            content_hash, render_data = row
+            return content_hash, json.loads(render_data) if render_data else None
+        finally:
+            conn.close()
+
+    @staticmethod
+    @traced("db.invoices.mark_overdue")
+    def mark_overdue(as_of=None):
+        """Move pending invoices due before as_of (default today) to overdue; returns their IDs"""
+        as_of = as_of or datetime.now().strftime("%Y-%m-%d")
+        where = f"{UNPAID_CONDITION} AND status = 'pending' AND due_date < ?"
+
+        def sweep(c):
+            c.execute(f"SELECT invoice_id FROM invoices WHERE {where}", (as_of,))
+            invoice_ids = [row[0] for row in c.fetchall()]
+            if invoice_ids:
+                c.execute(f"UPDATE invoices SET status = 'overdue', updated_at = ? WHERE {where}",
+                          (datetime.now().isoformat(), as_of))
+            return invoice_ids
+
+        invoice_ids = InvoiceDB.run_write(sweep)
+        if invoice_ids:
+            bus.publish(INVOICE, UPDATED, invoice_ids)
+        return invoice_ids
+
+    @staticmethod
+    def get_unpaid_invoices(conn=None):
+        """(invoice_id, client_name, total_amount, invoice_date, due_date) of every unpaid invoice"""
+        own_conn = conn is None
+        if own_conn:
+            conn = InvoiceDB.connect()
+        try:
+            c = conn.cursor()
+            c.execute(f"""SELECT invoice_id, client_name, total_amount, invoice_date, due_date
+                          FROM invoices WHERE {UNPAID_CONDITION}""")
+            return c.fetchall()
+        finally:
+            if own_conn:
+                conn.close()
+
+    @staticmethod
+    @traced("db.invoices.mark_paid")
+    def mark_paid(invoice_ids):
+        """Mark unpaid invoices paid in one UPDATE; returns the IDs that changed"""
+        invoice_ids = list(dict.fromkeys(invoice_ids))
+        if not invoice_ids:
+            return []
+
+        def update(c):
+            # A temp table keeps this one statement however many IDs there are
+            c.execute("CREATE TEMP TABLE IF NOT EXISTS paid_ids (invoice_id TEXT PRIMARY KEY)")
+            c.execute("DELETE FROM temp.paid_ids")
+            c.executemany("INSERT OR IGNORE INTO temp.paid_ids VALUES (?)", [(i,) for i in invoice_ids])
+            where = f"{UNPAID_CONDITION} AND invoice_id IN (SELECT invoice_id FROM temp.paid_ids)"
+            c.execute(f"SELECT invoice_id FROM invoices WHERE {where}")
+            changed = [row[0] for row in c.fetchall()]
+            c.execute(f"UPDATE invoices SET status = 'paid', updated_at = ? WHERE {where}",
+                      (datetime.now().isoformat(),))
+            return changed
+
+        changed = InvoiceDB.run_write(update)
+        if changed:
+            bus.publish(INVOICE, UPDATED, changed)
+        return changed
+
+    @staticmethod
+    @traced("db.invoices.get_aging_report")
+    def get_aging_report(as_of=None, conn=None):
+        """Return (bucket, count, amount) for unpaid invoices, in AGING_BUCKETS order"""
+        as_of = as_of or datetime.now().strftime("%Y-%m-%d")
+        own_conn = conn is None
+        if own_conn:
+            conn = InvoiceDB.connect()
+        try:
+            c = conn.cursor()
+            c.execute(
+                f"""SELECT CASE
+                           WHEN due_date >= :as_of THEN 'current'
+                           WHEN julianday(:as_of) - julianday(due_date) <= 30 THEN '0-30'
+                           WHEN julianday(:as_of) - julianday(due_date) <= 60 THEN '31-60'
+                           ELSE '60+' END AS bucket,
+                           COUNT(*), COALESCE(SUM(total_amount), 0)
+                    FROM invoices
+                    WHERE {UNPAID_CONDITION} AND due_date IS NOT NULL
+                    GROUP BY bucket""",
+                {"as_of": as_of},
+            )
+            totals = {bucket: (count, amount) for bucket, count, amount in c.fetchall()}
+            return [(bucket,) + totals.get(bucket, (0, 0.0)) for bucket in AGING_BUCKETS]
+        finally:
+            if own_conn:
+                conn.close()
+
+    @staticmethod
+    def get_invoice_ids():
+        """Set of every invoice_id, read straight from the unique index"""
+        conn = InvoiceDB.connect()
+        try:
+            return {row[0] for row in conn.execute("SELECT invoice_id FROM invoices")}
+        finally:
+            conn.close()
+
+    @staticmethod
+    def get_render_data_batch(invoice_ids):
+        """{invoice_id: (content_hash, render_data)} for the invoices that exist"""
+        invoice_ids = list(invoice_ids)
+        if not invoice_ids:
+            return {}
+        conn = InvoiceDB.connect()
+        try:
+            c = conn.cursor()
+            placeholders = ",".join("?" * len(invoice_ids))
+            c.execute(
+                f"SELECT invoice_id, content_hash, render_data FROM invoices WHERE invoice_id IN ({placeholders})",
+                invoice_ids,
+            )
+            return {invoice_id: (content_hash, json.loads(render_data) if render_data else None)
+                    for invoice_id, content_hash, render_data in c.fetchall()}
+        finally:
+            conn.close()
+
+    @staticmethod
+    @traced("db.invoices.update_invoice_status")
+    def update_invoice_status(invoice_id, status):
+        def update(c):
             c.execute(
                 """UPDATE invoices 
                          SET status = ?, updated_at = ? 
@@ -255,22 +748,369 @@ class InvoiceDB:
             )
             if c.rowcount == 0:
                 raise ValueError(f"Invoice with ID {invoice_id} not found")
-            conn.commit()
-        finally:
-            conn.close()
+
+        InvoiceDB.run_write(update)
+        bus.publish(INVOICE, UPDATED, [invoice_id])
 
     @staticmethod
+    @traced("db.invoices.delete_invoice")
     def delete_invoice(invoice_id):
-        conn = sqlite3.connect(app_config["invoices_db"])
+        def delete(c):
+            c.execute("DELETE FROM invoices WHERE invoice_id = ?", (invoice_id,))
+            if c.rowcount == 0:
+                raise ValueError(f"Invoice with ID {invoice_id} not found")
+
+        InvoiceDB.run_write(delete)
+        bus.publish(INVOICE, DELETED, [invoice_id])
+
+
+
+class RecurringDB:
+    """Recurring invoice definitions, stored next to the invoices.
+
+    lines holds (description, quantity, unit_price) rows and payment the
+    GUI's payment fields; both are JSON. next_run is the ISO date of the
+    next period to bill and anchor_day the day of month monthly cadences
+    return to after a short month.
+    """
+
+    COLUMNS = ("id", "client_id", "lines", "tax_rate", "payment", "cadence",
+               "anchor_day", "next_run", "active", "created_at", "updated_at")
+
+    @staticmethod
+    def _row_to_definition(row):
+        definition = dict(zip(RecurringDB.COLUMNS, row))
+        definition["lines"] = [tuple(line) for line in json.loads(definition["lines"])]
+        definition["payment"] = json.loads(definition["payment"]) if definition["payment"] else {}
+        definition["active"] = bool(definition["active"])
+        return definition
+
+    @staticmethod
+    def _validate(client_id, lines, cadence, next_run):
+        if not client_id:
+            raise ValueError("client_id is required")
+        if not lines:
+            raise ValueError("At least one line item is required")
+        if cadence not in CADENCES:
+            raise ValueError(f"cadence must be one of {', '.join(CADENCES)}")
+        try:
+            return datetime.strptime(next_run, "%Y-%m-%d")
+        except (TypeError, ValueError):
+            raise ValueError("next_run must be a YYYY-MM-DD date")
+
+    @staticmethod
+    def add_definition(client_id, lines, tax_rate, cadence, next_run, payment=None):
+        first_run = RecurringDB._validate(client_id, lines, cadence, next_run)
+        now = datetime.now().isoformat()
+
+        def insert(c):
+            c.execute(
+                """INSERT INTO recurring_invoices
+                         (client_id, lines, tax_rate, payment, cadence, anchor_day,
+                          next_run, active, created_at, updated_at)
+                         VALUES (?,?,?,?,?,?,?,1,?,?)""",
+                (client_id, json.dumps([list(line) for line in lines], ensure_ascii=False),
+                 str(tax_rate), json.dumps(payment or {}, ensure_ascii=False), cadence,
+                 first_run.day, next_run, now, now),
+            )
+            return c.lastrowid
+
+        definition_id = InvoiceDB.run_write(insert)
+        bus.publish(RECURRING, CREATED, [definition_id])
+        return definition_id
+
+    @staticmethod
+    def get_definitions(include_inactive=True):
+        conn = InvoiceDB.connect()
         try:
             c = conn.cursor()
-            c.execute("DELETE FROM invoices WHERE invoice_id = ?", (invoice_id,))
+            query = f"SELECT {', '.join(RecurringDB.COLUMNS)} FROM recurring_invoices"
+            if not include_inactive:
+                query += " WHERE active = 1"
+            c.execute(query + " ORDER BY next_run, id")
+            return [RecurringDB._row_to_definition(row) for row in c.fetchall()]
+        finally:
+            conn.close()
+
+    @staticmethod
+    def get_due(c, as_of):
+        """Active definitions with next_run on or before as_of (a YYYY-MM-DD string)"""
+        c.execute(
+            f"""SELECT {', '.join(RecurringDB.COLUMNS)} FROM recurring_invoices
+                WHERE active = 1 AND next_run <= ? ORDER BY next_run, id""",
+            (as_of,),
+        )
+        return [RecurringDB._row_to_definition(row) for row in c.fetchall()]
+
+    @staticmethod
+    def set_active(definition_id, active):
+        def update(c):
+            c.execute(
+                "UPDATE recurring_invoices SET active = ?, updated_at = ? WHERE id = ?",
+                (1 if active else 0, datetime.now().isoformat(), definition_id),
+            )
+            if c.rowcount == 0:
+                raise ValueError(f"Recurring invoice {definition_id} not found")
+
+        InvoiceDB.run_write(update)
+        bus.publish(RECURRING, UPDATED, [definition_id])
+
+    @staticmethod
+    def delete_definition(definition_id):
+        def delete(c):
+            c.execute("DELETE FROM recurring_invoices WHERE id = ?", (definition_id,))
             if c.rowcount == 0:
+                raise ValueError(f"Recurring invoice {definition_id} not found")
+
+        InvoiceDB.run_write(delete)
+        bus.publish(RECURRING, DELETED, [definition_id])
+
+
+class EmailQueue:
+    """Outbound invoice emails, drained by mailer.EmailWorker.
+
+    A row moves queued -> sending -> sent, or back to queued with a later
+    next_attempt_at after a temporary failure, or to failed. The invoice's
+    delivery_status mirrors its latest email.
+    """
+
+    @staticmethod
+    def enqueue(c, invoice_id, recipient):
+        """Queue an email inside the caller's transaction"""
+        now = datetime.now().isoformat()
+        c.execute(
+            """INSERT INTO email_queue (invoice_id, recipient, status, next_attempt_at, created_at, updated_at)
+                     VALUES (?,?,'queued',?,?,?)""",
+            (invoice_id, recipient, now, now, now),
+        )
+        c.execute("UPDATE invoices SET delivery_status = 'queued' WHERE invoice_id = ?", (invoice_id,))
+
+    @staticmethod
+    def send_invoice(invoice_id, recipient=None):
+        """Queue (or re-queue) an invoice for delivery, by default to its client email"""
+        def queue(c):
+            c.execute("SELECT client_email FROM invoices WHERE invoice_id = ?", (invoice_id,))
+            row = c.fetchone()
+            if not row:
                 raise ValueError(f"Invoice with ID {invoice_id} not found")
-            conn.commit()
+            address = recipient or row[0]
+            if not address:
+                raise ValueError(f"Invoice {invoice_id} has no client email")
+            EmailQueue.enqueue(c, invoice_id, address)
+
+        InvoiceDB.run_write(queue)
+        bus.publish(INVOICE, UPDATED, [invoice_id])
+
+    @staticmethod
+    def claim(limit, stale_after_s=600):
+        """Mark up to limit ready emails as sending and return them with their invoice data.
+
+        Rows left in sending by a worker that died more than stale_after_s
+        ago are put back in the queue first.
+        """
+        now = datetime.now()
+
+        def claim_rows(c):
+            stale = (now - timedelta(seconds=stale_after_s)).isoformat()
+            c.execute("UPDATE email_queue SET status = 'queued' WHERE status = 'sending' AND updated_at < ?",
+                      (stale,))
+            c.execute(
+                """SELECT q.id, q.invoice_id, q.recipient, q.attempts, i.client_name, i.total_amount,
+                          i.invoice_date, i.content_hash, i.render_data
+                   FROM email_queue q JOIN invoices i ON i.invoice_id = q.invoice_id
+                   WHERE q.status = 'queued' AND q.next_attempt_at <= ?
+                   ORDER BY q.next_attempt_at, q.id LIMIT ?""",
+                (now.isoformat(), limit),
+            )
+            rows = c.fetchall()
+            if rows:
+                c.execute(
+                    f"""UPDATE email_queue SET status = 'sending', updated_at = ?
+                        WHERE id IN ({",".join("?" * len(rows))})""",
+                    [now.isoformat()] + [row[0] for row in rows],
+                )
+            return rows
+
+        columns = ("id", "invoice_id", "recipient", "attempts", "client_name", "total_amount",
+                   "invoice_date", "content_hash", "render_data")
+        emails = []
+        for row in InvoiceDB.run_write(claim_rows):
+            email = dict(zip(columns, row))
+            email["render_data"] = json.loads(email["render_data"]) if email["render_data"] else None
+            emails.append(email)
+        return emails
+
+    @staticmethod
+    def record_results(results):
+        """Store a batch of (email_id, invoice_id, status, next_attempt_at, error) in one transaction"""
+        now = datetime.now().isoformat()
+
+        def record(c):
+            for email_id, invoice_id, status, next_attempt_at, error in results:
+                c.execute(
+                    """UPDATE email_queue
+                       SET status = ?, attempts = attempts + 1, next_attempt_at = ?, last_error = ?,
+                           updated_at = ?, sent_at = CASE WHEN ? = 'sent' THEN ? ELSE sent_at END
+                       WHERE id = ?""",
+                    (status, next_attempt_at, error, now, status, now, email_id),
+                )
+                c.execute("UPDATE invoices SET delivery_status = ? WHERE invoice_id = ?",
+                          ("retrying" if status == "queued" else status, invoice_id))
+
+        if results:
+            InvoiceDB.run_write(record)
+            bus.publish(INVOICE, UPDATED, sorted({result[1] for result in results}))
+
+    @staticmethod
+    def get_counts():
+        """Number of emails per status"""
+        conn = InvoiceDB.connect()
+        try:
+            c = conn.cursor()
+            c.execute("SELECT status, COUNT(*) FROM email_queue GROUP BY status")
+            return dict(c.fetchall())
         finally:
             conn.close()
 
 
-# Initialize the invoice database
-InvoiceDB.initialize()
+class JobDB:
+    """Journal of long batch jobs and the state of each of their units.
+
+    A unit goes pending -> rendered -> saved, or to failed with its error.
+    Callers commit unit states together with the work they describe, so
+    after a crash a job can resume from its first unfinished unit.
+    """
+
+    UNIT_COLUMNS = ("seq", "unit_key", "payload", "state", "content_hash", "error")
+
+    @staticmethod
+    def create_job(kind, params, units):
+        """Record a job and its (unit_key, payload) units in one transaction; returns the job ID"""
+        now = datetime.now().isoformat()
+
+        def create(c):
+            c.execute("INSERT INTO jobs (kind, params, status, created_at, updated_at) VALUES (?,?,'pending',?,?)",
+                      (kind, json.dumps(params or {}, ensure_ascii=False), now, now))
+            job_id = c.lastrowid
+            c.executemany(
+                "INSERT INTO job_units (job_id, seq, unit_key, payload, updated_at) VALUES (?,?,?,?,?)",
+                ((job_id, seq, key, json.dumps(payload, ensure_ascii=False) if payload is not None else None, now)
+                 for seq, (key, payload) in enumerate(units, start=1)),
+            )
+            c.execute("UPDATE jobs SET total = (SELECT COUNT(*) FROM job_units WHERE job_id = ?) WHERE id = ?",
+                      (job_id, job_id))
+            return job_id
+
+        return InvoiceDB.run_write(create)
+
+    @staticmethod
+    def get_job(job_id):
+        """The job as a dict, with unit counts per state under "states" """
+        conn = InvoiceDB.connect()
+        try:
+            c = conn.cursor()
+            c.execute("SELECT id, kind, params, status, total, created_at, updated_at FROM jobs WHERE id = ?",
+                      (job_id,))
+            row = c.fetchone()
+            if not row:
+                raise ValueError(f"Job {job_id} not found")
+            job = dict(zip(("id", "kind", "params", "status", "total", "created_at", "updated_at"), row))
+            job["params"] = json.loads(job["params"]) if job["params"] else {}
+            c.execute("SELECT state, COUNT(*) FROM job_units WHERE job_id = ? GROUP BY state", (job_id,))
+            job["states"] = dict(c.fetchall())
+            return job
+        finally:
+            conn.close()
+
+    @staticmethod
+    def list_jobs(limit=20):
+        conn = InvoiceDB.connect()
+        try:
+            c = conn.cursor()
+            c.execute("SELECT id, kind, status, total, created_at, updated_at FROM jobs ORDER BY id DESC LIMIT ?",
+                      (limit,))
+            return c.fetchall()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def next_units(job_id, after_seq, limit):
+        """Up to limit unfinished units after after_seq, as dicts"""
+        conn = InvoiceDB.connect()
+        try:
+            c = conn.cursor()
+            c.execute(
+                f"""SELECT {', '.join(JobDB.UNIT_COLUMNS)} FROM job_units
+                    WHERE job_id = ? AND {OPEN_UNIT_CONDITION} AND seq > ?
+                    ORDER BY seq LIMIT ?""",
+                (job_id, after_seq, limit),
+            )
+            units = []
+            for row in c.fetchall():
+                unit = dict(zip(JobDB.UNIT_COLUMNS, row))
+                unit["payload"] = json.loads(unit["payload"]) if unit["payload"] else None
+                units.append(unit)
+            return units
+        finally:
+            conn.close()
+
+    @staticmethod
+    def update_units(c, job_id, updates):
+        """Store (seq, state, content_hash, error) updates inside the caller's transaction"""
+        now = datetime.now().isoformat()
+        c.executemany(
+            """UPDATE job_units SET state = ?, content_hash = COALESCE(?, content_hash), error = ?, updated_at = ?
+               WHERE job_id = ? AND seq = ?""",
+            [(state, content_hash, error, now, job_id, seq) for seq, state, content_hash, error in updates],
+        )
+        c.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (now, job_id))
+
+    @staticmethod
+    def record_units(job_id, updates):
+        if updates:
+            InvoiceDB.run_write(lambda c: JobDB.update_units(c, job_id, updates))
+
+    @staticmethod
+    def set_status(job_id, status):
+        InvoiceDB.run_write(lambda c: c.execute(
+            "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+            (status, datetime.now().isoformat(), job_id)))
+
+    @staticmethod
+    def retry_failed(job_id):
+        """Put failed units back to pending; returns how many"""
+        return InvoiceDB.run_write(lambda c: c.execute(
+            "UPDATE job_units SET state = 'pending', error = NULL WHERE job_id = ? AND state = 'failed'",
+            (job_id,)).rowcount)
+
+
+class MaintenanceLog:
+    """Results and timings of database maintenance tasks"""
+
+    @staticmethod
+    def record(task, started_at, duration_ms, ok, result):
+        InvoiceDB.run_write(lambda c: c.execute(
+            "INSERT INTO maintenance_runs (task, started_at, duration_ms, ok, result) VALUES (?, ?, ?, ?, ?)",
+            (task, started_at, round(duration_ms, 1), 1 if ok else 0, result)))
+
+    @staticmethod
+    def last_run(task):
+        """started_at of the task's latest run as a datetime, or None"""
+        conn = InvoiceDB.connect()
+        try:
+            row = conn.execute("SELECT MAX(started_at) FROM maintenance_runs WHERE task = ?", (task,)).fetchone()
+        finally:
+            conn.close()
+        return datetime.fromisoformat(row[0]) if row[0] else None
+
+    @staticmethod
+    def history(limit=20):
+        conn = InvoiceDB.connect()
+        try:
+            return conn.execute(
+                """SELECT task, started_at, duration_ms, ok, result FROM maintenance_runs
+                         ORDER BY id DESC LIMIT ?""",
+                (limit,),
+            ).fetchall()
+        finally:
+            conn.close()
@@ -0,0 +1,53 @@
+import threading
+from collections import namedtuple
+
+# Entities
+CLIENT = "client"
+INVOICE = "invoice"
+RECURRING = "recurring"
+
+# Actions
+CREATED = "created"
+UPDATED = "updated"
+DELETED = "deleted"
+
+# ids holds client IDs, invoice_id values or recurring definition IDs, depending on the entity;
+# records, when the publisher has them, holds the saved data for each ID in the same order
+ChangeEvent = namedtuple("ChangeEvent", ["entity", "action", "ids", "records"], defaults=(None,))
+
+
+class EventBus:
+    """Minimal publish/subscribe hub for data change notifications.
+
+    Callbacks run synchronously on the publishing thread, which may be a
+    worker thread; GUI code should subscribe through gui.event_listener.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, entity, callback):
+        with self._lock:
+            self._subscribers.setdefault(entity, []).append(callback)
+        return callback
+
+    def unsubscribe(self, entity, callback):
+        with self._lock:
+            callbacks = self._subscribers.get(entity, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def publish(self, entity, action, ids, records=None):
+        event = ChangeEvent(entity, action, tuple(ids), tuple(records) if records is not None else None)
+        with self._lock:
+            callbacks = list(self._subscribers.get(entity, []))
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Error handling {entity} {action} event: {str(e)}")
+        return event
+
+
+bus = EventBus()
@@ -0,0 +1,79 @@
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+POLL_INTERVAL = 0.05
+
+
+class LockTimeout(Exception):
+    pass
+
+
+class FileLock:
+    """Exclusive advisory lock on "<path>.lock", shared between processes.
+
+    Uses flock on POSIX and msvcrt.locking on Windows. The lock is held by
+    an open file handle, so it is released by the OS if the process dies.
+    Not re-entrant: don't take the same lock twice in one thread.
+    """
+
+    def __init__(self, path, timeout=10.0):
+        self.lock_path = path + ".lock"
+        self.timeout = timeout
+        self._file = None
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        lock_file = open(self.lock_path, "a+b")
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    lock_file.close()
+                    raise LockTimeout(f"Timed out waiting for {self.lock_path}")
+                time.sleep(POLL_INTERVAL)
+        self._file = lock_file
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+def replace_file(source, target, attempts=20):
+    """os.replace, retried while Windows reports the target as in use"""
+    for attempt in range(attempts):
+        try:
+            os.replace(source, target)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(POLL_INTERVAL)
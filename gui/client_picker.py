@@ -0,0 +1,132 @@
+import customtkinter as ctk
+import tkinter as tk
+
+MAX_MATCHES = 8
+
+
+class ClientPicker(ctk.CTkFrame):
+    """Entry with a type-ahead dropdown of matching clients.
+
+    Matches come from a ClientIndex, so each keystroke costs a prefix lookup
+    for at most MAX_MATCHES clients no matter how large the client book is.
+    The dropdown is a single Listbox that is refilled, never rebuilt.
+    """
+
+    def __init__(self, parent, command=None, width=220, **kwargs):
+        super().__init__(parent, fg_color="transparent", **kwargs)
+        self.command = command
+        self.index = None
+        self.matches = []
+        self.selected_id = None
+        self._suppress_trace = False
+        self._hide_job = None
+
+        self.query_var = ctk.StringVar()
+        self.entry = ctk.CTkEntry(self, textvariable=self.query_var, width=width)
+        self.entry.pack(fill="x")
+        self.query_var.trace_add("write", self.on_query_changed)
+        self.entry.bind("<Down>", lambda e: self.move_highlight(1))
+        self.entry.bind("<Up>", lambda e: self.move_highlight(-1))
+        self.entry.bind("<Return>", lambda e: self.choose_highlighted())
+        self.entry.bind("<Escape>", lambda e: self.hide_popup())
+        self.entry.bind("<FocusOut>", self.on_focus_out)
+
+        self.popup = tk.Toplevel(self)
+        self.popup.wm_overrideredirect(True)
+        self.popup.withdraw()
+        self.listbox = tk.Listbox(self.popup, height=MAX_MATCHES, activestyle="none",
+                                  exportselection=False, font=('Inter', 12), width=0,
+                                  borderwidth=0, highlightthickness=1)
+        self.listbox.pack(fill="both", expand=True)
+        self.listbox.bind("<ButtonRelease-1>", self.on_listbox_click)
+
+    def set_index(self, index):
+        self.index = index
+        if self.query_var.get() and self.selected_id is None:
+            self.on_query_changed()
+
+    def set_colors(self, background, text, highlight):
+        self.listbox.configure(bg=background, fg=text, selectbackground=highlight,
+                               selectforeground="white", highlightcolor=highlight)
+
+    def set_text(self, text):
+        self._suppress_trace = True
+        self.query_var.set(text)
+        self._suppress_trace = False
+
+    def select(self, client_id, notify=True):
+        client = self.index.get(client_id) if self.index else None
+        if client is None:
+            return
+        self.selected_id = client_id
+        self.set_text(f"{client['name']} ({client['id']})")
+        self.hide_popup()
+        if notify and self.command:
+            self.command(client_id)
+
+    def clear(self):
+        self.selected_id = None
+        self.set_text("")
+        self.hide_popup()
+
+    def on_query_changed(self, *args):
+        if self._suppress_trace:
+            return
+        # Typing invalidates the previous selection until a match is chosen
+        self.selected_id = None
+        query = self.query_var.get()
+        self.matches = self.index.search(query, MAX_MATCHES) if self.index else []
+        self.listbox.delete(0, tk.END)
+        for client in self.matches:
+            self.listbox.insert(tk.END, f"{client['name']} ({client['id']})")
+        if self.matches:
+            self.listbox.selection_set(0)
+            self.show_popup()
+        else:
+            self.hide_popup()
+
+    def show_popup(self):
+        self.listbox.configure(height=len(self.matches))
+        self.update_idletasks()
+        x = self.entry.winfo_rootx()
+        y = self.entry.winfo_rooty() + self.entry.winfo_height()
+        self.popup.geometry(f"+{x}+{y}")
+        self.popup.deiconify()
+        self.popup.lift()
+        self.popup.attributes("-topmost", True)
+
+    def hide_popup(self):
+        self.popup.withdraw()
+
+    def move_highlight(self, step):
+        if not self.matches:
+            return "break"
+        current = self.listbox.curselection()
+        index = (current[0] if current else -1) + step
+        index = max(0, min(index, len(self.matches) - 1))
+        self.listbox.selection_clear(0, tk.END)
+        self.listbox.selection_set(index)
+        self.listbox.see(index)
+        return "break"
+
+    def choose_highlighted(self):
+        current = self.listbox.curselection()
+        if self.matches and current:
+            self.select(self.matches[current[0]]["id"])
+        return "break"
+
+    def on_listbox_click(self, event):
+        if self._hide_job is not None:
+            self.after_cancel(self._hide_job)
+            self._hide_job = None
+        index = self.listbox.nearest(event.y)
+        if 0 <= index < len(self.matches):
+            self.select(self.matches[index]["id"])
+
+    def on_focus_out(self, event):
+        # Delay so a click on the dropdown is handled before it disappears
+        self._hide_job = self.after(150, self._hide_after_focus_out)
+
+    def _hide_after_focus_out(self):
+        self._hide_job = None
+        self.hide_popup()
@@ -0,0 +1,80 @@
+import customtkinter as ctk
+from config import app_config
+from tracing import tracer, HISTOGRAM_BOUNDS_MS
+from .theme import setup_theme
+
+REFRESH_INTERVAL_MS = 1000
+BARS = " ▁▂▃▄▅▆▇█"
+
+
+def histogram_bar(counts):
+    """One block character per bucket, scaled to the fullest bucket"""
+    peak = max(counts) or 1
+    return "".join(BARS[0 if not count else max(1, round(count / peak * (len(BARS) - 1)))]
+                   for count in counts)
+
+
+class DiagnosticsWindow(ctk.CTkToplevel):
+    """Hidden panel (Ctrl+Shift+D) with per-operation timings from recent spans"""
+
+    _instance = None
+
+    @classmethod
+    def show(cls, parent):
+        if cls._instance is not None and cls._instance.winfo_exists():
+            cls._instance.lift()
+            cls._instance.focus_force()
+            return cls._instance
+        cls._instance = cls(parent)
+        return cls._instance
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Diagnostics")
+        self.geometry("760x420")
+        self.theme = setup_theme(app_config)
+
+        controls = ctk.CTkFrame(self, **self.theme["frame"])
+        controls.pack(fill="x", padx=10, pady=(10, 0))
+        self.tracing_var = ctk.BooleanVar(value=tracer.enabled)
+        ctk.CTkSwitch(controls, text="Record spans", variable=self.tracing_var,
+                      command=self.toggle_tracing).pack(side="left", padx=5)
+        ctk.CTkButton(controls, text="Reset", width=80, command=self.reset,
+                      **self.theme["button"]).pack(side="right", padx=5)
+        self.file_label = ctk.CTkLabel(controls, text="", font=('Inter', 12))
+        self.file_label.pack(side="left", padx=10)
+
+        self.textbox = ctk.CTkTextbox(self, font=("Courier", 13), wrap="none")
+        self.textbox.pack(fill="both", expand=True, padx=10, pady=10)
+        self.refresh()
+
+    def toggle_tracing(self):
+        # Switching on here keeps the configured trace file, but only for this session
+        tracer.configure(self.tracing_var.get(), app_config.get_str("trace_file", "trace.jsonl"),
+                         app_config.get_float("trace_max_mb", 5))
+
+    def reset(self):
+        tracer.reset()
+        self.refresh(reschedule=False)
+
+    def refresh(self, reschedule=True):
+        if not self.winfo_exists():
+            return
+        self.file_label.configure(text=f"Writing to {tracer.path}" if tracer.enabled and tracer.path else "")
+        bounds = "/".join(str(bound) for bound in HISTOGRAM_BOUNDS_MS)
+        lines = [f"{'operation':<34}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}  <{bounds}ms+"]
+        stats = tracer.stats()
+        for name in sorted(stats, key=lambda n: stats[n]["p95_ms"], reverse=True):
+            entry = stats[name]
+            lines.append(f"{name:<34}{entry['count']:>7}{entry['p50_ms']:>10.2f}"
+                         f"{entry['p95_ms']:>10.2f}{entry['max_ms']:>10.2f}  "
+                         f"{histogram_bar(entry['histogram'])}")
+        if not stats:
+            lines.append("No spans recorded yet." if tracer.enabled
+                         else "Tracing is off. Switch on \"Record spans\" or set tracing_enabled in the config.")
+        self.textbox.configure(state="normal")
+        self.textbox.delete("1.0", "end")
+        self.textbox.insert("1.0", "\n".join(lines))
+        self.textbox.configure(state="disabled")
+        if reschedule:
+            self.after(REFRESH_INTERVAL_MS, self.refresh)
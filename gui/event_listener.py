@@ -0,0 +1,55 @@
+import queue
+import threading
+from events import bus
+
+POLL_INTERVAL_MS = 100
+
+
+class EventListener:
+    """Delivers EventBus events to a Tk widget on the Tk thread.
+
+    Events published on the Tk thread (e.g. after a dialog saves a client)
+    are handled immediately; events from worker threads are queued and
+    handed over from an after() callback.
+    """
+
+    def __init__(self, widget):
+        self.widget = widget
+        self._thread = threading.current_thread()
+        self._queue = queue.Queue()
+        self._subscriptions = []
+        self._closed = False
+        self.widget.after(POLL_INTERVAL_MS, self._poll)
+
+    def subscribe(self, entity, callback):
+        def deliver(event):
+            if threading.current_thread() is self._thread:
+                callback(event)
+            else:
+                self._queue.put((callback, event))
+
+        bus.subscribe(entity, deliver)
+        self._subscriptions.append((entity, deliver))
+
+    def close(self):
+        self._closed = True
+        for entity, deliver in self._subscriptions:
+            bus.unsubscribe(entity, deliver)
+        self._subscriptions = []
+
+    def _poll(self):
+        if self._closed:
+            return
+        try:
+            while True:
+                try:
+                    callback, event = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                # One failing handler must not stop delivery for the rest of the session
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"Error handling {event.entity} {event.action} event: {str(e)}")
+        finally:
+            self.widget.after(POLL_INTERVAL_MS, self._poll)
@@ -1,7 +1,26 @@
 import customtkinter as ctk
+import queue
+import threading
+from collections import OrderedDict
+from tkinter import filedialog, messagebox
 from config import app_config
-from db import InvoiceDB
+from db import AGING_BUCKETS, INVOICE_STATUSES, EmailQueue, InvoiceDB
+from events import INVOICE, UPDATED, DELETED
+from batch_output import merge_invoices
+from tracing import traced
 from .theme import setup_theme
+from .query_runner import QueryRunner
+from .event_listener import EventListener
+from .reconcile_window import ReconcileWindow
+
+# Rows are fetched from the database in pages and only a handful are kept
+ROW_HEIGHT = 36
+PAGE_SIZE = 100
+MAX_CACHED_PAGES = 8
+# Wait this long after the last keystroke before querying
+FILTER_DEBOUNCE_MS = 250
+STATUS_OPTIONS = ["All", *INVOICE_STATUSES]
+AGING_LABELS = dict(zip(AGING_BUCKETS, ("Not due", "0-30 days", "31-60 days", "60+ days")))
 
 class InvoiceViewer(ctk.CTkToplevel):
     _instance = None
@@ -23,8 +42,25 @@ class InvoiceViewer(ctk.CTkToplevel):
         
         # Initialize selected invoices set
         self.selected_invoices = set()
+        self.export_events = queue.Queue()
+        self.export_running = False
+        self.export_cancel = threading.Event()
+        
+        # Current view, applied in SQL
+        self.filters = {}
+        self.sort_column = "invoice_date"
+        self.sort_desc = True
+        self.order_by = "invoice_date DESC"
+        self.filter_job = None
+        self.refresh_job = None
+        self.pending_pages = set()
+        self.query_runner = QueryRunner(self)
         
         self.create_widgets()
+        
+        # Patch rows in place when invoices change elsewhere
+        self.event_listener = EventListener(self)
+        self.event_listener.subscribe(INVOICE, self.on_invoice_event)
         self.focus_force()
 
     def create_widgets(self):
@@ -35,6 +71,8 @@ class InvoiceViewer(ctk.CTkToplevel):
         toolbar_frame = ctk.CTkFrame(main_frame, **self.theme["frame"])
         toolbar_frame.pack(fill="x", padx=5, pady=(5, 0))
 
+        self.create_filter_bar(toolbar_frame)
+
         # Add delete button
         self.delete_button = ctk.CTkButton(
             toolbar_frame,
@@ -45,24 +83,46 @@ class InvoiceViewer(ctk.CTkToplevel):
         )
         self.delete_button.pack(side="right", padx=5, pady=5)
 
+        self.export_button = ctk.CTkButton(
+            toolbar_frame,
+            text="Export Selected as PDF",
+            command=self.export_selected_invoices,
+            state="disabled",
+            **self.theme["button"]
+        )
+        self.export_button.pack(side="right", padx=5, pady=5)
+
+        ctk.CTkButton(
+            toolbar_frame,
+            text="Reconcile Statement",
+            command=lambda: ReconcileWindow(self),
+            **self.theme["button"]
+        ).pack(side="right", padx=5, pady=5)
+
+        # Unpaid totals by days past due, for all invoices regardless of filters
+        self.aging_label = ctk.CTkLabel(main_frame, text="", anchor="w", font=('Inter', 14),
+                                        text_color=self.theme["text_color"])
+        self.aging_label.pack(fill="x", padx=10, pady=(5, 0))
+
         # Create table frame
         table_frame = ctk.CTkFrame(main_frame, **self.theme["frame"])
         table_frame.pack(fill="both", expand=True, padx=5, pady=5)
 
-        # Create a scrollable frame for the table
-        self.table_container = ctk.CTkScrollableFrame(table_frame, **self.theme["frame"])
-        self.table_container.pack(fill="both", expand=True, padx=5, pady=5)
-        
         # Headers configuration
         self.headers = [
             "Select", "Invoice ID", "Client", "Date", "Total", "Tax", "Method", "Status"
         ]
         self.column_widths = [50, 200, 250, 120, 100, 100, 150, 150]
+        self.sort_columns = [
+            None, "invoice_id", "client_name", "invoice_date",
+            "total_amount", "tax_amount", "payment_method", "status"
+        ]
         
         # Create header row
-        header_frame = ctk.CTkFrame(self.table_container, fg_color=self.theme["button"]["fg_color"])
-        header_frame.pack(fill="x", padx=2, pady=(0, 2))
+        header_frame = ctk.CTkFrame(table_frame, fg_color=self.theme["button"]["fg_color"])
+        header_frame.pack(fill="x", padx=7, pady=(5, 2))
         
+        self.header_labels = []
         for i, (header, width) in enumerate(zip(self.headers, self.column_widths)):
             header_label = ctk.CTkLabel(
                 header_frame,
@@ -72,55 +132,330 @@ class InvoiceViewer(ctk.CTkToplevel):
                 text_color=self.theme["text_color"]
             )
             header_label.grid(row=0, column=i, padx=2, pady=5)
+            # Clicking a header sorts by that column
+            if self.sort_columns[i]:
+                header_label.configure(cursor="hand2")
+                header_label.bind("<Button-1>", lambda e, column=self.sort_columns[i]: self.sort_by(column))
+            self.header_labels.append(header_label)
+        self.update_header_labels()
+        
+        # The table is virtualized: only enough row widgets to fill the
+        # viewport exist, and scrolling rebinds them to other invoices
+        body_frame = ctk.CTkFrame(table_frame, fg_color="transparent")
+        body_frame.pack(fill="both", expand=True, padx=5, pady=(0, 5))
+        self.scrollbar = ctk.CTkScrollbar(body_frame, command=self.on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+        self.data_frame = ctk.CTkFrame(body_frame, fg_color="transparent")
+        self.data_frame.pack(side="left", fill="both", expand=True)
+        self.data_frame.bind("<Configure>", self.on_resize)
+        self.bind_mousewheel(self.data_frame)
         
-        # Create container for data rows
-        self.data_frame = ctk.CTkFrame(self.table_container, fg_color="transparent")
-        self.data_frame.pack(fill="both", expand=True)
+        self.row_widgets = []
+        self.pages = OrderedDict()
+        self.total_rows = 0
+        self.first_row = 0
         
         # Bind double click event to the data frame
         self.data_frame.bind("<Double-Button-1>", self.show_details)
         self.load_invoices()
 
+    def create_filter_bar(self, parent):
+        self.client_filter_var = ctk.StringVar()
+        self.status_filter_var = ctk.StringVar(value=STATUS_OPTIONS[0])
+        self.date_from_var = ctk.StringVar()
+        self.date_to_var = ctk.StringVar()
+
+        ctk.CTkLabel(parent, text="Client:", font=('Inter', 14)).pack(side="left", padx=(5, 2))
+        ctk.CTkEntry(parent, textvariable=self.client_filter_var, width=180, **self.theme["entry"]).pack(side="left", padx=2)
+        ctk.CTkLabel(parent, text="Status:", font=('Inter', 14)).pack(side="left", padx=(10, 2))
+        ctk.CTkOptionMenu(parent, variable=self.status_filter_var, values=STATUS_OPTIONS, width=110,
+                          command=lambda value: self.schedule_filter()).pack(side="left", padx=2)
+        ctk.CTkLabel(parent, text="From (YYYY-MM-DD):", font=('Inter', 14)).pack(side="left", padx=(10, 2))
+        ctk.CTkEntry(parent, textvariable=self.date_from_var, width=110, **self.theme["entry"]).pack(side="left", padx=2)
+        ctk.CTkLabel(parent, text="To (YYYY-MM-DD):", font=('Inter', 14)).pack(side="left", padx=(10, 2))
+        ctk.CTkEntry(parent, textvariable=self.date_to_var, width=110, **self.theme["entry"]).pack(side="left", padx=2)
+
+        for var in (self.client_filter_var, self.date_from_var, self.date_to_var):
+            var.trace_add("write", self.schedule_filter)
+
+    def schedule_filter(self, *args):
+        # Debounce keystrokes so only the last one triggers a query
+        if self.filter_job is not None:
+            self.after_cancel(self.filter_job)
+        self.filter_job = self.after(FILTER_DEBOUNCE_MS, self.apply_filters)
+
+    def apply_filters(self):
+        self.filter_job = None
+        status = self.status_filter_var.get()
+        date_to = self.date_to_var.get().strip()
+        if len(date_to) == 10:
+            # A bare date should include invoices from that whole day
+            date_to += "T23:59:59"
+        self.filters = {
+            "client_name": self.client_filter_var.get().strip(),
+            "status": "" if status == "All" else status,
+            "date_from": self.date_from_var.get().strip(),
+            "date_to": date_to,
+        }
+        self.reload()
+
+    def sort_by(self, column):
+        if column == self.sort_column:
+            self.sort_desc = not self.sort_desc
+        else:
+            self.sort_column = column
+            self.sort_desc = False
+        self.order_by = f"{column} {'DESC' if self.sort_desc else 'ASC'}"
+        self.update_header_labels()
+        self.reload()
+
+    def update_header_labels(self):
+        for label, header, column in zip(self.header_labels, self.headers, self.sort_columns):
+            if column and column == self.sort_column:
+                header += " ▼" if self.sort_desc else " ▲"
+            label.configure(text=header)
+
     def load_invoices(self):
-        # Clear existing rows
-        for widget in self.data_frame.winfo_children():
-            widget.destroy()
-        
-        # Clear selected invoices
         self.selected_invoices.clear()
         self.update_delete_button()
+        self.reload()
+
+    def reload(self, keep_position=False):
+        # Supersede any query still running for the previous view
+        self.query_runner.new_generation()
+        self.pages.clear()
+        self.pending_pages.clear()
+        if not keep_position:
+            self.first_row = 0
+        page_no = self.first_row // PAGE_SIZE
+        self.query_runner.submit(
+            self.fetch_view,
+            (self.filters, self.order_by, page_no),
+            lambda result, page_no=page_no: self.on_view_loaded(page_no, result)
+        )
+        self.query_runner.submit(InvoiceDB.get_aging_report, (), self.on_aging_loaded)
+
+    @staticmethod
+    def fetch_view(filters, order_by, page_no, conn):
+        total = InvoiceDB.count_invoices(filters, conn=conn)
+        page = InvoiceDB.get_invoices_page(filters, order_by, PAGE_SIZE, page_no * PAGE_SIZE, conn=conn)
+        return total, page
+
+    def on_view_loaded(self, page_no, result):
+        if isinstance(result, Exception):
+            print(f"Error loading invoices: {str(result)}")
+            return
+        self.total_rows, page = result
+        self.pages[page_no] = page
+        self.scroll_to(self.first_row)
+        self.refresh_rows()
+
+    def on_aging_loaded(self, result):
+        if isinstance(result, Exception):
+            print(f"Error loading aging report: {str(result)}")
+            return
+        parts = [f"{AGING_LABELS[bucket]}: {count} (${amount:,.2f})" for bucket, count, amount in result]
+        self.aging_label.configure(text="Unpaid   " + "   |   ".join(parts))
+
+    def on_invoice_event(self, event):
+        if event.action == UPDATED and not self.filters.get("status"):
+            # Only rows in the cached pages are refetched; the rest load with their page
+            changed = set(event.ids)
+            cached = [row[0] for page in self.pages.values() for row in page if row[0] in changed]
+            if cached:
+                self.query_runner.submit(InvoiceDB.get_invoices_by_ids, (cached,), self.on_rows_updated)
+            self.query_runner.submit(InvoiceDB.get_aging_report, (), self.on_aging_loaded)
+            return
+        if event.action == DELETED:
+            self.selected_invoices.difference_update(event.ids)
+            self.update_delete_button()
+        # Rows were added or removed, so positions shift: refetch the visible
+        # page once, coalescing bursts of events (e.g. a bulk delete)
+        if self.refresh_job is None:
+            self.refresh_job = self.after(50, self.refresh_view)
+
+    def on_rows_updated(self, result):
+        if isinstance(result, Exception):
+            print(f"Error loading invoices: {str(result)}")
+            return
+        # Swap the changed rows into the cached pages; only their labels are redrawn
+        rows = {row[0]: row for row in result}
+        for page in self.pages.values():
+            for i, row in enumerate(page):
+                if row[0] in rows:
+                    page[i] = rows[row[0]]
+        self.refresh_rows()
+
+    def refresh_view(self):
+        self.refresh_job = None
+        self.reload(keep_position=True)
+
+    def request_page(self, page_no):
+        if page_no in self.pending_pages:
+            return
+        self.pending_pages.add(page_no)
+        self.query_runner.submit(
+            InvoiceDB.get_invoices_page,
+            (self.filters, self.order_by, PAGE_SIZE, page_no * PAGE_SIZE),
+            lambda result, page_no=page_no: self.on_page_loaded(page_no, result)
+        )
+
+    def on_page_loaded(self, page_no, result):
+        self.pending_pages.discard(page_no)
+        if isinstance(result, Exception):
+            print(f"Error loading invoices: {str(result)}")
+            return
+        self.pages[page_no] = result
+        if len(self.pages) > MAX_CACHED_PAGES:
+            self.pages.popitem(last=False)
+        self.refresh_rows()
+
+    def get_invoice_at(self, index):
+        page_no = index // PAGE_SIZE
+        page = self.pages.get(page_no)
+        if page is None:
+            # Fetched in the background; the row fills in when it arrives
+            self.request_page(page_no)
+            return None
+        self.pages.move_to_end(page_no)
+        offset = index - page_no * PAGE_SIZE
+        return page[offset] if offset < len(page) else None
+
+    def destroy(self):
+        self.event_listener.close()
+        self.query_runner.close()
+        super().destroy()
+
+    def row_height(self):
+        # Widgets are placed in unscaled units but the frame reports real pixels
+        return ROW_HEIGHT * ctk.ScalingTracker.get_widget_scaling(self.data_frame)
+
+    def visible_row_count(self):
+        return max(1, int(self.data_frame.winfo_height() // self.row_height()))
+
+    def on_resize(self, event):
+        needed = max(1, int(event.height // self.row_height()))
+        while len(self.row_widgets) < needed:
+            self.row_widgets.append(self.create_row_widget(len(self.row_widgets)))
+        self.scroll_to(self.first_row)
+        self.refresh_rows()
+
+    def create_row_widget(self, slot):
+        row_frame = ctk.CTkFrame(self.data_frame, fg_color=self.theme["entry"]["fg_color"])
         
-        # Load and display invoices
-        for row_idx, inv in enumerate(InvoiceDB.get_all_invoices()):
-            row_frame = ctk.CTkFrame(self.data_frame, fg_color=self.theme["entry"]["fg_color"] if row_idx % 2 == 0 else "white")
-            row_frame.pack(fill="x", padx=2, pady=1)
-            
-            # Add checkbox
-            checkbox = ctk.CTkCheckBox(
+        # Add checkbox
+        checkbox = ctk.CTkCheckBox(
+            row_frame,
+            text="",
+            width=self.column_widths[0],
+            command=lambda slot=slot: self.on_row_checkbox(slot),
+            **self.theme["checkbox"]
+        )
+        checkbox.grid(row=0, column=0, padx=2, pady=3)
+        
+        cells = []
+        for col_idx, width in enumerate(self.column_widths[1:]):
+            cell = ctk.CTkLabel(
                 row_frame,
                 text="",
-                width=self.column_widths[0],
-                command=lambda inv_id=inv[0]: self.toggle_invoice_selection(inv_id),
-                **self.theme["checkbox"]
+                width=width,
+                font=('Inter', 14),
+                text_color=self.theme["text_color"]
             )
-            checkbox.grid(row=0, column=0, padx=2, pady=3)
-            
-            # Add invoice data
-            for col_idx, (value, width) in enumerate(zip(inv, self.column_widths[1:])):
-                if col_idx == 3 or col_idx == 4:  # Format Total and Tax amounts
-                    value = f"${value:.2f}"
-                cell = ctk.CTkLabel(
-                    row_frame,
-                    text=str(value),
-                    width=width,
-                    font=('Inter', 14),
-                    text_color=self.theme["text_color"]
-                )
-                cell.grid(row=0, column=col_idx + 1, padx=2, pady=3)
-                
-                # Add double-click event for details
-                if col_idx == 0:  # Invoice ID column
-                    cell.bind("<Double-Button-1>", lambda e, inv_id=inv[0]: self.show_details_by_id(inv_id))
+            cell.grid(row=0, column=col_idx + 1, padx=2, pady=3)
+            cells.append(cell)
+        
+        # Add double-click event for details on the Invoice ID column
+        cells[0].bind("<Double-Button-1>", lambda e, slot=slot: self.on_row_double_click(slot))
+        self.bind_mousewheel(row_frame, checkbox, *cells)
+        return {"frame": row_frame, "checkbox": checkbox, "cells": cells,
+                "slot": slot, "index": None, "invoice_id": None, "values": None}
+
+    @traced("gui.viewer.refresh_rows")
+    def refresh_rows(self):
+        visible = self.visible_row_count()
+        for row in self.row_widgets:
+            index = self.first_row + row["slot"]
+            invoice = None
+            if row["slot"] < visible and index < self.total_rows:
+                invoice = self.get_invoice_at(index)
+            if invoice is None:
+                if row["index"] is not None:
+                    row["frame"].place_forget()
+                    row["index"] = row["invoice_id"] = row["values"] = None
+                continue
+            self.bind_row(row, index, invoice)
+
+        if self.total_rows:
+            self.scrollbar.set(self.first_row / self.total_rows,
+                               min(1.0, (self.first_row + visible) / self.total_rows))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def bind_row(self, row, index, invoice):
+        if row["index"] is None:
+            row["frame"].place(x=0, y=row["slot"] * ROW_HEIGHT, relwidth=1.0)
+        if row["index"] is None or row["index"] % 2 != index % 2:
+            row["frame"].configure(fg_color=self.theme["entry"]["fg_color"] if index % 2 == 0 else "white")
+        row["index"] = index
+        row["invoice_id"] = invoice[0]
+
+        if invoice[0] in self.selected_invoices:
+            row["checkbox"].select()
+        else:
+            row["checkbox"].deselect()
+
+        # Only touch labels whose text actually changed
+        values = []
+        for col_idx, value in enumerate(invoice):
+            if col_idx == 3 or col_idx == 4:  # Format Total and Tax amounts
+                value = f"${value:.2f}"
+            values.append(str(value))
+        previous = row["values"] or [None] * len(values)
+        for cell, value, old in zip(row["cells"], values, previous):
+            if value != old:
+                cell.configure(text=value)
+        row["values"] = values
+
+    def bind_mousewheel(self, *widgets):
+        for widget in widgets:
+            widget.bind("<MouseWheel>", self.on_mousewheel)
+            widget.bind("<Button-4>", self.on_mousewheel)
+            widget.bind("<Button-5>", self.on_mousewheel)
+
+    def on_mousewheel(self, event):
+        step = -3 if event.num == 4 or event.delta > 0 else 3
+        self.scroll_to(self.first_row + step)
+        return "break"
+
+    def on_scrollbar(self, action, *args):
+        if action == "moveto":
+            first = int(float(args[0]) * self.total_rows)
+        elif action == "scroll":
+            amount = int(args[0])
+            if len(args) > 1 and args[1] == "pages":
+                amount *= self.visible_row_count()
+            first = self.first_row + amount
+        else:
+            return
+        self.scroll_to(first)
+
+    def scroll_to(self, first):
+        max_first = max(0, self.total_rows - self.visible_row_count())
+        first = min(max(0, first), max_first)
+        if first != self.first_row:
+            self.first_row = first
+            self.refresh_rows()
+
+    def on_row_checkbox(self, slot):
+        invoice_id = self.row_widgets[slot]["invoice_id"]
+        if invoice_id is not None:
+            self.toggle_invoice_selection(invoice_id)
+
+    def on_row_double_click(self, slot):
+        invoice_id = self.row_widgets[slot]["invoice_id"]
+        if invoice_id is not None:
+            self.show_details_by_id(invoice_id)
                 
     def show_details_by_id(self, invoice_id):
         details = InvoiceDB.get_invoice_details(invoice_id)
@@ -146,7 +481,9 @@ class InvoiceViewer(ctk.CTkToplevel):
             ("Invoice Date:", details[8]),
             ("Payment Method:", details[9]),
             ("Payment Entity:", details[10]),
-            ("Status:", details[11])
+            ("Status:", details[11]),
+            ("Due Date:", details[17] or "-"),
+            ("Email:", details[16] or "not sent")
         ]
         
         for i, (label, value) in enumerate(fields):
@@ -166,6 +503,20 @@ class InvoiceViewer(ctk.CTkToplevel):
             )
             value_widget.grid(row=i, column=1, padx=(10, 20), pady=5, sticky='w')
         
+        ctk.CTkButton(
+            main_frame,
+            text="Save PDF",
+            command=lambda: self.reprint_invoice(details[1]),
+            **self.theme["button"]
+        ).grid(row=len(fields), column=0, columnspan=2, pady=(15, 5))
+        if details[3]:
+            ctk.CTkButton(
+                main_frame,
+                text="Send by Email",
+                command=lambda: self.email_invoice(details[1]),
+                **self.theme["button"]
+            ).grid(row=len(fields) + 1, column=0, columnspan=2, pady=5)
+
         # Configure grid weights
         main_frame.grid_columnconfigure(1, weight=1)
         
@@ -177,6 +528,30 @@ class InvoiceViewer(ctk.CTkToplevel):
         y = (detail_window.winfo_screenheight() // 2) - (height // 2)
         detail_window.geometry(f"{width}x{height}+{x}+{y}")
         
+    def email_invoice(self, invoice_id):
+        try:
+            EmailQueue.send_invoice(invoice_id)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        messagebox.showinfo("Success", f"Invoice {invoice_id} is queued; the mail worker will send it")
+
+    def reprint_invoice(self, invoice_id):
+        content_hash, render_data = InvoiceDB.get_render_data(invoice_id)
+        if not render_data:
+            messagebox.showerror("Error", f"Invoice {invoice_id} was created before render data was recorded and can't be reprinted")
+            return
+        output_path = filedialog.asksaveasfilename(
+            defaultextension=".pdf",
+            initialfile=f"{invoice_id}.pdf",
+            filetypes=[("PDF Files", "*.pdf"), ("All Files", "*.*")],
+            title="Save Invoice As"
+        )
+        if output_path:
+            # Served from the render cache when the original PDF is still there
+            app = self.master
+            app.render_queue.submit_reprint(app.get_renderer(), render_data, output_path, content_hash)
+
     def toggle_invoice_selection(self, invoice_id):
         if invoice_id in self.selected_invoices:
             self.selected_invoices.remove(invoice_id)
@@ -189,6 +564,87 @@ class InvoiceViewer(ctk.CTkToplevel):
             self.delete_button.configure(state="normal")
         else:
             self.delete_button.configure(state="disabled")
+        if not self.export_running:
+            self.export_button.configure(state="normal" if self.selected_invoices else "disabled")
+
+    def export_selected_invoices(self):
+        if self.export_running:
+            # While exporting, the button cancels
+            self.export_cancel.set()
+            self.export_button.configure(state="disabled", text="Cancelling...")
+            return
+        if not self.selected_invoices:
+            return
+        output_path = filedialog.asksaveasfilename(
+            defaultextension=".pdf",
+            filetypes=[("PDF Files", "*.pdf"), ("All Files", "*.*")],
+            title="Save Merged Invoices As"
+        )
+        if not output_path:
+            return
+
+        self.export_running = True
+        self.export_cancel.clear()
+        self.export_button.configure(state="disabled", text="Preparing Export...")
+        # Only the selected rows, in the order shown in the table
+        self.query_runner.submit(
+            InvoiceDB.get_invoices_by_ids, (list(self.selected_invoices), self.order_by),
+            lambda result, output_path=output_path: self.start_export(result, output_path),
+            keep=True,
+        )
+
+    def start_export(self, rows, output_path):
+        if isinstance(rows, Exception) or not rows:
+            # Failed, or every selected invoice was deleted meanwhile
+            self.export_running = False
+            self.export_button.configure(text="Export Selected as PDF")
+            self.update_delete_button()
+            if rows:
+                messagebox.showerror("Error", f"Failed to export invoices:\n{str(rows)}")
+            return
+        invoice_ids = [row[0] for row in rows]
+        app = self.master
+        renderer = app.get_renderer()
+        cache = app.render_queue.cache
+
+        def run():
+            try:
+                skipped = merge_invoices(
+                    invoice_ids, output_path, renderer, cache,
+                    progress=lambda done, total: self.export_events.put(("progress", done, total)),
+                    cancel_event=self.export_cancel
+                )
+                self.export_events.put(("done", skipped, output_path))
+            except Exception as e:
+                self.export_events.put(("error", str(e), None))
+
+        self.export_button.configure(state="normal", text="Cancel Export")
+        threading.Thread(target=run, daemon=True).start()
+        self.after(150, self.poll_export)
+
+    def poll_export(self):
+        while True:
+            try:
+                kind, first, second = self.export_events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                if not self.export_cancel.is_set():
+                    self.export_button.configure(text=f"Cancel Export ({first}/{second})")
+                continue
+            self.export_running = False
+            self.export_button.configure(text="Export Selected as PDF")
+            self.update_delete_button()
+            if kind == "error":
+                messagebox.showerror("Error", f"Failed to export invoices:\n{first}")
+            elif first is None:
+                messagebox.showinfo("Export Cancelled", "The export was cancelled; no file was written")
+            elif first:
+                messagebox.showwarning("Export Finished", f"Saved to:\n{second}\n\nSkipped (no render data): {', '.join(first)}")
+            else:
+                messagebox.showinfo("Success", f"Invoices saved to:\n{second}")
+            return
+        self.after(150, self.poll_export)
     
     def delete_selected_invoices(self):
         if not self.selected_invoices:
@@ -200,12 +656,12 @@ class InvoiceViewer(ctk.CTkToplevel):
             title="Confirm Deletion"
         )
         if confirm.get_input() == "DELETE":
-            for invoice_id in self.selected_invoices:
+            for invoice_id in list(self.selected_invoices):
                 try:
                     InvoiceDB.delete_invoice(invoice_id)
                 except Exception as e:
                     print(f"Error deleting invoice {invoice_id}: {str(e)}")
-            self.load_invoices()
+            # Deletions arrive as events and the view patches itself
     
     def show_details(self, event):
         # This method is kept for backward compatibility
@@ -1,17 +1,39 @@
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
-from docx import Document
-from docx2pdf import convert
 import os
+import queue
+import threading
 import tkinter as tk
+from datetime import date
 from tkinter import ttk
-from datetime import datetime
 from config import app_config, ConfigHandler
-from db import ClientDB, InvoiceDB, generate_id
+from db import ClientDB, ClientConflictError, InvoiceDB, RecurringDB
+from events import CLIENT, DELETED
+from client_index import ClientIndex
+from totals import compute_totals, to_decimal
+from invoice_data import build_invoice
+from recurring import RecurringScheduler
+from maintenance import MaintenanceScheduler
+from tracing import traced
+from renderer import InvoiceRenderer
+from render_queue import RenderQueue
+from render_cache import RenderCache
 from .client_manager import ClientManager
 from .invoice_viewer import InvoiceViewer
 from .settings_window import SettingsWindow
-from .theme import setup_theme
+from .render_panel import RenderQueuePanel
+from .event_listener import EventListener
+from .client_picker import ClientPicker
+from .diagnostics_window import DiagnosticsWindow
+from .recurring_dialog import RecurringDialog
+from .theme import setup_theme, theme_engine
+
+# How often to look for settings saved elsewhere or edited on disk
+CONFIG_POLL_MS = 1000
+# Totals are recalculated once typing pauses for this long
+TOTALS_DEBOUNCE_MS = 150
+# How often to check whether the date has changed, for the overdue sweep and recurring invoices
+DAILY_JOBS_CHECK_MS = 10 * 60 * 1000
 
 class InvoiceApp(ctk.CTk):
     def __init__(self):
@@ -19,6 +41,7 @@ class InvoiceApp(ctk.CTk):
         self.title("Invoice Maker")
         self.state('zoomed') # Full screen
         self.bind('<Escape>', lambda e: self.destroy())  # Press ESC to exit
+        self.bind('<Control-Shift-D>', lambda e: self.open_diagnostics())  # Hidden performance panel
         self.theme = setup_theme(app_config)
         self.theme_mode = ctk.StringVar(value=app_config['theme_mode'])
         
@@ -29,7 +52,7 @@ class InvoiceApp(ctk.CTk):
 
         # Initialize variables
         self.current_client_id = ctk.StringVar()
-        self.service_totals = [ctk.StringVar(value="0.00") for _ in range(6)]
+        self.service_totals = []
         self.client_vars = {
             "name": ctk.StringVar(),
             "email": ctk.StringVar(),
@@ -37,20 +60,15 @@ class InvoiceApp(ctk.CTk):
             "address": ctk.StringVar()
         }
         
-        # Service variables with trace setup
+        # Service rows are added on demand, see add_service_row
         self.services = []
-        for i in range(6):
-            service_vars = {
-                "desc": ctk.StringVar(),
-                "qty": ctk.StringVar(),
-                "price": ctk.StringVar()
-            }
-            # Add trace to each variable
-            for var in service_vars.values():
-                var.trace_add("write", lambda *args, idx=i: self.update_service(idx))
-            self.services.append(service_vars)
-        
+        self.service_rows = []
+
         self.tax_percent = ctk.StringVar(value="21")
+        self.tax_percent.trace_add("write", lambda *args: self.schedule_totals())
+        self.payment_terms = ctk.StringVar(value=str(app_config.get_int("payment_terms_days", 30)))
+        self.totals_text = ctk.StringVar(value="Subtotal: 0.00   Tax: 0.00   Total: 0.00")
+        self.totals_job = None
         self.payment_vars = {
             "method": ctk.StringVar(),
             "entity": ctk.StringVar(),
@@ -58,12 +76,49 @@ class InvoiceApp(ctk.CTk):
             "number": ctk.StringVar()
         }
         
+        self.renderer = None
+
         self.load_config()
+        cache = RenderCache(
+            app_config.get_str("render_cache_dir", "render_cache"),
+            app_config.get_int("render_cache_max_mb", 500) * 1024 * 1024,
+        )
+        self.render_queue = RenderQueue(cache=cache)
+        self.client_index = None
+        self.client_index_results = queue.Queue()
+        self.pending_client_events = []
+        # A client created while the index was loading; selected once it arrives
+        self.pending_select = None
+
         self.create_widgets()
-        self.load_clients_combobox()
+        # One walk at creation; theme switches then only touch what changes
+        theme_engine.register_tree(self)
+        # Warm the client index once the window has been drawn
+        self.after_idle(self.load_clients)
+
+        # Patch the client index in place when clients change
+        self.event_listener = EventListener(self)
+        self.event_listener.subscribe(CLIENT, self.on_client_event)
+        self.after(CONFIG_POLL_MS, self.watch_config)
+        self.daily_jobs_ran_on = None
+        self.daily_jobs_running = False
+        self.daily_jobs_results = queue.Queue()
+        self.after_idle(self.run_daily_jobs)
+        self.after(CONFIG_POLL_MS, self.check_daily_jobs)
+
+        # Database upkeep runs on its own thread once the app has been left alone
+        self.maintenance_problems = queue.Queue()
+        self.maintenance = MaintenanceScheduler(on_problem=self.maintenance_problems.put)
+        self.bind_all("<Any-KeyPress>", self.maintenance.note_activity, add="+")
+        self.bind_all("<Any-ButtonPress>", self.maintenance.note_activity, add="+")
+        if app_config.get("maintenance_enabled", True):
+            self.maintenance.start()
+        self.after(CONFIG_POLL_MS, self.check_maintenance)
 
     def load_config(self):
+        # The shared ConfigStore, not a copy, so every window sees one config
         self.config_data = ConfigHandler.load_config()
+        self.config_version = self.config_data.version
         theme = self.config_data.get("theme_mode", "light")
         if theme in self.config_data["color_scheme"]:
             self.color_scheme = self.config_data["color_scheme"][theme]
@@ -72,6 +127,21 @@ class InvoiceApp(ctk.CTk):
             self.color_scheme = self.config_data["color_scheme"]["light"]
         self.business_info = self.config_data["business_info"]
 
+    def watch_config(self):
+        # Pick up settings saved from another window or edited on disk
+        app_config.reload_if_changed()
+        if app_config.version != self.config_version:
+            clients_db = self.config_data["clients_db"]
+            self.load_config()
+            theme = self.config_data.get("theme_mode", "light")
+            if theme != self.theme_mode.get():
+                self.theme_mode.set(theme)
+                ctk.set_appearance_mode(theme)
+            self.configure_styles()
+            if self.config_data["clients_db"] != clients_db:
+                self.load_clients()
+        self.after(CONFIG_POLL_MS, self.watch_config)
+
 
 
     def create_widgets(self):
@@ -100,10 +170,12 @@ class InvoiceApp(ctk.CTk):
         client_sel_frame.pack(fill=tk.X, pady=5)
 
         ctk.CTkLabel(client_sel_frame, text="Select Client:", font=('Inter', 14)).pack(side=tk.LEFT)
-        self.client_cb = ctk.CTkOptionMenu(client_sel_frame, variable=self.current_client_id, 
-                                    state="readonly", width=150)
-        self.client_cb.pack(side=tk.LEFT, padx=5)
-        self.client_cb.configure(command=self.on_client_select)
+        self.client_picker = ClientPicker(client_sel_frame, command=self.on_client_select, width=220)
+        self.client_picker.pack(side=tk.LEFT, padx=5)
+        self.client_picker.set_index(ClientIndex())
+        self.client_picker.set_colors(self.color_scheme.get("surface", "#f0f0f0"),
+                                      self.color_scheme.get("text", "#000000"),
+                                      self.color_scheme.get("primary", "#1f538d"))
         
         btn_frame = ctk.CTkFrame(client_sel_frame)
         btn_frame.pack(side=tk.LEFT, padx=10)
@@ -122,6 +194,9 @@ class InvoiceApp(ctk.CTk):
             ctk.CTkLabel(row_frame, text=f"{label}:", width=80, anchor=tk.E, font=('Inter', 14)).pack(side=tk.LEFT)
             ctk.CTkEntry(row_frame, textvariable=self.client_vars[field]).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
 
+        self.render_panel = RenderQueuePanel(left_panel, self.render_queue)
+        self.render_panel.pack(fill=tk.X, pady=10)
+
         right_panel = ctk.CTkFrame(content_frame)
         right_panel.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
@@ -139,28 +214,12 @@ class InvoiceApp(ctk.CTk):
                      text_color="white",
                      width=120 if col > 0 else 200).pack(side=tk.LEFT, padx=2, pady=5)
 
-        self.service_rows = []
-        for i in range(6):
-            row_frame = ctk.CTkFrame(services_frame)
-            row_frame.pack(fill=tk.X, padx=5, pady=2)
-            row = []
-            
-            for col in range(3):
-                state = "normal" if i == 0 else "disabled"
-                width = 200 if col == 0 else 120
-                entry = ctk.CTkEntry(row_frame, 
-                                 textvariable=self.services[i][["desc", "qty", "price"][col]],
-                                 state=state,
-                                 width=width)
-                entry.pack(side=tk.LEFT, padx=2)
-                row.append(entry)
-            
-            total_label = ctk.CTkLabel(row_frame, textvariable=self.service_totals[i],
-                                   fg_color=self.color_scheme["secondary"],
-                                   text_color="white" if self.theme_mode.get() == "dark" else "black",
-                                   width=120)
-            total_label.pack(side=tk.LEFT, padx=2)
-            self.service_rows.append(row)
+        self.services_list = ctk.CTkScrollableFrame(services_frame)
+        self.services_list.pack(fill=tk.BOTH, expand=True, padx=5)
+        self.add_service_row()
+
+        ctk.CTkButton(services_frame, text="+ Add Line", command=self.add_service_row,
+                  width=120, font=('Inter', 14)).pack(anchor=tk.W, padx=5, pady=5)
 
         bottom_panel = ctk.CTkFrame(right_panel)
         bottom_panel.pack(fill=tk.X, pady=20)
@@ -172,6 +231,9 @@ class InvoiceApp(ctk.CTk):
         tax_content.pack(fill=tk.X, padx=10, pady=5)
         ctk.CTkLabel(tax_content, text="Tax Percentage (%):", font=('Inter', 14)).pack(side=tk.LEFT)
         ctk.CTkEntry(tax_content, textvariable=self.tax_percent, width=80).pack(side=tk.LEFT, padx=5)
+        ctk.CTkLabel(tax_content, text="Due in (days):", font=('Inter', 14)).pack(side=tk.LEFT, padx=(10, 0))
+        ctk.CTkEntry(tax_content, textvariable=self.payment_terms, width=60).pack(side=tk.LEFT, padx=5)
+        ctk.CTkLabel(tax_frame, textvariable=self.totals_text, font=('Inter', 14)).pack(pady=5)
 
         payment_frame = ctk.CTkFrame(bottom_panel)
         payment_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5)
@@ -188,6 +250,8 @@ class InvoiceApp(ctk.CTk):
         action_frame.pack(side=tk.LEFT, padx=20)
         ctk.CTkButton(action_frame, text="Generate Invoice", 
                   command=self.generate_invoice, width=160, font=('Inter', 14)).pack(pady=5)
+        ctk.CTkButton(action_frame, text="Make Recurring", 
+                  command=self.make_recurring, width=160, font=('Inter', 14)).pack(pady=5)
         ctk.CTkButton(action_frame, text="View Database", 
                   command=self.open_viewer, width=160, font=('Inter', 14)).pack(pady=5)
 
@@ -199,31 +263,100 @@ class InvoiceApp(ctk.CTk):
         
         ctk.CTkButton(footer_frame, text="Toggle Theme", command=self.toggle_theme, width=100, font=('Inter', 14)).pack(side=tk.LEFT, padx=5)
 
-        services_frame.columnconfigure((0,1,2,3), weight=1)
-        for i in range(7):
-            services_frame.rowconfigure(i, weight=1 if i > 0 else 0)
-
-    def load_clients_combobox(self):
-        self.clients = ClientDB.load_clients()
-        if self.clients:
-            # Sort clients by name for better organization
-            self.clients.sort(key=lambda x: x['name'].lower())
-            client_options = [f"{c['name']} ({c['id']})" for c in self.clients]
-            self.client_cb.configure(values=client_options)
-            # Reset selection
-            self.client_cb.set("Select a client...")
-            # Clear client details
-            for field in ["name", "email", "phone", "address"]:
-                self.client_vars[field].set("")
-        else:
-            self.client_cb.configure(values=[])
-            self.client_cb.set("No clients available...")
-        self.client_cb.configure(dropdown_text_color=self.color_scheme.get("text", "#000000"))
-
-    def on_client_select(self, event):
-        selected = self.client_cb.get()
-        client_id = selected.split("(")[-1].strip(")")
-        client = next((c for c in self.clients if c["id"] == client_id), None)
+
+    def add_service_row(self):
+        idx = len(self.services)
+        service_vars = {
+            "desc": ctk.StringVar(),
+            "qty": ctk.StringVar(),
+            "price": ctk.StringVar()
+        }
+        for var in service_vars.values():
+            var.trace_add("write", lambda *args, idx=idx: self.update_service(idx))
+        total_var = ctk.StringVar(value="0.00")
+        self.services.append(service_vars)
+        self.service_totals.append(total_var)
+
+        row_frame = ctk.CTkFrame(self.services_list)
+        row_frame.pack(fill=tk.X, pady=2)
+        row = []
+        for col, field in enumerate(["desc", "qty", "price"]):
+            width = 200 if col == 0 else 120
+            entry = ctk.CTkEntry(row_frame, textvariable=service_vars[field], width=width)
+            entry.pack(side=tk.LEFT, padx=2)
+            row.append(entry)
+
+        total_label = ctk.CTkLabel(row_frame, textvariable=total_var,
+                               fg_color=self.color_scheme["secondary"],
+                               text_color="white" if self.theme_mode.get() == "dark" else "black",
+                               width=120)
+        total_label.pack(side=tk.LEFT, padx=2)
+        self.service_rows.append(row)
+        theme_engine.register_tree(row_frame)
+
+    def get_line_items(self):
+        # Rows left completely empty are skipped
+        return [service for service in self.services
+                if any(var.get() for var in service.values())]
+
+    def load_clients(self):
+        # Reading the client book and indexing it happens off the Tk thread;
+        # the picker starts working as soon as the index arrives
+        self.client_index = None
+        self.pending_select = None
+        self.current_client_id.set("")
+        self.client_picker.clear()
+        for field in ["name", "email", "phone", "address"]:
+            self.client_vars[field].set("")
+
+        def build():
+            try:
+                self.client_index_results.put(ClientIndex(ClientDB.load_clients()))
+            except Exception as e:
+                self.client_index_results.put(e)
+
+        threading.Thread(target=build, daemon=True).start()
+        self.after(50, self.poll_client_index)
+
+    def poll_client_index(self):
+        try:
+            result = self.client_index_results.get_nowait()
+        except queue.Empty:
+            self.after(50, self.poll_client_index)
+            return
+        if isinstance(result, Exception):
+            messagebox.showerror("Error", f"Failed to load clients:\n{str(result)}")
+            result = ClientIndex()
+        self.client_index = result
+        self.client_picker.set_index(result)
+        # Apply changes that happened while the index was being built
+        for event in self.pending_client_events:
+            self.on_client_event(event)
+        self.pending_client_events = []
+        if self.pending_select:
+            self.client_picker.select(self.pending_select)
+            self.pending_select = None
+
+    def on_client_event(self, event):
+        if self.client_index is None:
+            self.pending_client_events.append(event)
+            return
+        clients = event.records
+        if event.action == DELETED:
+            clients = [None] * len(event.ids)
+        elif clients is None:
+            # Published without the saved data: read the client book once for the whole batch
+            by_id = {client["id"]: client for client in ClientDB.load_clients()}
+            clients = [by_id.get(client_id) for client_id in event.ids]
+        for client_id, client in zip(event.ids, clients):
+            if client is None:
+                self.client_index.remove(client_id)
+            else:
+                self.client_index.add(client)
+
+    def on_client_select(self, client_id):
+        self.current_client_id.set(client_id)
+        client = self.client_index.get(client_id) if self.client_index else None
         if client:
             for field in ["name", "email", "phone", "address"]:
                 self.client_vars[field].set(client.get(field, ""))
@@ -233,94 +366,81 @@ class InvoiceApp(ctk.CTk):
         self.wait_window(dialog)
         if dialog.result:
             client_id = ClientDB.add_client(dialog.result)
-            self.load_clients_combobox()
-            self.current_client_id.set(f"{dialog.result['name']} ({client_id})")
+            if self.client_index is None:
+                self.pending_select = client_id
+            else:
+                self.client_picker.select(client_id)
 
     def edit_client(self):
-        selected = self.client_cb.get()
-        if not selected: return
-        client_id = selected.split("(")[-1].strip(")")
-        client = next((c for c in self.clients if c["id"] == client_id), None)
+        client_id = self.current_client_id.get()
+        if not client_id or self.client_index is None: return
+        client = self.client_index.get(client_id)
         if client:
             dialog = ClientManager(self, client)
             self.wait_window(dialog)
             if dialog.result:
-                ClientDB.update_client(client_id, dialog.result)
-                self.load_clients_combobox()
-                self.on_client_select(None)
+                try:
+                    ClientDB.update_client(client_id, dialog.result, client.get("version", 0))
+                except ClientConflictError:
+                    # Show what is on disk now so the edit can be redone on top of it
+                    latest = ClientDB.get_client(client_id)
+                    if latest:
+                        self.client_index.add(latest)
+                    messagebox.showwarning("Client Changed",
+                                           "This client was changed on another computer while you were editing.\n"
+                                           "The latest details are now shown; please apply your changes again.")
+                self.client_picker.select(client_id)
 
     def update_service(self, idx):
+        self.schedule_totals()
+        # Keep a blank row at the end while the last one is being filled in
+        if idx == len(self.services) - 1 and any(var.get() for var in self.services[idx].values()):
+            self.add_service_row()
+
+    def schedule_totals(self):
+        if self.totals_job is not None:
+            self.after_cancel(self.totals_job)
+        self.totals_job = self.after(TOTALS_DEBOUNCE_MS, self.update_totals)
+
+    @traced("gui.main.update_totals")
+    def update_totals(self):
+        # Rows with an invalid number show 0.00 and count as zero
+        self.totals_job = None
+        pairs = []
+        for service in self.services:
+            try:
+                pairs.append((to_decimal(service["qty"].get()), to_decimal(service["price"].get())))
+            except ValueError:
+                pairs.append((0, 0))
         try:
-            qty = float(self.services[idx]["qty"].get() or 0)
-            price = float(self.services[idx]["price"].get() or 0)
-            total = qty * price
-            self.service_totals[idx].set(f"{total:.2f}")
+            totals = compute_totals(pairs, self.tax_percent.get())
         except ValueError:
-            self.service_totals[idx].set("0.00")
-        
-        # Enable next row if current has content
-        if idx < 5 and any(var.get() for var in self.services[idx].values()):
-            next_row = idx + 1
-            for widget in self.service_rows[next_row]:
-                widget.configure(state="normal")
+            totals = compute_totals(pairs)
+        for total_var, line_total in zip(self.service_totals, totals.line_totals):
+            total_var.set(f"{line_total:.2f}")
+        self.totals_text.set(f"Subtotal: {totals.subtotal:.2f}   Tax: {totals.tax:.2f}   "
+                             f"Total: {totals.total:.2f}")
 
     def generate_invoice(self):
-        placeholders = {
-            "[invoice_id]": generate_id(),
-            "[date_time]": datetime.now().strftime("%Y-%m-%d %H:%M"),
-            "[client_name]": self.client_vars["name"].get(),
-            "[client_email]": self.client_vars["email"].get(),
-            "[client_phone]": self.client_vars["phone"].get(),
-            "[client_adress]": self.client_vars["address"].get(),
-            "[business_name]": self.business_info["name"],
-            "[business_email]": self.business_info["email"],
-            "[business_phone]": self.business_info["phone"],
-            "[business_adress]": self.business_info["address"],
-            "[tax_%]": self.tax_percent.get(),
-            "[payment_method]": self.payment_vars["method"].get(),
-            "[payment_entity]": self.payment_vars["entity"].get(),
-            "[payment_name]": self.payment_vars["name"].get(),
-            "[payment_number]": self.payment_vars["number"].get(),
-        }
-
-        subtotal = sum(float(self.services[i]["qty"].get() or 0) * 
-                     float(self.services[i]["price"].get() or 0) for i in range(6))
-
-        for i in range(6):
-            qty = float(self.services[i]["qty"].get() or 0)
-            price = float(self.services[i]["price"].get() or 0)
-            placeholders[f"[service{i+1}]"] = self.services[i]["desc"].get()
-            placeholders[f"[s{i+1}num]"] = f"{qty:.2f}"
-            placeholders[f"[s{i+1}pri]"] = f"{price:.2f}"
-            placeholders[f"[s{i+1}sum]"] = f"{qty*price:.2f}"
-
-        tax_percent = float(self.tax_percent.get() or 0)
-        iva = subtotal * (tax_percent / 100)
-        placeholders["[iva]"] = f"{iva:.2f}"
-        placeholders["[total_iva]"] = f"{subtotal + iva:.2f}"
+        client = {field: var.get() for field, var in self.client_vars.items()}
+        payment = {field: var.get() for field, var in self.payment_vars.items()}
+        lines = [(service["desc"].get(), service["qty"].get(), service["price"].get())
+                 for service in self.get_line_items()]
+        try:
+            placeholders, items, invoice_data = build_invoice(
+                client, lines, self.tax_percent.get(), payment, self.business_info,
+                payment_terms_days=self.payment_terms.get())
+        except ValueError as e:
+            messagebox.showerror("Error", f"Check quantities, prices, tax and payment terms:\n{str(e)}")
+            return
 
+        renderer = self.get_renderer()
         try:
-            doc = Document(self.config_data["template_path"])
+            renderer.load_template()
         except FileNotFoundError:
             messagebox.showerror("Error", f"Template file not found at {self.config_data['template_path']}")
             return
 
-        for p in doc.paragraphs:
-            for key, value in placeholders.items():
-                if key in p.text:
-                    p.text = p.text.replace(key, value)
-
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for p in cell.paragraphs:
-                        for key, value in placeholders.items():
-                            if key in p.text:
-                                p.text = p.text.replace(key, value)
-
-        temp_doc = "temp_invoice.docx"
-        doc.save(temp_doc)
-
         output_path = filedialog.asksaveasfilename(
             defaultextension=".pdf",
             filetypes=[("PDF Files", "*.pdf"), ("All Files", "*.*")],
@@ -328,81 +448,144 @@ class InvoiceApp(ctk.CTk):
         )
 
         if output_path:
+            # Rendering and saving happen on a worker; the panel reports progress
+            self.render_queue.submit(renderer, placeholders, output_path, invoice_data, items)
+
+    def make_recurring(self):
+        client_id = self.current_client_id.get()
+        if not client_id:
+            messagebox.showerror("Error", "Select a saved client first")
+            return
+        client = {field: var.get() for field, var in self.client_vars.items()}
+        payment = {field: var.get() for field, var in self.payment_vars.items()}
+        lines = [(service["desc"].get(), service["qty"].get(), service["price"].get())
+                 for service in self.get_line_items()]
+        try:
+            # Same checks as a one-off invoice, so a bad definition can't wait for the scheduler
+            build_invoice(client, lines, self.tax_percent.get(), payment, self.business_info)
+        except ValueError as e:
+            messagebox.showerror("Error", f"Check quantities, prices and tax:\n{str(e)}")
+            return
+
+        dialog = RecurringDialog(self, client["name"])
+        self.wait_window(dialog)
+        if dialog.result is None:
+            return
+        cadence, first_run = dialog.result
+        try:
+            RecurringDB.add_definition(client_id, lines, self.tax_percent.get(), cadence, first_run, payment)
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        messagebox.showinfo("Success", f"{client['name']} will be billed {cadence} from {first_run}")
+        if first_run <= date.today().isoformat():
+            self.start_daily_jobs(date.today(), False, True)
+
+    def run_daily_jobs(self, reschedule=True):
+        # Runs once per day on a worker; changed invoices reach the viewer as events.
+        # A run that fails is tried again at the next check.
+        today = date.today()
+        if self.daily_jobs_ran_on != today and not self.daily_jobs_running:
+            self.daily_jobs_running = True
+            self.start_daily_jobs(today, True, app_config.get("recurring_auto_run", True))
+        if reschedule:
+            self.after(DAILY_JOBS_CHECK_MS, self.run_daily_jobs)
+
+    def start_daily_jobs(self, today, sweep_overdue, generate_recurring):
+        def work():
+            ok, problems = self.daily_jobs(today, sweep_overdue, generate_recurring)
+            self.daily_jobs_results.put((today, sweep_overdue, ok, problems))
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def check_daily_jobs(self):
+        try:
+            today, full_run, ok, problems = self.daily_jobs_results.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            if full_run:
+                self.daily_jobs_running = False
+                if ok:
+                    self.daily_jobs_ran_on = today
+            if problems:
+                retry = "" if ok else "\n\nThis will be tried again in a few minutes."
+                messagebox.showwarning("Daily Jobs", "\n".join(problems) + retry)
+        self.after(CONFIG_POLL_MS, self.check_daily_jobs)
+
+    @staticmethod
+    def daily_jobs(today, sweep_overdue, generate_recurring):
+        """Returns (ok, problems); ok is False when a job failed outright and should run again"""
+        ok, problems = True, []
+        if sweep_overdue:
+            try:
+                InvoiceDB.mark_overdue(today.isoformat())
+            except Exception as e:
+                ok = False
+                problems.append(f"Error marking overdue invoices: {str(e)}")
+        if generate_recurring:
             try:
-                convert(temp_doc, output_path)
-                invoice_data = {
-                    'invoice_id': placeholders['[invoice_id]'],
-                    'client_name': placeholders['[client_name]'],
-                    'client_email': placeholders['[client_email]'],
-                    'client_phone': placeholders['[client_phone]'],
-                    'client_address': placeholders['[client_adress]'],
-                    'total_amount': float(placeholders['[total_iva]']),
-                    'tax_amount': float(placeholders['[iva]']),
-                    'invoice_date': placeholders['[date_time]'],
-                    'payment_method': placeholders['[payment_method]'],
-                    'payment_entity': placeholders['[payment_entity]']
-                }
-                InvoiceDB.save_invoice(invoice_data)
-                messagebox.showinfo("Success", f"Invoice saved to:\n{output_path}")
+                result = RecurringScheduler(render_workers=1).run(today)
+                problems += [f"Recurring invoice {definition_id}: {message}"
+                             for definition_id, message in result.errors]
             except Exception as e:
-                messagebox.showerror("Error", f"Failed to generate PDF:\n{str(e)}")
-            finally:
-                os.remove(temp_doc)
+                ok = False
+                problems.append(f"Error generating recurring invoices: {str(e)}")
+        return ok, problems
+
+    def check_maintenance(self):
+        try:
+            message = self.maintenance_problems.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            messagebox.showwarning("Database Problem", f"{message}\n\nClose the app and restore a backup with "
+                                                       "python -m invoice_maker backup --restore latest")
+        try:
+            message = ClientDB.repairs.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            messagebox.showwarning("Clients Recovered", message)
+        self.after(CONFIG_POLL_MS, self.check_maintenance)
+
+    def get_renderer(self):
+        # Reuse the renderer (and its cached template) until the path changes
+        template_path = self.config_data["template_path"]
+        if self.renderer is None or self.renderer.template_path != template_path:
+            self.renderer = InvoiceRenderer(template_path)
+        return self.renderer
+
+    def destroy(self):
+        self.event_listener.close()
+        self.maintenance.stop()
+        self.render_queue.shutdown()
+        super().destroy()
 
     def open_viewer(self):
         InvoiceViewer(self)
 
+    def open_diagnostics(self):
+        DiagnosticsWindow.show(self)
+
     def open_settings(self):
         settings_window = SettingsWindow(self)
         self.wait_window(settings_window)
         self.load_config()
         self.configure_styles()
 
+    @traced("gui.main.configure_styles")
     def configure_styles(self):
-        # Configure theme colors for the main window
-        self.configure(fg_color=self.color_scheme.get("background", "#ffffff"))
-        
-        # Define a recursive function to update all widgets
-        def update_widget_styles(widget):
-            if isinstance(widget, ctk.CTkFrame):
-                widget.configure(fg_color=self.color_scheme.get("surface", "#f0f0f0"))
-            elif isinstance(widget, ctk.CTkButton):
-                widget.configure(
-                    fg_color=self.color_scheme.get("primary", "#1f538d"),
-                    hover_color=self.color_scheme.get("primary_dark", "#14375e"),
-                    text_color=self.color_scheme.get("text", "#000000") if self.theme_mode.get() == "dark" else "white"
-                )
-            elif isinstance(widget, ctk.CTkLabel):
-                widget.configure(text_color=self.color_scheme.get("text", "#000000"))
-            elif isinstance(widget, ctk.CTkEntry):
-                widget.configure(
-                    fg_color=self.color_scheme.get("surface", "#f0f0f0"),
-                    text_color=self.color_scheme.get("text", "#000000"),
-                    border_color=self.color_scheme.get("secondary", "#8D99AE")
-                )
-            elif isinstance(widget, ctk.CTkOptionMenu):
-                widget.configure(
-                    fg_color=self.color_scheme.get("primary", "#1f538d"),
-                    button_color=self.color_scheme.get("primary_dark", "#14375e"),
-                    button_hover_color=self.color_scheme.get("secondary", "#8D99AE"),
-                    text_color=self.color_scheme.get("text", "#000000") if self.theme_mode.get() == "dark" else "white",
-                    dropdown_fg_color=self.color_scheme.get("surface", "#f0f0f0"),
-                    dropdown_text_color=self.color_scheme.get("text", "#000000"),
-                    dropdown_hover_color=self.color_scheme.get("secondary", "#8D99AE")
-                )
-            
-            # Recursively update all children
-            if hasattr(widget, 'winfo_children'):
-                for child in widget.winfo_children():
-                    update_widget_styles(child)
-        
-        # Apply styles to all widgets
-        for widget in self.winfo_children():
-            update_widget_styles(widget)
-            
-        # Update client combobox dropdown text color
-        if hasattr(self, 'client_cb'):
-            self.client_cb.configure(dropdown_text_color=self.color_scheme.get("text", "#000000"))
+        # Style maps are cached per theme; only changed properties are applied
+        theme_engine.apply(self.theme_mode.get(), self.color_scheme)
+
+        # The client picker's dropdown is a plain Tk listbox
+        if hasattr(self, 'client_picker'):
+            self.client_picker.set_colors(
+                self.color_scheme.get("surface", "#f0f0f0"),
+                self.color_scheme.get("text", "#000000"),
+                self.color_scheme.get("primary", "#1f538d")
+            )
 
     def toggle_theme(self):
         # Toggle between light and dark themes
@@ -417,9 +600,6 @@ class InvoiceApp(ctk.CTk):
             from .theme import apply_theme as set_theme
             self.color_scheme = set_theme(theme, self.config_data)
             
-            # Update the theme mode in app_config
-            app_config['theme_mode'] = theme
-            
             # Update CustomTkinter appearance mode
             ctk.set_appearance_mode(theme)
             
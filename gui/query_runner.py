@@ -0,0 +1,87 @@
+import queue
+import sqlite3
+import threading
+from db import InvoiceDB
+
+POLL_INTERVAL_MS = 30
+
+
+class QueryRunner:
+    """Runs InvoiceDB reads on a background thread for a Tk window.
+
+    Requests belong to a generation. Starting a new generation (e.g. when a
+    filter changes) interrupts the query that is currently executing and
+    drops every older request and result, so only the latest view is ever
+    fetched and shown. Callbacks run on the Tk thread. Requests submitted
+    with keep=True (e.g. for an export) outlive new generations.
+    """
+
+    def __init__(self, widget):
+        self.widget = widget
+        self.generation = 0
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+        self._conn = None
+        self._conn_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+        self.widget.after(POLL_INTERVAL_MS, self._poll)
+
+    def new_generation(self):
+        self.generation += 1
+        with self._conn_lock:
+            if self._conn is not None:
+                self._conn.interrupt()
+        return self.generation
+
+    def submit(self, func, args, callback, keep=False):
+        """Call func(*args, conn=...) on the worker, then callback(result) on the Tk thread"""
+        self._requests.put((None if keep else self.generation, func, args, callback))
+
+    def _current(self, generation):
+        return generation is None or generation == self.generation
+
+    def close(self):
+        self._closed = True
+        self.new_generation()
+        self._requests.put(None)
+
+    def _worker(self):
+        conn = InvoiceDB.connect(check_same_thread=False)
+        with self._conn_lock:
+            self._conn = conn
+        try:
+            while True:
+                request = self._requests.get()
+                if request is None:
+                    break
+                generation, func, args, callback = request
+                while self._current(generation):
+                    try:
+                        result = func(*args, conn=conn)
+                    except sqlite3.OperationalError as e:
+                        if "interrupted" in str(e):
+                            # Kept requests are run again; others belong to an old view
+                            continue
+                        result = e
+                    except Exception as e:
+                        result = e
+                    self._results.put((generation, callback, result))
+                    break
+        finally:
+            with self._conn_lock:
+                self._conn = None
+            conn.close()
+
+    def _poll(self):
+        if self._closed:
+            return
+        while True:
+            try:
+                generation, callback, result = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if self._current(generation):
+                callback(result)
+        self.widget.after(POLL_INTERVAL_MS, self._poll)
@@ -0,0 +1,143 @@
+import customtkinter as ctk
+import queue
+import threading
+from tkinter import filedialog, messagebox
+from config import app_config
+from db import InvoiceDB
+from reconcile import (AMOUNT, FUZZY, REFERENCE, UNMATCHED, accepted_ids, read_review,
+                       reconcile, summarize, write_review)
+from .theme import setup_theme
+
+POLL_INTERVAL_MS = 50
+METHOD_LABELS = {REFERENCE: "ID in reference", AMOUNT: "unique amount", FUZZY: "name/date", UNMATCHED: "no match"}
+
+
+class ReconcileWindow(ctk.CTkToplevel):
+    """Match a bank statement to open invoices and mark the confirmed ones paid"""
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.title("Reconcile Bank Statement")
+        self.geometry("1000x600")
+        self.theme = setup_theme(app_config)
+        self.transient(parent)
+        self.matches = []
+        self.results = queue.Queue()
+
+        controls = ctk.CTkFrame(self, **self.theme["frame"])
+        controls.pack(fill="x", padx=10, pady=(10, 0))
+        ctk.CTkButton(controls, text="Open Statement...", command=self.open_statement,
+                      **self.theme["button"]).pack(side="left", padx=5, pady=5)
+        self.apply_button = ctk.CTkButton(controls, text="Mark Confirmed Paid", command=self.apply_confirmed,
+                                          state="disabled", **self.theme["button"])
+        self.apply_button.pack(side="left", padx=5, pady=5)
+        self.review_button = ctk.CTkButton(controls, text="Save Review File...", command=self.save_review,
+                                           state="disabled", **self.theme["button"])
+        self.review_button.pack(side="left", padx=5, pady=5)
+        ctk.CTkButton(controls, text="Apply Review File...", command=self.apply_review,
+                      **self.theme["button"]).pack(side="left", padx=5, pady=5)
+        self.status_label = ctk.CTkLabel(controls, text="", font=('Inter', 14))
+        self.status_label.pack(side="left", padx=10)
+
+        self.textbox = ctk.CTkTextbox(self, font=("Courier", 13), wrap="none")
+        self.textbox.pack(fill="both", expand=True, padx=10, pady=10)
+
+    def open_statement(self):
+        path = filedialog.askopenfilename(
+            parent=self,
+            title="Open Bank Statement",
+            filetypes=[("Bank statements", "*.csv *.txt *.xml"), ("All Files", "*.*")]
+        )
+        if not path:
+            return
+        self.status_label.configure(text="Matching...")
+        self.apply_button.configure(state="disabled")
+        self.review_button.configure(state="disabled")
+
+        def run():
+            try:
+                self.results.put(reconcile(path))
+            except Exception as e:
+                self.results.put(e)
+
+        threading.Thread(target=run, daemon=True).start()
+        self.after(POLL_INTERVAL_MS, self.poll_results)
+
+    def poll_results(self):
+        try:
+            result = self.results.get_nowait()
+        except queue.Empty:
+            self.after(POLL_INTERVAL_MS, self.poll_results)
+            return
+        if isinstance(result, Exception):
+            self.status_label.configure(text="")
+            messagebox.showerror("Error", f"Could not read the statement:\n{str(result)}", parent=self)
+            return
+        self.matches = result
+        self.show_matches()
+
+    def show_matches(self):
+        counts = summarize(self.matches)
+        confirmed = accepted_ids(self.matches)
+        self.status_label.configure(text=f"{len(self.matches)} payments, {len(confirmed)} confirmed, "
+                                         f"{counts.get(FUZZY, 0)} to review, {counts.get(UNMATCHED, 0)} unmatched")
+        self.apply_button.configure(state="normal" if confirmed else "disabled",
+                                    text=f"Mark {len(confirmed)} Confirmed Paid")
+        self.review_button.configure(state="normal" if self.matches else "disabled")
+
+        lines = [f"{'line':>6}  {'date':<10}  {'amount':>12}  {'invoice':<18}  {'matched by':<16}  reference"]
+        for match in self.matches:
+            line = match.line
+            invoice_id = match.invoice.invoice_id if match.invoice else "-"
+            method = METHOD_LABELS[match.method] + (" (!)" if match.note else "")
+            lines.append(f"{line.line_no:>6}  {line.date.isoformat() if line.date else '':<10}  "
+                         f"{line.amount:>12.2f}  {invoice_id:<18}  {method:<16}  {line.reference[:60]}")
+            if match.note:
+                lines.append(f"{'':>6}  {match.note}")
+        self.textbox.configure(state="normal")
+        self.textbox.delete("1.0", "end")
+        self.textbox.insert("1.0", "\n".join(lines))
+        self.textbox.configure(state="disabled")
+
+    def apply_confirmed(self):
+        confirmed = accepted_ids(self.matches)
+        if not messagebox.askyesno("Confirm", f"Mark {len(confirmed)} invoices as paid?", parent=self):
+            return
+        self.mark_paid(confirmed)
+
+    def save_review(self):
+        path = filedialog.asksaveasfilename(
+            parent=self,
+            defaultextension=".csv",
+            initialfile="reconciliation_review.csv",
+            filetypes=[("CSV Files", "*.csv")],
+            title="Save Review File"
+        )
+        if path:
+            write_review(self.matches, path)
+            messagebox.showinfo("Saved", "Set the accept column to yes or no, then use Apply Review File",
+                                parent=self)
+
+    def apply_review(self):
+        path = filedialog.askopenfilename(parent=self, title="Apply Review File",
+                                          filetypes=[("CSV Files", "*.csv")])
+        if path:
+            try:
+                invoice_ids = read_review(path)
+            except (OSError, KeyError) as e:
+                messagebox.showerror("Error", f"Could not read the review file:\n{str(e)}", parent=self)
+                return
+            self.mark_paid(invoice_ids)
+
+    def mark_paid(self, invoice_ids):
+        try:
+            paid = InvoiceDB.mark_paid(invoice_ids)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to update invoices:\n{str(e)}", parent=self)
+            return
+        skipped = len(set(invoice_ids)) - len(paid)
+        message = f"{len(paid)} invoices marked paid"
+        if skipped:
+            message += f"; {skipped} were already paid or no longer exist"
+        messagebox.showinfo("Done", message, parent=self)
+        self.apply_button.configure(state="disabled")
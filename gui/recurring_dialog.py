@@ -0,0 +1,52 @@
+import customtkinter as ctk
+from datetime import date
+from tkinter import messagebox
+from config import app_config
+from db import CADENCES
+from .theme import setup_theme
+
+
+class RecurringDialog(ctk.CTkToplevel):
+    """Ask how often the current invoice repeats and when it is first billed"""
+
+    def __init__(self, parent, client_name):
+        super().__init__(parent)
+        self.title("Make Recurring")
+        self.result = None
+        self.theme = setup_theme(app_config)
+        self.transient(parent)
+        self.grab_set()
+
+        main_frame = ctk.CTkFrame(self, **self.theme["frame"])
+        main_frame.pack(fill="both", expand=True, padx=20, pady=20)
+        ctk.CTkLabel(main_frame, text=f"Bill {client_name} automatically",
+                     font=('Inter', 14, 'bold')).pack(pady=(0, 10))
+
+        row_frame = ctk.CTkFrame(main_frame, **self.theme["frame"])
+        row_frame.pack(fill="x", pady=4)
+        ctk.CTkLabel(row_frame, text="Every:", width=100, anchor="e").pack(side="left")
+        self.cadence_var = ctk.StringVar(value="monthly")
+        ctk.CTkOptionMenu(row_frame, values=list(CADENCES), variable=self.cadence_var).pack(
+            side="left", fill="x", expand=True, padx=5)
+
+        row_frame = ctk.CTkFrame(main_frame, **self.theme["frame"])
+        row_frame.pack(fill="x", pady=4)
+        ctk.CTkLabel(row_frame, text="First invoice:", width=100, anchor="e").pack(side="left")
+        self.first_run_entry = ctk.CTkEntry(row_frame, **self.theme["entry"])
+        self.first_run_entry.insert(0, date.today().isoformat())
+        self.first_run_entry.pack(side="left", fill="x", expand=True, padx=5)
+
+        btn_frame = ctk.CTkFrame(main_frame, **self.theme["frame"])
+        btn_frame.pack(pady=10)
+        ctk.CTkButton(btn_frame, text="Save", command=self.save, **self.theme["button"]).pack(side="left", padx=5)
+        ctk.CTkButton(btn_frame, text="Cancel", command=self.destroy, **self.theme["button"]).pack(side="left")
+
+    def save(self):
+        first_run = self.first_run_entry.get().strip()
+        try:
+            date.fromisoformat(first_run)
+        except ValueError:
+            messagebox.showerror("Error", "First invoice date must be YYYY-MM-DD")
+            return
+        self.result = (self.cadence_var.get(), first_run)
+        self.destroy()
@@ -0,0 +1,73 @@
+import customtkinter as ctk
+from tkinter import messagebox
+from render_queue import FAILED
+from .theme import theme_engine
+
+POLL_INTERVAL_MS = 150
+MAX_FINISHED_ROWS = 10
+
+
+class RenderQueuePanel(ctk.CTkFrame):
+    """Small panel listing queued, running and finished render jobs"""
+
+    def __init__(self, parent, render_queue, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.render_queue = render_queue
+        self.rows = {}
+        self.finished_order = []
+
+        ctk.CTkLabel(self, text="Render Jobs", font=('Inter', 16, 'bold')).pack(pady=5)
+        self.empty_label = ctk.CTkLabel(self, text="No jobs yet", font=('Inter', 12))
+        self.empty_label.pack(pady=2)
+        self.rows_frame = ctk.CTkFrame(self, fg_color="transparent")
+        self.rows_frame.pack(fill="x", padx=5)
+
+        self.after(POLL_INTERVAL_MS, self.poll)
+
+    def poll(self):
+        for job in self.render_queue.poll():
+            self.update_row(job)
+            if job.status == FAILED:
+                messagebox.showerror("Error", f"Failed to generate {job.invoice_id}:\n{job.error}")
+        self.after(POLL_INTERVAL_MS, self.poll)
+
+    def update_row(self, job):
+        if job.job_id not in self.rows:
+            self.rows[job.job_id] = self.create_row(job)
+            self.empty_label.pack_forget()
+        row = self.rows[job.job_id]
+
+        progress = job.progress
+        if job.cancel_requested and not job.finished:
+            progress = "Cancelling..."
+        row["status"].configure(text=progress)
+
+        if job.finished or job.committed:
+            row["cancel"].configure(state="disabled")
+        if job.finished:
+            if job.job_id not in self.finished_order:
+                self.finished_order.append(job.job_id)
+                self.prune_finished()
+
+    def create_row(self, job):
+        frame = ctk.CTkFrame(self.rows_frame)
+        frame.pack(fill="x", pady=1)
+        ctk.CTkLabel(frame, text=job.invoice_id, font=('Inter', 12), width=140, anchor="w").pack(side="left", padx=2)
+        status = ctk.CTkLabel(frame, text="", font=('Inter', 12), anchor="w")
+        status.pack(side="left", fill="x", expand=True, padx=2)
+        cancel = ctk.CTkButton(frame, text="✕", width=28, font=('Inter', 12),
+                               command=lambda job_id=job.job_id: self.cancel_job(job_id))
+        cancel.pack(side="right", padx=2)
+        theme_engine.register_tree(frame)
+        return {"frame": frame, "status": status, "cancel": cancel}
+
+    def cancel_job(self, job_id):
+        if self.render_queue.cancel(job_id):
+            self.update_row(self.render_queue.jobs[job_id])
+
+    def prune_finished(self):
+        # Keep only the most recent finished jobs on screen
+        while len(self.finished_order) > MAX_FINISHED_ROWS:
+            job_id = self.finished_order.pop(0)
+            self.rows.pop(job_id)["frame"].destroy()
+            self.render_queue.forget(job_id)
@@ -7,7 +7,8 @@ class SettingsWindow(ctk.CTkToplevel):
     def __init__(self, parent):
         super().__init__(parent)
         self.title("Application Settings")
-        self.config = app_config.copy()
+        # Edits go to a private copy until Save writes them to the shared store
+        self.config = app_config.snapshot()
         self.theme = setup_theme(app_config)
         # Make window stay on top
         self.transient(parent)
@@ -150,13 +151,13 @@ class SettingsWindow(ctk.CTkToplevel):
         else:
             path = filedialog.asksaveasfilename()
         if path:
-            entry.delete(0, tk.END)
+            entry.delete(0, "end")
             entry.insert(0, path)
 
     def pick_color(self, entry):
         color = colorchooser.askcolor(title="Choose color", initialcolor=entry.get())
         if color[1]:
-            entry.delete(0, tk.END)
+            entry.delete(0, "end")
             entry.insert(0, color[1])
 
     def reset_color_schemes(self):
@@ -199,13 +200,8 @@ class SettingsWindow(ctk.CTkToplevel):
         for key in biz_keys:
             self.config["business_info"][key] = getattr(self, f"business_info_{key}_entry").get()
 
-        # Save theme mode and apply it immediately
         new_theme = self.theme_mode_var.get()
         self.config["theme_mode"] = new_theme
-        
-        # Apply the new theme immediately
-        ctk.set_appearance_mode(new_theme)
-        self.master.apply_theme(new_theme)
 
         # Save color scheme for both themes
         color_keys = ["background", "surface", "primary", "secondary", "text", "highlight"]
@@ -214,6 +210,10 @@ class SettingsWindow(ctk.CTkToplevel):
                 self.config["color_scheme"][theme][key] = getattr(self, f"color_scheme_{theme}_{key}_entry").get()
 
         ConfigHandler.save_config(self.config)
+
+        # Apply the new theme immediately, now that the shared config has it
+        ctk.set_appearance_mode(new_theme)
+        self.master.apply_theme(new_theme)
         messagebox.showinfo("Settings Saved", 
                           "Some changes may require application restart to take effect")
         self.destroy()
\ No newline at end of file
@@ -1,26 +1,53 @@
+import weakref
+from types import MappingProxyType
 import customtkinter as ctk
 from config import app_config as config, ConfigHandler
+from tracing import traced
 
-def setup_theme(config):
-    # Configure global CustomTkinter theme
-    theme_mode = config.get("theme_mode", "light")
-    ctk.set_appearance_mode(theme_mode)
-    ctk.set_default_color_theme("blue")
-    
-    # Configure custom colors
+_default_color_theme_set = False
+# (theme_mode, color scheme items) -> frozen style maps
+_style_cache = {}
+
+
+def _freeze(styles):
+    return MappingProxyType({key: MappingProxyType(value) if isinstance(value, dict) else value
+                             for key, value in styles.items()})
+
+
+def _scheme_key(theme_mode, color_scheme):
+    return theme_mode, tuple(sorted(color_scheme.items()))
+
+
+def resolve_color_scheme(config, theme_mode):
     if theme_mode in config["color_scheme"]:
-        color_scheme = config["color_scheme"][theme_mode]
+        color_scheme = dict(config["color_scheme"][theme_mode])
     else:
         # Fallback to light theme if the requested theme is not available
-        color_scheme = config["color_scheme"]["light"]
-    
+        color_scheme = dict(config["color_scheme"]["light"])
     # Add derived colors if they don't exist
     if "primary_dark" not in color_scheme:
-        if theme_mode == "dark":
-            color_scheme["primary_dark"] = darken_color(color_scheme["primary"])
-        else:
-            color_scheme["primary_dark"] = darken_color(color_scheme["primary"])
-    
+        color_scheme["primary_dark"] = darken_color(color_scheme["primary"])
+    return color_scheme
+
+
+def setup_theme(config):
+    """Return the style dicts for Toplevel windows, cached per theme and colors"""
+    global _default_color_theme_set
+    # Configure global CustomTkinter theme
+    theme_mode = config.get("theme_mode", "light")
+    ctk.set_appearance_mode(theme_mode)
+    if not _default_color_theme_set:
+        ctk.set_default_color_theme("blue")
+        _default_color_theme_set = True
+
+    color_scheme = resolve_color_scheme(config, theme_mode)
+    key = ("windows",) + _scheme_key(theme_mode, color_scheme)
+    if key not in _style_cache:
+        _style_cache[key] = _freeze(_build_window_styles(theme_mode, color_scheme))
+    return _style_cache[key]
+
+
+def _build_window_styles(theme_mode, color_scheme):
     # Define custom button styles
     button_style = {
         "fg_color": color_scheme["primary"],
@@ -66,6 +93,118 @@ def setup_theme(config):
     }
 
 
+def _build_widget_styles(theme_mode, color_scheme):
+    """Per-widget-type properties applied to the main window on theme changes"""
+    contrast_text = color_scheme.get("text", "#000000") if theme_mode == "dark" else "white"
+    return {
+        "window": {
+            "fg_color": color_scheme.get("background", "#ffffff"),
+        },
+        "frame": {
+            "fg_color": color_scheme.get("surface", "#f0f0f0"),
+        },
+        "button": {
+            "fg_color": color_scheme.get("primary", "#1f538d"),
+            "hover_color": color_scheme.get("primary_dark", "#14375e"),
+            "text_color": contrast_text,
+        },
+        "label": {
+            "text_color": color_scheme.get("text", "#000000"),
+        },
+        "entry": {
+            "fg_color": color_scheme.get("surface", "#f0f0f0"),
+            "text_color": color_scheme.get("text", "#000000"),
+            "border_color": color_scheme.get("secondary", "#8D99AE"),
+        },
+        "optionmenu": {
+            "fg_color": color_scheme.get("primary", "#1f538d"),
+            "button_color": color_scheme.get("primary_dark", "#14375e"),
+            "button_hover_color": color_scheme.get("secondary", "#8D99AE"),
+            "text_color": contrast_text,
+            "dropdown_fg_color": color_scheme.get("surface", "#f0f0f0"),
+            "dropdown_text_color": color_scheme.get("text", "#000000"),
+            "dropdown_hover_color": color_scheme.get("secondary", "#8D99AE"),
+        },
+    }
+
+
+def widget_kind(widget):
+    if isinstance(widget, (ctk.CTk, ctk.CTkToplevel)):
+        return "window"
+    if isinstance(widget, ctk.CTkFrame):
+        return "frame"
+    if isinstance(widget, ctk.CTkButton):
+        return "button"
+    if isinstance(widget, ctk.CTkLabel):
+        return "label"
+    if isinstance(widget, ctk.CTkEntry):
+        return "entry"
+    if isinstance(widget, ctk.CTkOptionMenu):
+        return "optionmenu"
+    return None
+
+
+class ThemeEngine:
+    """Applies cached per-theme style maps to registered widgets.
+
+    Style maps are computed once per (theme, colors) and frozen. Widgets
+    register when they are created; switching themes diffs the old and new
+    map for each widget type and configures only the properties that
+    actually change, instead of walking and restyling the whole tree.
+    """
+
+    def __init__(self):
+        self._widgets = {}
+        self._active = None
+
+    def styles_for(self, theme_mode, color_scheme):
+        key = ("widgets",) + _scheme_key(theme_mode, color_scheme)
+        if key not in _style_cache:
+            _style_cache[key] = _freeze(_build_widget_styles(theme_mode, color_scheme))
+        return _style_cache[key]
+
+    def register(self, widget):
+        kind = widget_kind(widget)
+        if kind is None:
+            return
+        self._widgets.setdefault(kind, weakref.WeakSet()).add(widget)
+        if self._active is not None:
+            self._configure(widget, self._active[kind])
+
+    def register_tree(self, widget):
+        """Register a widget and all of its descendants (done once, at creation)"""
+        self.register(widget)
+        for child in widget.winfo_children():
+            self.register_tree(child)
+
+    @traced("gui.theme.apply")
+    def apply(self, theme_mode, color_scheme):
+        styles = self.styles_for(theme_mode, color_scheme)
+        previous = self._active
+        self._active = styles
+        if previous is styles:
+            return
+        for kind, widgets in self._widgets.items():
+            style = styles[kind]
+            if previous is not None:
+                old = previous[kind]
+                style = {key: value for key, value in style.items() if old.get(key) != value}
+            if not style:
+                continue
+            for widget in list(widgets):
+                self._configure(widget, style)
+
+    def _configure(self, widget, style):
+        try:
+            widget.configure(**style)
+        except Exception:
+            # The widget was destroyed; the WeakSet drops it once collected
+            self._widgets.get(widget_kind(widget), set()).discard(widget)
+
+
+theme_engine = ThemeEngine()
+
+
 def darken_color(hex_color, factor=0.7):
     """Darken a hex color by a factor (0-1)"""
     # Remove the # if present
@@ -102,6 +241,3 @@ def apply_theme(theme, config):
         config["theme_mode"] = "light"
         ConfigHandler.save_config(config)
         return config["color_scheme"]["light"]
-
-# Apply theme based on configuration
-apply_theme(config.get("theme_mode", "light"), config)
\ No newline at end of file
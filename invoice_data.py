@@ -0,0 +1,71 @@
+from datetime import datetime
+from config import app_config
+from db import due_date_for, generate_id
+from totals import invoice_placeholders
+
+# Ten years; anything longer is a typo
+MAX_PAYMENT_TERMS_DAYS = 3650
+
+
+def build_invoice(client, lines, tax_rate, payment, business_info, invoice_id=None, invoice_date=None,
+                  payment_terms_days=None):
+    """Turn form-like input into (placeholders, items, invoice_data).
+
+    client and payment are dicts with the GUI's field names, lines are
+    (description, quantity, unit_price) tuples. Raises ValueError for bad
+    numbers or an invoice_date that isn't an ISO date. invoice_data is
+    ready for InvoiceDB.save_invoice once the invoice has been rendered.
+    payment_terms_days defaults to the configured payment_terms_days.
+    """
+    items, totals_placeholders, totals = invoice_placeholders(lines, tax_rate)
+    if payment_terms_days in (None, ""):
+        payment_terms_days = app_config.get_int("payment_terms_days", 30)
+    try:
+        if isinstance(payment_terms_days, float) and not payment_terms_days.is_integer():
+            raise ValueError(payment_terms_days)
+        payment_terms_days = int(payment_terms_days)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"Invalid payment terms: {payment_terms_days!r} (expected whole days)")
+    if payment_terms_days < 0:
+        raise ValueError("Payment terms can't be negative")
+    if payment_terms_days > MAX_PAYMENT_TERMS_DAYS:
+        raise ValueError(f"Payment terms can't be longer than {MAX_PAYMENT_TERMS_DAYS} days")
+    invoice_date = invoice_date or datetime.now().strftime("%Y-%m-%d %H:%M")
+    try:
+        datetime.fromisoformat(str(invoice_date))
+    except ValueError:
+        raise ValueError(f"Invalid invoice date: {invoice_date!r} (expected YYYY-MM-DD or YYYY-MM-DD HH:MM)")
+    placeholders = {
+        "[invoice_id]": invoice_id or generate_id(),
+        "[date_time]": invoice_date,
+        "[due_date]": due_date_for(invoice_date, payment_terms_days),
+        "[client_name]": client.get("name", ""),
+        "[client_email]": client.get("email", ""),
+        "[client_phone]": client.get("phone", ""),
+        "[client_adress]": client.get("address", ""),
+        "[business_name]": business_info["name"],
+        "[business_email]": business_info["email"],
+        "[business_phone]": business_info["phone"],
+        "[business_adress]": business_info["address"],
+        "[tax_%]": str(tax_rate),
+        "[payment_method]": payment.get("method", ""),
+        "[payment_entity]": payment.get("entity", ""),
+        "[payment_name]": payment.get("name", ""),
+        "[payment_number]": payment.get("number", ""),
+    }
+    placeholders.update(totals_placeholders)
+    invoice_data = {
+        'invoice_id': placeholders['[invoice_id]'],
+        'client_name': placeholders['[client_name]'],
+        'client_email': placeholders['[client_email]'],
+        'client_phone': placeholders['[client_phone]'],
+        'client_address': placeholders['[client_adress]'],
+        'total_amount': float(totals.total),
+        'tax_amount': float(totals.tax),
+        'invoice_date': placeholders['[date_time]'],
+        'payment_method': placeholders['[payment_method]'],
+        'payment_entity': placeholders['[payment_entity]'],
+        'due_date': placeholders['[due_date]'],
+        'payment_terms_days': payment_terms_days
+    }
+    return placeholders, items, invoice_data
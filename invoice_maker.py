@@ -0,0 +1,48 @@
+"""Command line entry point.
+
+    python -m invoice_maker              open the app (same as python main.py)
+    python -m invoice_maker serve ...    run the local HTTP/JSON service
+    python -m invoice_maker recurring    generate due recurring invoices
+    python -m invoice_maker mail ...     deliver queued invoice emails
+    python -m invoice_maker overdue      mark overdue invoices, print the aging report
+    python -m invoice_maker reconcile    match a bank statement to open invoices
+    python -m invoice_maker jobs ...     run, list and resume batch imports and exports
+    python -m invoice_maker maintenance  analyze, vacuum and check the invoice database
+    python -m invoice_maker backup ...   snapshot, verify and restore the data files
+"""
+import sys
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "serve":
+        from service import main as serve
+        serve(argv[1:])
+    elif argv and argv[0] == "recurring":
+        from recurring import main as run_recurring
+        run_recurring(argv[1:])
+    elif argv and argv[0] == "mail":
+        from mailer import main as run_mailer
+        run_mailer(argv[1:])
+    elif argv and argv[0] == "overdue":
+        from overdue import main as run_overdue
+        run_overdue(argv[1:])
+    elif argv and argv[0] == "reconcile":
+        from reconcile import main as run_reconcile
+        run_reconcile(argv[1:])
+    elif argv and argv[0] == "jobs":
+        from jobs import main as run_jobs
+        run_jobs(argv[1:])
+    elif argv and argv[0] == "maintenance":
+        from maintenance import main as run_maintenance
+        run_maintenance(argv[1:])
+    elif argv and argv[0] == "backup":
+        from backup import main as run_backup
+        run_backup(argv[1:])
+    else:
+        from main import main as run_app
+        run_app(argv)
+
+
+if __name__ == "__main__":
+    main()
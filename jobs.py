@@ -0,0 +1,336 @@
+"""Long batch jobs that survive crashes and resume where they stopped.
+
+Every job is journaled in invoices.db (JobDB) with one unit per invoice.
+Units are worked through in chunks: the chunk's PDFs are rendered in one
+pass over a thread pool and recorded as rendered, then the invoice rows
+and the saved state are committed in the same transaction. A crash loses
+at most the chunk in flight, and resuming skips every unit already saved;
+rendered PDFs are found again in the render cache by their content hash.
+
+    python -m invoice_maker jobs import invoices.jsonl      create invoices from a file
+    python -m invoice_maker jobs export OUT_DIR --status paid
+    python -m invoice_maker jobs list
+    python -m invoice_maker jobs resume 7 [--retry-failed]
+
+An import file has one JSON invoice per line, in the HTTP service's format:
+{"client": {...}, "lines": [{"description", "quantity", "unit_price"}],
+"tax_rate", "payment": {...}, "invoice_date", "payment_terms_days",
+"invoice_id" (optional)}.
+"""
+import argparse
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from config import app_config
+from db import InvoiceDB, JobDB, generate_id
+from events import bus, INVOICE, CREATED
+from invoice_data import build_invoice
+from render_cache import RenderCache
+from render_queue import init_render_thread
+from renderer import InvoiceRenderer
+from tracing import span
+
+CHUNK_SIZE = 200
+
+# Unit states
+PENDING = "pending"
+RENDERED = "rendered"
+SAVED = "saved"
+FAILED = "failed"
+
+
+class JobRunner:
+    """Runs or resumes journaled jobs; handlers are looked up by job kind"""
+
+    def __init__(self, render_workers=2, chunk_size=CHUNK_SIZE, cache=None, progress=None):
+        self.render_workers = render_workers
+        self.chunk_size = chunk_size
+        self.cache = cache or RenderCache(
+            app_config.get_str("render_cache_dir", "render_cache"),
+            app_config.get_int("render_cache_max_mb", 500) * 1024 * 1024,
+        )
+        self.progress = progress
+        self.renderer = None
+
+    def get_renderer(self):
+        template_path = app_config["template_path"]
+        if self.renderer is None or self.renderer.template_path != template_path:
+            self.renderer = InvoiceRenderer(template_path)
+        return self.renderer
+
+    def render_all(self, jobs):
+        """Render {key: (placeholders, items)} into the cache in one pool pass; returns {key: error}"""
+        renderer = self.get_renderer()
+
+        def render_one(key):
+            placeholders, items = jobs[key]
+            try:
+                renderer.render_cached(self.cache, placeholders, items, key)
+                return None
+            except Exception as e:
+                return key, str(e)
+
+        with span("jobs.render", count=len(jobs)):
+            with ThreadPoolExecutor(max_workers=self.render_workers, initializer=init_render_thread) as pool:
+                return dict(failure for failure in pool.map(render_one, jobs) if failure)
+
+    def run(self, job_id, retry_failed=False):
+        """Work through the job's unfinished units; returns the job with final counts"""
+        job = JobDB.get_job(job_id)
+        handler_class = HANDLERS.get(job["kind"])
+        if handler_class is None:
+            raise ValueError(f"Unknown job kind {job['kind']!r}")
+        if retry_failed:
+            JobDB.retry_failed(job_id)
+        handler = handler_class(self, job["params"])
+        JobDB.set_status(job_id, "running")
+        after_seq = 0
+        try:
+            while True:
+                units = JobDB.next_units(job_id, after_seq, self.chunk_size)
+                if not units:
+                    break
+                with span("jobs.chunk", kind=job["kind"], count=len(units)):
+                    handler.process(job_id, units)
+                after_seq = units[-1]["seq"]
+                if self.progress:
+                    self.progress(job_id, after_seq, job["total"])
+        except BaseException:
+            # Problems that stop every unit (missing template, Ctrl+C) leave the job resumable
+            JobDB.set_status(job_id, "stopped")
+            raise
+        job = JobDB.get_job(job_id)
+        JobDB.set_status(job_id, "failed" if job["states"].get(FAILED) else "done")
+        return JobDB.get_job(job_id)
+
+
+class ImportInvoicesJob:
+    """Create invoices from JSON payloads: render each, then save row and state together"""
+
+    def __init__(self, runner, params):
+        self.runner = runner
+        self.render = params.get("render", True)
+
+    def process(self, job_id, units):
+        built = {}
+        updates = []
+        for unit in units:
+            payload = unit["payload"]
+            try:
+                placeholders, items, invoice_data = build_invoice(
+                    payload.get("client") or {}, [(line.get("description", ""), line.get("quantity"),
+                                                   line.get("unit_price")) for line in payload.get("lines", ())],
+                    payload.get("tax_rate", 0), payload.get("payment") or {}, app_config["business_info"],
+                    invoice_id=unit["unit_key"], invoice_date=payload.get("invoice_date"),
+                    payment_terms_days=payload.get("payment_terms_days"))
+            except (ValueError, TypeError, AttributeError) as e:
+                updates.append((unit["seq"], FAILED, None, str(e)))
+                continue
+            invoice_data["render_data"] = {"placeholders": placeholders, "items": list(items)}
+            if payload.get("status"):
+                invoice_data["status"] = payload["status"]
+            if self.render:
+                invoice_data["content_hash"] = self.runner.get_renderer().cache_key(placeholders, items)
+            built[unit["seq"]] = (unit, invoice_data)
+
+        if self.render:
+            to_render = {invoice_data["content_hash"]: (invoice_data["render_data"]["placeholders"],
+                                                        invoice_data["render_data"]["items"])
+                         for unit, invoice_data in built.values() if unit["state"] == PENDING}
+            failed = self.runner.render_all(to_render) if to_render else {}
+            rendered = []
+            for seq, (unit, invoice_data) in list(built.items()):
+                error = failed.get(invoice_data["content_hash"])
+                if error:
+                    updates.append((seq, FAILED, None, error))
+                    del built[seq]
+                elif unit["state"] == PENDING:
+                    rendered.append((seq, RENDERED, invoice_data["content_hash"], None))
+            JobDB.record_units(job_id, updates + rendered)
+            updates = []
+
+        def save(c):
+            created = InvoiceDB.insert_invoices(c, [invoice_data for _, invoice_data in built.values()],
+                                                skip_existing=True)
+            # Rows and states commit together, so an ID that was already taken
+            # belongs to another invoice rather than to an earlier attempt
+            inserted = set(created)
+            JobDB.update_units(c, job_id, updates + [
+                (seq, SAVED, None, None) if invoice_data["invoice_id"] in inserted
+                else (seq, FAILED, None, f"Invoice ID {invoice_data['invoice_id']} already exists")
+                for seq, (_, invoice_data) in built.items()])
+            return created
+
+        with span("jobs.save", count=len(built)):
+            created = InvoiceDB.run_write(save)
+        if created:
+            bus.publish(INVOICE, CREATED, created)
+
+
+class ExportPdfsJob:
+    """Write each invoice's PDF to params["output_dir"] as <invoice_id>.pdf"""
+
+    def __init__(self, runner, params):
+        self.runner = runner
+        self.output_dir = params["output_dir"]
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def process(self, job_id, units):
+        render_data = InvoiceDB.get_render_data_batch(unit["unit_key"] for unit in units)
+        renderer = self.runner.get_renderer()
+        updates = []
+        keys = {}
+        to_render = {}
+        for unit in units:
+            content_hash, data = render_data.get(unit["unit_key"], (None, None))
+            if not data:
+                updates.append((unit["seq"], FAILED, None, "No render data recorded for this invoice"))
+                continue
+            # The PDF recorded when the invoice was made, if the cache still has it
+            if content_hash and self.runner.cache.contains(content_hash):
+                key = content_hash
+            else:
+                key = renderer.cache_key(data["placeholders"], data.get("items", ()))
+            keys[unit["seq"]] = key
+            to_render[key] = (data["placeholders"], data.get("items", ()))
+        failed = self.runner.render_all(to_render) if to_render else {}
+
+        for unit in units:
+            key = keys.get(unit["seq"])
+            if key is None:
+                continue
+            if key in failed:
+                updates.append((unit["seq"], FAILED, None, failed[key]))
+                continue
+            target = os.path.join(self.output_dir, f"{unit['unit_key']}.pdf")
+            fd, tmp_path = tempfile.mkstemp(dir=self.output_dir, suffix=".tmp")
+            os.close(fd)
+            if self.runner.cache.fetch(key, tmp_path):
+                os.replace(tmp_path, target)
+                updates.append((unit["seq"], SAVED, key, None))
+            else:
+                os.remove(tmp_path)
+                updates.append((unit["seq"], FAILED, None, "PDF was evicted from the render cache"))
+        JobDB.record_units(job_id, updates)
+
+
+HANDLERS = {
+    "import_invoices": ImportInvoicesJob,
+    "export_pdfs": ExportPdfsJob,
+}
+
+
+def read_import_file(path, taken_ids):
+    """Yield (invoice_id, payload) per JSON line, assigning unused IDs to invoices without one.
+
+    Raises ValueError if two lines give the same invoice_id.
+    """
+    # Line each ID in this file came from; IDs already in the database fail later, per unit
+    file_ids = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                payload = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path} line {line_no}: {e}")
+            # Fixed now so a resumed run saves the same invoice, not a second one
+            invoice_id = payload.pop("invoice_id", None)
+            if not invoice_id:
+                invoice_id = generate_id()
+                while invoice_id in taken_ids:
+                    invoice_id = generate_id()
+            elif invoice_id in file_ids:
+                raise ValueError(f"{path} line {line_no}: invoice_id {invoice_id} "
+                                 f"is already used on line {file_ids[invoice_id]}")
+            file_ids[invoice_id] = line_no
+            taken_ids.add(invoice_id)
+            yield invoice_id, payload
+
+
+def print_progress(job_id, done_seq, total):
+    print(f"\rJob {job_id}: {done_seq}/{total}", end="", flush=True)
+
+
+def print_job(job):
+    states = ", ".join(f"{count} {state}" for state, count in sorted(job["states"].items()))
+    print(f"Job {job['id']} ({job['kind']}): {job['status']}, {job['total']} units: {states}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m invoice_maker jobs",
+                                     description="Run, list and resume journaled batch jobs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="create invoices from a JSON lines file")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--no-render", action="store_true", help="render PDFs on first download instead")
+    export_parser = commands.add_parser("export", help="write invoice PDFs to a folder")
+    export_parser.add_argument("output_dir")
+    export_parser.add_argument("--status")
+    export_parser.add_argument("--client")
+    export_parser.add_argument("--date-from")
+    export_parser.add_argument("--date-to")
+    commands.add_parser("list", help="show recent jobs")
+    show_parser = commands.add_parser("show", help="show a job's progress and failures")
+    show_parser.add_argument("job_id", type=int)
+    resume_parser = commands.add_parser("resume", help="continue a job's unfinished units")
+    resume_parser.add_argument("job_id", type=int)
+    resume_parser.add_argument("--retry-failed", action="store_true")
+    for command in (import_parser, export_parser, resume_parser):
+        command.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+        command.add_argument("--render-workers", type=int, default=2)
+    args = parser.parse_args(argv)
+
+    InvoiceDB.initialize()
+    if args.command == "list":
+        for job_id, kind, status, total, created_at, updated_at in JobDB.list_jobs():
+            print(f"{job_id:>5}  {kind:<16}  {status:<8}  {total:>8}  {updated_at[:19]}")
+        return
+    if args.command == "show":
+        job = JobDB.get_job(args.job_id)
+        print_job(job)
+        conn = InvoiceDB.connect()
+        try:
+            for unit_key, error in conn.execute(
+                    "SELECT unit_key, error FROM job_units WHERE job_id = ? AND state = 'failed' LIMIT 20",
+                    (args.job_id,)):
+                print(f"  {unit_key}: {error}")
+        finally:
+            conn.close()
+        return
+
+    if args.command == "import":
+        try:
+            job_id = JobDB.create_job("import_invoices", {"source": os.path.abspath(args.path),
+                                                          "render": not args.no_render},
+                                      read_import_file(args.path, InvoiceDB.get_invoice_ids()))
+        except ValueError as e:
+            # Nothing was recorded; the file needs fixing first
+            raise SystemExit(str(e))
+    elif args.command == "export":
+        filters = {"status": args.status, "client_name": args.client,
+                   "date_from": args.date_from, "date_to": args.date_to}
+        invoice_ids = [row[0] for row in InvoiceDB.get_invoices_page(filters, "invoice_date ASC")]
+        job_id = JobDB.create_job("export_pdfs", {"output_dir": os.path.abspath(args.output_dir)},
+                                  ((invoice_id, None) for invoice_id in invoice_ids))
+    else:
+        job_id = args.job_id
+    print(f"Job {job_id} started; if it stops, continue it with: python -m invoice_maker jobs resume {job_id}")
+    runner = JobRunner(args.render_workers, args.chunk_size, progress=print_progress)
+    try:
+        job = runner.run(job_id, retry_failed=getattr(args, "retry_failed", False))
+    except KeyboardInterrupt:
+        print(f"\nJob {job_id} stopped")
+        return
+    except (OSError, ValueError) as e:
+        print()
+        raise SystemExit(f"Job {job_id} stopped: {e}")
+    print()
+    print_job(job)
+
+
+if __name__ == "__main__":
+    main()
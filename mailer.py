@@ -0,0 +1,281 @@
+"""Deliver queued invoice emails over SMTP.
+
+Invoices are queued in invoices.db when they are saved and
+"email_enabled" is true in app_config.json. The worker claims a batch of
+ready emails, sends them one after another over a single SMTP connection
+that stays open between batches, and records the outcome of the whole
+batch in one transaction. Temporary failures are retried with exponential
+backoff; permanent ones (5xx replies) or too many
+attempts mark the email failed.
+
+    python -m invoice_maker mail              keep delivering until interrupted
+    python -m invoice_maker mail --once       deliver what is ready and exit
+    python -m invoice_maker mail --status     show queue counts
+"""
+import argparse
+import random
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from config import app_config
+from db import EmailQueue, InvoiceDB
+from render_cache import RenderCache
+from render_queue import init_render_thread
+from renderer import InvoiceRenderer
+from tracing import span
+
+BATCH_SIZE = 20
+POLL_INTERVAL_S = 5.0
+RETRY_BASE_S = 30.0
+RETRY_MAX_S = 6 * 60 * 60
+# Many servers drop a session after this many messages anyway
+MESSAGES_PER_CONNECTION = 100
+
+
+class _Fields(dict):
+    # Leaves unknown {names} in the subject and body templates untouched
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+
+class RateLimiter:
+    """Token bucket allowing rate_per_s sends on average and bursts of up to burst"""
+
+    def __init__(self, rate_per_s, burst=1):
+        self.rate = rate_per_s
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def wait(self):
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens) / self.rate)
+
+
+class SMTPSession:
+    """One SMTP connection, opened on first use and reused until it fails or hits its limit"""
+
+    def __init__(self, host, port, username="", password="", starttls=False, ssl=False, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.ssl = ssl
+        self.timeout = timeout
+        self._smtp = None
+        self._sent = 0
+
+    def connect(self):
+        with span("mail.connect"):
+            smtp_class = smtplib.SMTP_SSL if self.ssl else smtplib.SMTP
+            smtp = smtp_class(self.host, self.port, timeout=self.timeout)
+            try:
+                if self.starttls:
+                    smtp.starttls()
+                if self.username:
+                    smtp.login(self.username, self.password)
+            except BaseException:
+                smtp.close()
+                raise
+        self._smtp = smtp
+        self._sent = 0
+
+    def send(self, message):
+        if self._smtp is not None and self._sent >= MESSAGES_PER_CONNECTION:
+            self.close()
+        fresh = self._smtp is None
+        if fresh:
+            self.connect()
+        try:
+            self._smtp.send_message(message)
+        except OSError as e:
+            if not connection_lost(e):
+                raise
+            self.close()
+            if fresh:
+                raise
+            # A connection left idle between batches may have been dropped; retry once on a new one
+            self.connect()
+            self._smtp.send_message(message)
+        self._sent += 1
+
+    def close(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self._smtp.close()
+        self._smtp = None
+
+
+def connection_lost(error):
+    """True for network errors, as opposed to the server refusing one message"""
+    return isinstance(error, smtplib.SMTPServerDisconnected) or (
+        isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException))
+
+
+def is_permanent(error):
+    """5xx replies, including every recipient refused with one, won't succeed on a retry"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(500 <= code < 600 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 500 <= error.smtp_code < 600
+    return False
+
+
+def retry_delay(attempts):
+    """Seconds to wait before attempt number attempts + 1, with jitter"""
+    return min(RETRY_BASE_S * 2 ** attempts, RETRY_MAX_S) * random.uniform(0.8, 1.2)
+
+
+class EmailWorker:
+    def __init__(self, batch_size=BATCH_SIZE, rate_per_s=None, max_attempts=None, session=None, cache=None):
+        self.batch_size = batch_size
+        if rate_per_s is None:
+            rate_per_s = app_config.get_float("email_rate_per_minute", 60) / 60
+        self.limiter = RateLimiter(rate_per_s, burst=min(batch_size, 10))
+        self.max_attempts = max_attempts or app_config.get_int("email_max_attempts", 5)
+        self.session = session or SMTPSession(
+            app_config.get_str("smtp_host", "localhost"),
+            app_config.get_int("smtp_port", 25),
+            app_config.get_str("smtp_username", ""),
+            app_config.get_str("smtp_password", ""),
+            bool(app_config.get("smtp_starttls", False)),
+            bool(app_config.get("smtp_ssl", False)),
+        )
+        self.cache = cache or RenderCache(
+            app_config.get_str("render_cache_dir", "render_cache"),
+            app_config.get_int("render_cache_max_mb", 500) * 1024 * 1024,
+        )
+        self.renderer = None
+        self._stop = threading.Event()
+
+    def get_renderer(self):
+        template_path = app_config["template_path"]
+        if self.renderer is None or self.renderer.template_path != template_path:
+            self.renderer = InvoiceRenderer(template_path)
+        return self.renderer
+
+    def invoice_pdf(self, email):
+        """PDF bytes for the email's invoice, from the render cache or rendered now"""
+        if email["content_hash"]:
+            pdf = self.cache.read(email["content_hash"])
+            if pdf is not None:
+                return pdf
+        render_data = email["render_data"]
+        if not render_data:
+            raise ValueError(f"No PDF was recorded for {email['invoice_id']}")
+        path = self.get_renderer().render_cached(self.cache, render_data["placeholders"],
+                                                 render_data.get("items", ()))
+        with open(path, "rb") as f:
+            return f.read()
+
+    def build_message(self, email):
+        business = app_config["business_info"]
+        fields = _Fields(email, business_name=business.get("name", ""),
+                         business_email=business.get("email", ""), total=f"{email['total_amount']:.2f}")
+        message = EmailMessage()
+        message["From"] = app_config.get_str("email_from", "") or business.get("email", "")
+        message["To"] = email["recipient"]
+        message["Subject"] = app_config.get_str("email_subject", "Invoice {invoice_id}").format_map(fields)
+        message.set_content(app_config.get_str("email_body", "Please find invoice {invoice_id} attached.")
+                            .format_map(fields))
+        message.add_attachment(self.invoice_pdf(email), maintype="application", subtype="pdf",
+                               filename=f"{email['invoice_id']}.pdf")
+        return message
+
+    def run_once(self):
+        """Send one batch of ready emails; returns {status: count} for the batch"""
+        emails = EmailQueue.claim(self.batch_size)
+        results = []
+        counts = {}
+        with span("mail.batch", count=len(emails)):
+            # Recorded even if interrupted mid-batch, so emails already sent aren't
+            # reclaimed as stale and sent a second time
+            try:
+                for email in emails:
+                    status, next_attempt_at, error = "sent", None, None
+                    try:
+                        message = self.build_message(email)
+                        self.limiter.wait()
+                        self.session.send(message)
+                    except Exception as e:
+                        if connection_lost(e):
+                            self.session.close()
+                        error = str(e) or type(e).__name__
+                        if is_permanent(e) or email["attempts"] + 1 >= self.max_attempts:
+                            status = "failed"
+                        else:
+                            status = "queued"
+                            next_attempt_at = (datetime.now()
+                                               + timedelta(seconds=retry_delay(email["attempts"]))).isoformat()
+                    results.append((email["id"], email["invoice_id"], status, next_attempt_at, error))
+                    counts[status] = counts.get(status, 0) + 1
+            finally:
+                EmailQueue.record_results(results)
+        return counts
+
+    def run(self, poll_interval=POLL_INTERVAL_S, once=False):
+        """Deliver until stop() is called, or until the queue has nothing ready with once"""
+        init_render_thread()
+        totals = {}
+        try:
+            while not self._stop.is_set():
+                counts = self.run_once()
+                for status, count in counts.items():
+                    totals[status] = totals.get(status, 0) + count
+                if not counts:
+                    if once:
+                        break
+                    self._stop.wait(poll_interval)
+        finally:
+            self.session.close()
+        return totals
+
+    def stop(self):
+        self._stop.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m invoice_maker mail",
+                                     description="Deliver queued invoice emails")
+    parser.add_argument("--once", action="store_true", help="exit when nothing is ready to send")
+    parser.add_argument("--status", action="store_true", help="show how many emails are in each state")
+    parser.add_argument("--send", metavar="INVOICE_ID", help="queue an invoice for delivery, then exit")
+    parser.add_argument("--to", help="recipient for --send instead of the client email")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    InvoiceDB.initialize()
+    if args.send:
+        EmailQueue.send_invoice(args.send, args.to)
+        return
+    if args.status:
+        counts = EmailQueue.get_counts()
+        for status in ("queued", "sending", "sent", "failed"):
+            print(f"{status:<8}{counts.get(status, 0):>8}")
+        return
+
+    worker = EmailWorker(batch_size=args.batch_size)
+    try:
+        totals = worker.run(once=args.once)
+    except KeyboardInterrupt:
+        return
+    print(", ".join(f"{count} {status}" for status, count in sorted(totals.items())) or "Nothing to send")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,96 @@
-from db import InvoiceDB
-from gui import InvoiceApp
+import argparse
+import sys
+import time
 
-# Initialize the database
-InvoiceDB.initialize()
+# Modules that should only be imported when the first invoice is rendered
+DEFERRED_MODULES = ("docx", "docx2pdf", "pypdf")
 
-if __name__ == "__main__":
+
+class StartupProfile:
+    """Collects wall-clock timings for each startup stage"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.stages = []
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.stages.append((stage, now - self.last))
+        self.last = now
+
+    def report(self):
+        total = self.last - self.start
+        print("Startup profile")
+        for stage, seconds in self.stages:
+            print(f"  {stage:<24}{seconds * 1000:9.1f} ms")
+        print(f"  {'total':<24}{total * 1000:9.1f} ms")
+        loaded = [name for name in DEFERRED_MODULES if name in sys.modules]
+        print(f"  deferred modules loaded: {', '.join(loaded) or 'none'}")
+
+
+def configure_instrumentation(trace=False):
+    """Switch tracing and query statistics on as the config (or --trace) asks"""
+    from config import app_config
+    from query_stats import query_log
+    from tracing import tracer
+
+    tracer.configure(trace or app_config.get("tracing_enabled", False),
+                     app_config.get_str("trace_file", "trace.jsonl"),
+                     app_config.get_float("trace_max_mb", 5))
+    query_log.configure(app_config.get("query_stats_enabled", False),
+                        app_config.get_float("slow_query_ms", 100),
+                        app_config.get_str("query_stats_file", "query_stats.json"),
+                        app_config.get_str("slow_query_log", "slow_queries.jsonl"))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Invoice Maker")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print an import and initialization time breakdown once the window is shown")
+    parser.add_argument("--trace", action="store_true",
+                        help="record timing spans to the trace file even if tracing_enabled is off")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    profile = StartupProfile(args.profile_startup)
+
+    import customtkinter  # noqa: F401
+    profile.mark("import customtkinter")
+    from db import InvoiceDB
+    from tracing import tracer
+    profile.mark("import config/db")
+    configure_instrumentation(args.trace)
+
+    from gui import InvoiceApp
+    profile.mark("import gui")
+
+    # Initialize the database
+    InvoiceDB.initialize()
+    profile.mark("init database")
     app = InvoiceApp()
+    profile.mark("init window")
+
+    if profile.enabled:
+        def first_paint():
+            app.update_idletasks()
+            profile.mark("first paint")
+            wait_for_clients()
+
+        def wait_for_clients():
+            if app.client_index is None:
+                app.after(10, wait_for_clients)
+                return
+            profile.mark(f"client index ({len(app.client_index)})")
+            profile.report()
+
+        app.after_idle(first_paint)
     app.mainloop()
+    tracer.close()
+
+
+if __name__ == "__main__":
+    main()
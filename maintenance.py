@@ -0,0 +1,285 @@
+"""Keep invoices.db fast and catch corruption early.
+
+Three tasks, each recorded with its timing in the maintenance_runs table:
+
+- analyze: refresh the query planner's statistics (ANALYZE with a row
+  sample limit, then PRAGMA optimize) after enough invoice writes, or
+  once a day
+- vacuum: hand free pages left by deletes back to the file system with
+  PRAGMA incremental_vacuum, a few hundred pages per transaction
+- quick_check: PRAGMA quick_check on a schedule; problems are reported
+  instead of waiting for a query to fail
+
+The app runs them on a worker thread once nobody has used it for a
+while, so the GUI thread only ever records a timestamp. Between vacuum
+steps the worker gives the write lock back and stops as soon as the app
+is used again. To run everything now, e.g. from a scheduled task:
+
+    python -m invoice_maker maintenance
+    python -m invoice_maker maintenance --full      exact statistics, full integrity_check
+    python -m invoice_maker maintenance --history
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from config import app_config
+from db import InvoiceDB, MaintenanceLog
+from events import bus, CLIENT, INVOICE, RECURRING
+from tracing import span
+
+ANALYZE_AFTER_WRITES = 1000
+ANALYZE_INTERVAL = timedelta(days=1)
+# Rows ANALYZE samples per index; keeps the task short on large databases
+ANALYSIS_LIMIT = 1000
+VACUUM_STEP_PAGES = 256
+# Free pages worth reclaiming; fewer are simply reused by the next inserts
+VACUUM_MIN_FREE_PAGES = 1024
+VACUUM_STEP_PAUSE_S = 0.05
+VACUUM_RETRY_S = 6 * 60 * 60
+IDLE_AFTER_S = 30
+POLL_INTERVAL_S = 10
+CHECK_PROBLEM_LINES = 20
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def connect():
+    # Autocommit, so PRAGMAs and VACUUM manage their own transactions
+    return InvoiceDB.connect(isolation_level=None)
+
+
+def timed(task, work):
+    """Run work() -> (ok, result), record it in maintenance_runs and return it"""
+    started_at = datetime.now().isoformat()
+    start = time.perf_counter()
+    with span(f"maintenance.{task}"):
+        try:
+            ok, result = work()
+        except sqlite3.DatabaseError as e:
+            ok, result = False, str(e)
+    try:
+        MaintenanceLog.record(task, started_at, (time.perf_counter() - start) * 1000, ok, result)
+    except sqlite3.DatabaseError as e:
+        # A damaged database may refuse the record; the result still reaches the caller
+        print(f"Could not record {task} result: {str(e)}")
+    return ok, result
+
+
+def analyze(full=False):
+    def work():
+        conn = connect()
+        try:
+            if not full:
+                conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+            conn.execute("ANALYZE")
+            conn.execute("PRAGMA optimize")
+        finally:
+            conn.close()
+        return True, "full" if full else f"sampled {ANALYSIS_LIMIT} rows per index"
+
+    return timed("analyze", work)
+
+
+def page_stats(conn):
+    """(auto_vacuum mode, page size, page count, free pages)"""
+    return tuple(conn.execute(f"PRAGMA {name}").fetchone()[0]
+                 for name in ("auto_vacuum", "page_size", "page_count", "freelist_count"))
+
+
+def convert_to_incremental():
+    """Switch an existing database to incremental auto-vacuum; rewrites the whole file"""
+    def work():
+        conn = connect()
+        try:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            mode, page_size, pages, _ = page_stats(conn)
+        finally:
+            conn.close()
+        return mode == AUTO_VACUUM_INCREMENTAL, f"{pages * page_size / 1024 / 1024:.1f} MB after VACUUM"
+
+    return timed("convert", work)
+
+
+def vacuum(keep_going=lambda: True, step_pages=VACUUM_STEP_PAGES, min_free_pages=VACUUM_MIN_FREE_PAGES):
+    """Free pages in short write transactions while keep_going() is true.
+
+    Returns (ok, result), or None when there was nothing worth freeing.
+    """
+    conn = connect()
+    try:
+        mode, page_size, pages, free = page_stats(conn)
+        if free < min_free_pages:
+            return None
+        if mode != AUTO_VACUUM_INCREMENTAL:
+            # Switching needs a full VACUUM, which holds the database for its whole run
+            return False, f"{free} free pages, but incremental vacuum is off; run with --convert"
+
+        def work():
+            freed = steps = 0
+            slowest = 0.0
+            remaining = free
+            while remaining > 0 and keep_going():
+                # executescript steps the PRAGMA to the end; execute() would free a single page
+                start = time.perf_counter()
+                conn.executescript(f"PRAGMA incremental_vacuum({step_pages});")
+                slowest = max(slowest, time.perf_counter() - start)
+                steps += 1
+                left = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                freed += remaining - left
+                remaining = left
+                # Let other writers in between steps
+                time.sleep(VACUUM_STEP_PAUSE_S)
+            return True, (f"freed {freed} pages ({freed * page_size / 1024 / 1024:.1f} MB) in {steps} steps, "
+                          f"slowest {slowest * 1000:.1f} ms, {remaining} free pages left")
+
+        return timed("vacuum", work)
+    finally:
+        conn.close()
+
+
+def quick_check(full=False):
+    def work():
+        conn = connect()
+        try:
+            pragma = "integrity_check" if full else "quick_check"
+            rows = [row[0] for row in conn.execute(f"PRAGMA {pragma}({CHECK_PROBLEM_LINES})")]
+        finally:
+            conn.close()
+        return rows == ["ok"], "\n".join(rows)
+
+    return timed("integrity_check" if full else "quick_check", work)
+
+
+class MaintenanceScheduler:
+    """Runs the maintenance tasks on a worker thread when the app is idle.
+
+    on_problem(message) is called from the worker thread when the
+    integrity check finds damage; other failures are only printed.
+    Existing databases that don't use incremental vacuum are left for
+    "maintenance --convert".
+    """
+
+    def __init__(self, idle_after_s=None, check_interval_hours=None, on_problem=None):
+        self.idle_after_s = idle_after_s if idle_after_s is not None else \
+            app_config.get_float("maintenance_idle_s", IDLE_AFTER_S)
+        self.check_interval = timedelta(hours=check_interval_hours if check_interval_hours is not None else
+                                        app_config.get_float("integrity_check_hours", 24))
+        self.on_problem = on_problem
+        self.writes = 0
+        self.vacuum_after = 0.0
+        # When each task last ran, for when a damaged database can't record it
+        self.ran_at = {}
+        self.last_activity = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = None
+        for entity in (CLIENT, INVOICE, RECURRING):
+            bus.subscribe(entity, self.note_writes)
+
+    def note_activity(self, event=None):
+        self.last_activity = time.monotonic()
+
+    def note_writes(self, event):
+        if event.entity != CLIENT:
+            self.writes += len(event.ids)
+        self.note_activity()
+
+    def idle(self):
+        return not self._stop.is_set() and time.monotonic() - self.last_activity >= self.idle_after_s
+
+    def report(self, task, ok, result):
+        if ok:
+            return
+        if task == "quick_check" and self.on_problem:
+            self.on_problem(f"The invoice database failed its integrity check:\n{result}")
+        else:
+            print(f"Database {task}: {result}")
+
+    def last_run(self, task):
+        return max(filter(None, (MaintenanceLog.last_run(task), self.ran_at.get(task))), default=None)
+
+    def run_due(self, now=None):
+        """Run whichever tasks are due, stopping early once the app is in use"""
+        now = now or datetime.now()
+        last_analyze = self.last_run("analyze")
+        if self.idle() and (self.writes >= ANALYZE_AFTER_WRITES or last_analyze is None
+                            or now - last_analyze >= ANALYZE_INTERVAL):
+            self.writes = 0
+            self.ran_at["analyze"] = now
+            self.report("analyze", *analyze())
+        if self.idle() and time.monotonic() >= self.vacuum_after:
+            outcome = vacuum(self.idle)
+            if outcome:
+                self.report("vacuum", *outcome)
+                if not outcome[0]:
+                    # Don't repeat a failing vacuum, or the --convert hint, on every poll
+                    self.vacuum_after = time.monotonic() + VACUUM_RETRY_S
+        last_check = self.last_run("quick_check")
+        if self.idle() and (last_check is None or now - last_check >= self.check_interval):
+            # Also keeps a failed record from repeating the check and its warning every poll
+            self.ran_at["quick_check"] = now
+            self.report("quick_check", *quick_check())
+
+    def run(self, poll_interval=POLL_INTERVAL_S):
+        while not self._stop.wait(poll_interval):
+            if not self.idle():
+                continue
+            try:
+                self.run_due()
+            except Exception as e:
+                print(f"Error during database maintenance: {str(e)}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        for entity in (CLIENT, INVOICE, RECURRING):
+            bus.unsubscribe(entity, self.note_writes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m invoice_maker maintenance",
+                                     description="Analyze, vacuum and check the invoice database")
+    parser.add_argument("--full", action="store_true",
+                        help="exact statistics and a full integrity_check (slower)")
+    parser.add_argument("--convert", action="store_true",
+                        help="switch an existing database to incremental vacuum (rewrites the file)")
+    parser.add_argument("--history", action="store_true", help="show recent maintenance runs")
+    args = parser.parse_args(argv)
+
+    InvoiceDB.initialize()
+    if args.history:
+        for task, started_at, duration_ms, ok, result in reversed(MaintenanceLog.history()):
+            summary = (result or "").splitlines()[0] if result else ""
+            print(f"{started_at[:19]}  {task:<16}{duration_ms:>10.1f} ms  {'ok ' if ok else 'BAD'}  {summary}")
+        return
+
+    failed = False
+    tasks = [("analyze", lambda: analyze(args.full))]
+    if args.convert:
+        tasks.append(("convert", convert_to_incremental))
+    tasks.append(("vacuum", lambda: vacuum(min_free_pages=1)))
+    tasks.append(("integrity_check" if args.full else "quick_check", lambda: quick_check(args.full)))
+    size_before = os.path.getsize(app_config["invoices_db"])
+    for task, run in tasks:
+        outcome = run()
+        if outcome is None:
+            print(f"{task}: nothing to do")
+            continue
+        ok, result = outcome
+        failed = failed or not ok
+        print(f"{task}: {result}")
+    size_after = os.path.getsize(app_config["invoices_db"])
+    print(f"invoices.db: {size_before / 1024 / 1024:.1f} MB -> {size_after / 1024 / 1024:.1f} MB")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""Mark pending invoices past their due date as overdue and print the aging report.
+
+The app does this once a day while it is open; schedule this command to
+keep statuses current when it isn't:
+
+    python -m invoice_maker overdue
+    python -m invoice_maker overdue --report-only --as-of 2026-12-31
+"""
+import argparse
+from datetime import date
+
+from db import InvoiceDB
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m invoice_maker overdue",
+                                     description="Mark overdue invoices and show unpaid totals by age")
+    parser.add_argument("--as-of", type=date.fromisoformat, default=None,
+                        help="treat this YYYY-MM-DD date as today")
+    parser.add_argument("--report-only", action="store_true", help="don't change any status")
+    args = parser.parse_args(argv)
+
+    InvoiceDB.initialize()
+    as_of = (args.as_of or date.today()).isoformat()
+    if not args.report_only:
+        marked = InvoiceDB.mark_overdue(as_of)
+        print(f"{len(marked)} invoice(s) marked overdue")
+    print(f"{'days past due':<14}{'invoices':>10}{'amount':>16}")
+    for bucket, count, amount in InvoiceDB.get_aging_report(as_of):
+        print(f"{bucket:<14}{count:>10}{amount:>16,.2f}")
+
+
+if __name__ == "__main__":
+    main()
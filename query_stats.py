@@ -0,0 +1,349 @@
+"""Opt-in statement statistics and slow-query log for the invoice database.
+
+Enable with "query_stats_enabled": true in app_config.json. Connections
+from InvoiceDB.connect() then time every statement; per-statement totals
+are merged into query_stats_file when the app exits, and statements slower
+than slow_query_ms are appended to slow_query_log with their query plan.
+
+    python query_stats.py --by total --limit 20
+"""
+import argparse
+import atexit
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+from file_lock import FileLock, LockTimeout, replace_file
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+# Only these statements get an EXPLAIN QUERY PLAN in the slow log
+_EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")
+SORT_KEYS = {"total": "total_ms", "max": "max_ms", "count": "count", "mean": "mean_ms", "rows": "rows"}
+
+
+def normalize_sql(sql):
+    """Collapse whitespace and literals so one query shape maps to one key"""
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    return _IN_LIST.sub("IN (...)", sql)
+
+
+def params_shape(params):
+    if params is None:
+        return ""
+    if isinstance(params, dict):
+        return "{" + ",".join(f"{key}:{type(value).__name__}" for key, value in sorted(params.items())) + "}"
+    return "(" + ",".join(type(value).__name__ for value in params) + ")"
+
+
+class QueryLog:
+    """Per-statement counters plus the slow-query log, shared by all connections"""
+
+    def __init__(self):
+        self.enabled = False
+        self.slow_ms = 100.0
+        self.stats_path = None
+        self.slow_log_path = None
+        self._stats = {}
+        self._explained = set()
+        self._lock = threading.Lock()
+        self._atexit_registered = False
+
+    def configure(self, enabled, slow_ms=100, stats_path="query_stats.json",
+                  slow_log_path="slow_queries.jsonl"):
+        self.enabled = bool(enabled)
+        self.slow_ms = float(slow_ms)
+        self.stats_path = stats_path
+        self.slow_log_path = slow_log_path
+        if self.enabled and not self._atexit_registered:
+            atexit.register(self.flush)
+            self._atexit_registered = True
+
+    def record(self, conn, sql, params, elapsed_ms, rows):
+        key = normalize_sql(sql)
+        shape = params_shape(params)
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                entry = self._stats[key] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                            "rows": 0, "slow": 0, "param_shapes": []}
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+            entry["rows"] += rows if rows and rows > 0 else 0
+            if shape not in entry["param_shapes"] and len(entry["param_shapes"]) < 10:
+                entry["param_shapes"].append(shape)
+            slow = elapsed_ms >= self.slow_ms
+            if slow:
+                entry["slow"] += 1
+            # The plan rarely changes between runs, so it is logged once per statement
+            explain = slow and key not in self._explained
+            if explain:
+                self._explained.add(key)
+        if slow:
+            self._log_slow(conn, sql, key, params, shape, elapsed_ms, rows, explain)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: dict(entry, param_shapes=list(entry["param_shapes"]))
+                    for key, entry in self._stats.items()}
+
+    def flush(self):
+        """Merge this process's counters into stats_path and reset them"""
+        if not self.stats_path:
+            return
+        # Other processes flush into the same file; without the lock one
+        # merge could overwrite another's
+        try:
+            with FileLock(self.stats_path):
+                self._merge_into_file()
+        except LockTimeout as e:
+            print(f"Error saving query statistics: {str(e)}")
+
+    def _merge_into_file(self):
+        with self._lock:
+            current, self._stats = self._stats, {}
+        if not current:
+            return
+        merged = load_stats(self.stats_path)
+        for key, entry in current.items():
+            target = merged.setdefault(key, {"count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                             "rows": 0, "slow": 0, "param_shapes": []})
+            for field in ("count", "total_ms", "rows", "slow"):
+                target[field] += entry[field]
+            target["max_ms"] = max(target["max_ms"], entry["max_ms"])
+            for shape in entry["param_shapes"]:
+                if shape not in target["param_shapes"] and len(target["param_shapes"]) < 10:
+                    target["param_shapes"].append(shape)
+        directory = os.path.dirname(os.path.abspath(self.stats_path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".query_stats-", suffix=".tmp", dir=directory)
+        with os.fdopen(fd, "w") as f:
+            json.dump(merged, f, indent=2)
+        replace_file(tmp_path, self.stats_path)
+
+    def _log_slow(self, conn, sql, key, params, shape, elapsed_ms, rows, explain):
+        if not self.slow_log_path:
+            return
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "ms": round(elapsed_ms, 3),
+            "statement": key,
+            "params": shape,
+            "rows": rows,
+        }
+        if explain and key.split(" ", 1)[0].upper() in _EXPLAINABLE:
+            entry["plan"] = explain_plan(conn, sql, params)
+        try:
+            with open(self.slow_log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"Error writing slow query log: {str(e)}")
+
+
+def explain_plan(conn, sql, params):
+    """EXPLAIN QUERY PLAN rows as indented text lines"""
+    try:
+        cursor = sqlite3.Connection.cursor(conn)
+        rows = sqlite3.Cursor.execute(cursor, "EXPLAIN QUERY PLAN " + sql,
+                                      params if params is not None else ()).fetchall()
+        cursor.close()
+    except sqlite3.Error as e:
+        return [f"unavailable: {str(e)}"]
+    depth = {0: 0}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, 0) + 1
+        lines.append("  " * (depth[node_id] - 1) + detail)
+    return lines
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports statement time and rows to query_log.
+
+    For queries the clock keeps running through the fetches, since that
+    is where SQLite does most of the work; a statement is recorded when it
+    is fully fetched, replaced by the next execute, or the cursor is
+    closed, garbage collected or its connection closed, so a query read
+    with a single fetchone() is still counted.
+    """
+
+    _pending = None
+
+    def execute(self, sql, params=None):
+        self._finish()
+        start = time.perf_counter()
+        if params is None:
+            super().execute(sql)
+        else:
+            super().execute(sql, params)
+        self._start(sql, params, start)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._finish()
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_params)
+        query_log.record(self.connection, sql, None, (time.perf_counter() - start) * 1000, self.rowcount)
+        return self
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._add(start, 0 if row is None else 1, done=row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._add(start, len(rows), done=not rows)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._add(start, len(rows), done=True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add(start, 0, done=True)
+            raise
+        self._add(start, 1, done=False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+    def _start(self, sql, params, start):
+        elapsed = time.perf_counter() - start
+        if self.description is None:
+            # Not a query: nothing to fetch, so record it right away
+            query_log.record(self.connection, sql, params, elapsed * 1000, self.rowcount)
+        else:
+            self._pending = [sql, params, elapsed, 0]
+
+    def _add(self, start, rows, done):
+        if self._pending is None:
+            return
+        self._pending[2] += time.perf_counter() - start
+        self._pending[3] += rows
+        if done:
+            self._finish()
+
+    def _finish(self):
+        if self._pending is not None:
+            sql, params, elapsed, rows = self._pending
+            self._pending = None
+            query_log.record(self.connection, sql, params, elapsed * 1000, rows)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cursors = weakref.WeakSet()
+
+    def cursor(self, factory=InstrumentedCursor):
+        cursor = super().cursor(factory)
+        if isinstance(cursor, InstrumentedCursor):
+            self._cursors.add(cursor)
+        return cursor
+
+    def close(self):
+        # Record queries whose cursors are still open and partly read
+        for cursor in list(self._cursors):
+            cursor._finish()
+        super().close()
+
+    def execute(self, sql, params=None):
+        cursor = self.cursor()
+        return cursor.execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+
+def load_stats(path):
+    try:
+        with open(path, "r") as f:
+            stats = json.load(f)
+        return stats if isinstance(stats, dict) else {}
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def top_offenders(stats, by="total", limit=20):
+    """Return (statement, entry) pairs sorted worst first"""
+    field = SORT_KEYS[by]
+    rows = []
+    for statement, entry in stats.items():
+        entry = dict(entry, mean_ms=entry["total_ms"] / entry["count"] if entry["count"] else 0.0)
+        rows.append((statement, entry))
+    rows.sort(key=lambda item: item[1][field], reverse=True)
+    return rows[:limit]
+
+
+def latest_plans(slow_log_path):
+    """Most recent logged plan per statement"""
+    plans = {}
+    try:
+        with open(slow_log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get("plan"):
+                    plans[entry["statement"]] = entry["plan"]
+    except FileNotFoundError:
+        pass
+    return plans
+
+
+query_log = QueryLog()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the slowest invoice database statements")
+    parser.add_argument("--by", choices=sorted(SORT_KEYS), default="total", help="ranking metric")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--stats", help="stats file (defaults to query_stats_file from the config)")
+    parser.add_argument("--slow-log", help="slow query log (defaults to slow_query_log from the config)")
+    parser.add_argument("--plans", action="store_true", help="show the last logged query plan for each statement")
+    args = parser.parse_args()
+
+    from config import app_config
+    stats_path = args.stats or app_config.get_str("query_stats_file", "query_stats.json")
+    slow_log_path = args.slow_log or app_config.get_str("slow_query_log", "slow_queries.jsonl")
+    stats = load_stats(stats_path)
+    if not stats:
+        print(f"No statistics in {stats_path}; set query_stats_enabled in app_config.json and use the app first")
+        return
+    plans = latest_plans(slow_log_path) if args.plans else {}
+
+    print(f"{'count':>8}{'total ms':>12}{'mean ms':>10}{'max ms':>10}{'rows':>10}{'slow':>6}  statement")
+    for statement, entry in top_offenders(stats, args.by, args.limit):
+        print(f"{entry['count']:>8}{entry['total_ms']:>12.1f}{entry['mean_ms']:>10.2f}"
+              f"{entry['max_ms']:>10.2f}{entry['rows']:>10}{entry['slow']:>6}  {statement}")
+        if entry["param_shapes"] and entry["param_shapes"] != [""]:
+            print(f"{'':>56}params: {' '.join(entry['param_shapes'])}")
+        for line in plans.get(statement, []):
+            print(f"{'':>56}{line}")
+
+
+if __name__ == "__main__":
+    main()
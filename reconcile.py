@@ -0,0 +1,386 @@
+"""Match bank statement payments to open invoices and mark them paid in bulk.
+
+Statements are read a line at a time: CSV exports (the date, amount,
+reference and payer columns are found by their headers) or CAMT.053 XML.
+Open invoices are indexed once by invoice ID and by amount, so every
+payment is matched with a couple of dictionary lookups:
+
+1. an invoice ID found in the reference text,
+2. otherwise the only open invoice with exactly that amount,
+3. otherwise, among invoices with that amount, the best match on payer
+   name and on the payment date falling between invoice and due date.
+
+Matches are proposed for review; the accepted ones are applied with a
+single status update.
+
+    python -m invoice_maker reconcile statement.csv --review review.csv
+    python -m invoice_maker reconcile --apply review.csv
+"""
+import argparse
+import csv
+import difflib
+import re
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from db import InvoiceDB
+
+StatementLine = namedtuple("StatementLine", ["line_no", "date", "amount", "reference", "payer"])
+Match = namedtuple("Match", ["line", "invoice", "method", "score", "note"])
+OpenInvoice = namedtuple("OpenInvoice", ["invoice_id", "client_name", "total_amount", "invoice_date", "due_date"])
+
+# Matching methods, most to least certain
+REFERENCE = "reference"
+AMOUNT = "amount"
+FUZZY = "fuzzy"
+UNMATCHED = "unmatched"
+# Methods accepted without review unless told otherwise
+AUTO_ACCEPT = (REFERENCE, AMOUNT)
+
+# Header names recognised in CSV exports (compared lowercased)
+CSV_COLUMNS = {
+    "date": ("date", "booking date", "value date", "transaction date", "fecha", "fecha valor"),
+    "amount": ("amount", "credit", "importe", "value", "monto"),
+    "reference": ("reference", "description", "details", "remittance information", "concept",
+                  "concepto", "memo", "narrative"),
+    "payer": ("payer", "name", "counterparty", "counterparty name", "ordenante", "beneficiary"),
+}
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%m/%d/%Y", "%Y%m%d")
+# Payments this many days after the due date still count as on time for fuzzy matching
+DATE_WINDOW_DAYS = 60
+FUZZY_MIN_SCORE = 0.6
+_WORD = re.compile(r"[A-Z0-9]+")
+# An invoice ID split by the bank into at most this many words ("INV 261019 AB12")
+MAX_ID_WORDS = 4
+_NON_ALNUM = re.compile(r"[^A-Z0-9]")
+
+
+def parse_amount(text):
+    """Decimal from "1.234,56", "1,234.56", "-50" or "€ 12,00"; None if it isn't one"""
+    text = re.sub(r"[^\d,.\-+]", "", str(text or ""))
+    if not text:
+        return None
+    if "," in text and "." in text:
+        # Whichever separator comes last is the decimal point
+        if text.rfind(",") > text.rfind("."):
+            text = text.replace(".", "").replace(",", ".")
+        else:
+            text = text.replace(",", "")
+    elif "," in text or "." in text:
+        # A lone separator followed by exactly three digits groups thousands
+        # ("1,500", "1.500"); otherwise it's the decimal point ("12,50", "0.125")
+        separator = "," if "," in text else "."
+        head, _, tail = text.rpartition(separator)
+        grouped = len(tail) == 3 and head.lstrip("+-") not in ("", "0")
+        text = head.replace(separator, "") + ("" if grouped else ".") + tail
+    try:
+        return Decimal(text)
+    except InvalidOperation:
+        return None
+
+
+def parse_date(text):
+    text = str(text or "").strip()[:10]
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def cents(amount):
+    return int((Decimal(str(amount)) * 100).quantize(Decimal("1")))
+
+
+def compact_id(text):
+    """Invoice IDs compared without case, dashes or spaces, as banks often strip them"""
+    return _NON_ALNUM.sub("", text.upper())
+
+
+def read_csv_statement(path, columns=None, delimiter=None):
+    """Yield incoming payments (positive amounts) from a CSV export"""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        if delimiter is None:
+            try:
+                delimiter = csv.Sniffer().sniff(sample, delimiters=",;\t|").delimiter
+            except csv.Error:
+                delimiter = ","
+        reader = csv.DictReader(f, delimiter=delimiter)
+        headers = {name.strip().lower(): name for name in reader.fieldnames or ()}
+        found = {}
+        for field, aliases in CSV_COLUMNS.items():
+            chosen = (columns or {}).get(field)
+            if chosen:
+                if chosen not in reader.fieldnames:
+                    raise ValueError(f"Column {chosen!r} not found in {path}")
+                found[field] = chosen
+            else:
+                found[field] = next((headers[alias] for alias in aliases if alias in headers), None)
+        if not found["amount"]:
+            raise ValueError(f"No amount column found in {path}; name it with --amount-column")
+        for line_no, row in enumerate(reader, start=2):
+            amount = parse_amount(row.get(found["amount"]))
+            if amount is None or amount <= 0:
+                continue
+            yield StatementLine(
+                line_no,
+                parse_date(row.get(found["date"])) if found["date"] else None,
+                amount,
+                (row.get(found["reference"]) or "") if found["reference"] else "",
+                (row.get(found["payer"]) or "") if found["payer"] else "",
+            )
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _find(element, *path):
+    # Namespace-agnostic child lookup, one tag name per level
+    for name in path:
+        element = next((child for child in element if _local(child.tag) == name), None)
+        if element is None:
+            return None
+    return element
+
+
+def _camt_amount(text):
+    # ISO 20022 amounts always use "." as the decimal point and never group digits
+    try:
+        amount = Decimal((text or "").strip())
+    except InvalidOperation:
+        return None
+    return amount if amount.is_finite() else None
+
+
+def read_camt_statement(path):
+    """Yield incoming payments from a CAMT.053 file, one <Ntry> at a time"""
+    line_no = 0
+    for _, element in ET.iterparse(path, events=("end",)):
+        if _local(element.tag) != "Ntry":
+            continue
+        line_no += 1
+        indicator = _find(element, "CdtDbtInd")
+        amount_element = _find(element, "Amt")
+        amount = _camt_amount(amount_element.text) if amount_element is not None else None
+        # Entries without a usable amount are skipped, as in CSV statements
+        if indicator is not None and indicator.text == "CRDT" and amount is not None and amount > 0:
+            date_element = _find(element, "BookgDt", "Dt")
+            if date_element is None:
+                date_element = _find(element, "ValDt", "Dt")
+            details = _find(element, "NtryDtls", "TxDtls")
+            reference = payer = ""
+            if details is not None:
+                remittance = _find(details, "RmtInf")
+                if remittance is not None:
+                    reference = " ".join(child.text or "" for child in remittance.iter()
+                                         if _local(child.tag) in ("Ustrd", "Ref"))
+                payer_name = _find(details, "RltdPties", "Dbtr", "Nm")
+                if payer_name is None:
+                    payer_name = _find(details, "RltdPties", "Dbtr", "Pty", "Nm")
+                payer = payer_name.text if payer_name is not None else ""
+            if not reference:
+                info = _find(element, "AddtlNtryInf")
+                reference = info.text if info is not None else ""
+            yield StatementLine(line_no, parse_date(date_element.text if date_element is not None else ""),
+                                amount, reference or "", payer or "")
+        # Free the parsed entry so memory stays flat on large statements
+        element.clear()
+
+
+def read_statement(path, columns=None, delimiter=None):
+    if path.lower().endswith(".xml"):
+        return read_camt_statement(path)
+    return read_csv_statement(path, columns, delimiter)
+
+
+def load_open_invoices(conn=None):
+    return [OpenInvoice(*row) for row in InvoiceDB.get_unpaid_invoices(conn)]
+
+
+class Reconciler:
+    """Hash indexes over open invoices; match() claims each invoice at most once"""
+
+    def __init__(self, invoices, date_window_days=DATE_WINDOW_DAYS, min_score=FUZZY_MIN_SCORE):
+        self.by_id = {}
+        self.by_amount = {}
+        self.claimed = set()
+        # Claimed by an invoice ID or a unique amount; fuzzy claims await review and don't count
+        self.settled = set()
+        self.date_window = timedelta(days=date_window_days)
+        self.min_score = min_score
+        for invoice in invoices:
+            self.by_id[compact_id(invoice.invoice_id)] = invoice
+            self.by_amount.setdefault(cents(invoice.total_amount), []).append(invoice)
+
+    def _reference_hit(self, reference):
+        # Each run of up to MAX_ID_WORDS adjacent words, joined, is looked up
+        # as a compact ID, which also covers dashes turned into spaces
+        words = _WORD.findall(reference.upper())
+        for start in range(len(words)):
+            candidate = ""
+            for word in words[start:start + MAX_ID_WORDS]:
+                candidate += word
+                invoice = self.by_id.get(candidate)
+                if invoice is not None and invoice.invoice_id not in self.claimed:
+                    return invoice
+        return None
+
+    def _fuzzy_score(self, line, invoice):
+        name_score = 0.0
+        if line.payer and invoice.client_name:
+            name_score = difflib.SequenceMatcher(None, line.payer.lower(), invoice.client_name.lower()).ratio()
+        date_score = 0.0
+        issued = parse_date(invoice.invoice_date)
+        due = parse_date(invoice.due_date) or issued
+        if line.date and issued and issued <= line.date <= due + self.date_window:
+            date_score = 1.0
+        return 0.7 * name_score + 0.3 * date_score
+
+    def _reference_match(self, line):
+        invoice = self._reference_hit(line.reference)
+        if invoice is None:
+            return None
+        self.claimed.add(invoice.invoice_id)
+        self.settled.add(invoice.invoice_id)
+        note = ""
+        if cents(invoice.total_amount) != cents(line.amount):
+            note = f"amount differs: invoice {invoice.total_amount:.2f}, paid {line.amount:.2f}"
+        return Match(line, invoice, REFERENCE, 1.0 if not note else 0.5, note)
+
+    def _open_candidates(self, line):
+        return [invoice for invoice in self.by_amount.get(cents(line.amount), ())
+                if invoice.invoice_id not in self.settled]
+
+    def _amount_match(self, line):
+        """The only open invoice with this amount, or None"""
+        candidates = self._open_candidates(line)
+        if len(candidates) != 1 or candidates[0].invoice_id in self.claimed:
+            return None
+        invoice = candidates[0]
+        self.claimed.add(invoice.invoice_id)
+        self.settled.add(invoice.invoice_id)
+        return Match(line, invoice, AMOUNT, 0.9, "")
+
+    def _fuzzy_match(self, line):
+        candidates = self._open_candidates(line)
+        if not candidates:
+            return Match(line, None, UNMATCHED, 0.0, "")
+        note = f"{len(candidates)} open invoices with this amount"
+        scored = sorted(((self._fuzzy_score(line, invoice), invoice) for invoice in candidates
+                         if invoice.invoice_id not in self.claimed),
+                        key=lambda pair: pair[0], reverse=True)
+        if scored:
+            best_score, invoice = scored[0]
+            runner_up = scored[1][0] if len(scored) > 1 else 0.0
+            if best_score >= self.min_score and best_score > runner_up:
+                self.claimed.add(invoice.invoice_id)
+                return Match(line, invoice, FUZZY, round(best_score, 2), note)
+        return Match(line, None, UNMATCHED, 0.0, note)
+
+    def match(self, line):
+        return self._reference_match(line) or self._amount_match(line) or self._fuzzy_match(line)
+
+    def match_all(self, lines):
+        """Match lines in three passes over the statement: invoice IDs named in a
+        reference, then unique amounts, then payer and date, so the result
+        doesn't depend on the order of the lines"""
+        lines = list(lines)
+        matches = [self._reference_match(line) for line in lines]
+        matches = [match or self._amount_match(line) for match, line in zip(matches, lines)]
+        return [match or self._fuzzy_match(line) for match, line in zip(matches, lines)]
+
+
+def reconcile(path, columns=None, delimiter=None, conn=None):
+    """Propose a Match for every incoming payment in the statement"""
+    reconciler = Reconciler(load_open_invoices(conn))
+    return reconciler.match_all(read_statement(path, columns, delimiter))
+
+
+REVIEW_FIELDS = ["accept", "line", "date", "amount", "reference", "payer", "invoice_id",
+                 "client_name", "invoice_total", "method", "score", "note"]
+
+
+def write_review(matches, path, auto_accept=AUTO_ACCEPT):
+    """Write proposals to a CSV whose accept column can be edited before --apply"""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=REVIEW_FIELDS)
+        writer.writeheader()
+        for match in matches:
+            line, invoice = match.line, match.invoice
+            writer.writerow({
+                "accept": "yes" if match.method in auto_accept and not match.note else "no",
+                "line": line.line_no,
+                "date": line.date.isoformat() if line.date else "",
+                "amount": f"{line.amount:.2f}",
+                "reference": line.reference,
+                "payer": line.payer,
+                "invoice_id": invoice.invoice_id if invoice else "",
+                "client_name": invoice.client_name if invoice else "",
+                "invoice_total": f"{invoice.total_amount:.2f}" if invoice else "",
+                "method": match.method,
+                "score": match.score,
+                "note": match.note,
+            })
+
+
+def read_review(path):
+    """Invoice IDs accepted in a review file"""
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return [row["invoice_id"] for row in csv.DictReader(f)
+                if row.get("invoice_id") and row.get("accept", "").strip().lower() in ("yes", "y", "1", "true", "x")]
+
+
+def accepted_ids(matches, auto_accept=AUTO_ACCEPT):
+    return [match.invoice.invoice_id for match in matches
+            if match.invoice is not None and match.method in auto_accept and not match.note]
+
+
+def summarize(matches):
+    counts = {}
+    for match in matches:
+        counts[match.method] = counts.get(match.method, 0) + 1
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m invoice_maker reconcile",
+                                     description="Match a bank statement to open invoices")
+    parser.add_argument("statement", nargs="?", help="CSV export or CAMT.053 .xml file")
+    parser.add_argument("--review", metavar="CSV", help="write the proposed matches here for review")
+    parser.add_argument("--apply", metavar="CSV", help="mark the invoices accepted in a review file as paid")
+    parser.add_argument("--auto-apply", action="store_true",
+                        help="mark reference and unique-amount matches paid without a review file")
+    parser.add_argument("--delimiter", help="CSV delimiter (detected by default)")
+    for field in CSV_COLUMNS:
+        parser.add_argument(f"--{field}-column", help=f"CSV header holding the {field}")
+    args = parser.parse_args(argv)
+
+    InvoiceDB.initialize()
+    if args.apply:
+        paid = InvoiceDB.mark_paid(read_review(args.apply))
+        print(f"{len(paid)} invoice(s) marked paid")
+        return
+    if not args.statement:
+        parser.error("a statement file is required unless --apply is given")
+
+    columns = {field: getattr(args, f"{field}_column") for field in CSV_COLUMNS}
+    matches = reconcile(args.statement, columns, args.delimiter)
+    counts = summarize(matches)
+    print(f"{len(matches)} payment(s): " + ", ".join(
+        f"{counts.get(method, 0)} {method}" for method in (REFERENCE, AMOUNT, FUZZY, UNMATCHED)))
+    if args.review:
+        write_review(matches, args.review)
+        print(f"Review {args.review}, set accept to yes or no, then run with --apply {args.review}")
+    if args.auto_apply:
+        paid = InvoiceDB.mark_paid(accepted_ids(matches))
+        print(f"{len(paid)} invoice(s) marked paid")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""Recurring invoices: generate every period that has come due, as one batch.
+
+    python -m invoice_maker recurring                  generate everything due today
+    python -m invoice_maker recurring --as-of 2026-12-31 --dry-run
+    python -m invoice_maker recurring --list
+    python -m invoice_maker recurring --pause 3
+
+A run reads the due definitions with one indexed query, builds an invoice
+for every missed period, renders them all in one pass over a thread pool
+into the render cache, then inserts the invoices and moves each next_run
+forward in a single transaction. Invoice IDs are derived from the
+definition and the period, so repeating an interrupted run (or two
+machines running at once) never bills a period twice.
+"""
+import argparse
+import calendar
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from config import app_config
+from db import ClientDB, InvoiceDB, RecurringDB
+from events import bus, INVOICE, RECURRING, CREATED, UPDATED
+from invoice_data import build_invoice
+from render_cache import RenderCache
+from render_queue import init_render_thread
+from renderer import InvoiceRenderer
+from tracing import span
+
+# Periods one definition may catch up in a single run; the rest follow next run
+MAX_CATCH_UP_PERIODS = 60
+MONTHS_PER_CADENCE = {"monthly": 1, "quarterly": 3, "yearly": 12}
+
+
+def next_period(day, cadence, anchor_day):
+    """The period after day; monthly cadences go back to anchor_day when the month allows"""
+    if cadence == "weekly":
+        return day + timedelta(days=7)
+    month_index = day.year * 12 + day.month - 1 + MONTHS_PER_CADENCE[cadence]
+    year, month = divmod(month_index, 12)
+    month += 1
+    return date(year, month, min(anchor_day, calendar.monthrange(year, month)[1]))
+
+
+def due_periods(definition, as_of, limit=MAX_CATCH_UP_PERIODS):
+    """Return (periods due on or before as_of, the next_run that follows them)"""
+    day = date.fromisoformat(definition["next_run"])
+    periods = []
+    while day <= as_of and len(periods) < limit:
+        periods.append(day)
+        day = next_period(day, definition["cadence"], definition["anchor_day"])
+    return periods, day
+
+
+def recurring_invoice_id(definition_id, period):
+    return f"REC-{definition_id}-{period:%Y%m%d}"
+
+
+class RunResult:
+    def __init__(self):
+        self.created = []
+        self.skipped = []
+        self.errors = []
+
+    def summary(self):
+        text = f"{len(self.created)} invoice(s) created"
+        if self.skipped:
+            text += f", {len(self.skipped)} already existed"
+        if self.errors:
+            text += f", {len(self.errors)} definition(s) failed"
+        return text
+
+
+class RecurringScheduler:
+    """Generates the invoices of all due recurring definitions.
+
+    With render=False the invoices are stored with their render data only
+    and turned into PDFs on first download or reprint, like the HTTP
+    service's "render": false.
+    """
+
+    def __init__(self, render=True, render_workers=2, cache=None):
+        self.render = render
+        self.render_workers = render_workers
+        self.cache = cache or RenderCache(
+            app_config.get_str("render_cache_dir", "render_cache"),
+            app_config.get_int("render_cache_max_mb", 500) * 1024 * 1024,
+        )
+        self.renderer = None
+
+    def get_renderer(self):
+        template_path = app_config["template_path"]
+        if self.renderer is None or self.renderer.template_path != template_path:
+            self.renderer = InvoiceRenderer(template_path)
+        return self.renderer
+
+    def plan(self, as_of):
+        """Build (definition, invoices, next_run) for every due definition"""
+        as_of = as_of or date.today()
+        conn = InvoiceDB.connect()
+        try:
+            with span("recurring.due_query"):
+                definitions = RecurringDB.get_due(conn.cursor(), as_of.isoformat())
+        finally:
+            conn.close()
+        if not definitions:
+            return [], []
+
+        clients = {client["id"]: client for client in ClientDB.load_clients()}
+        business_info = app_config["business_info"]
+        renderer = self.get_renderer() if self.render else None
+        plans = []
+        errors = []
+        for definition in definitions:
+            client = clients.get(definition["client_id"])
+            if client is None:
+                errors.append((definition["id"], f"Client {definition['client_id']} not found"))
+                continue
+            periods, next_run = due_periods(definition, as_of)
+            invoices = []
+            try:
+                for period in periods:
+                    placeholders, items, invoice_data = build_invoice(
+                        client, definition["lines"], definition["tax_rate"], definition["payment"],
+                        business_info, recurring_invoice_id(definition["id"], period),
+                        f"{period.isoformat()} 00:00")
+                    invoice_data["render_data"] = {"placeholders": placeholders, "items": list(items)}
+                    if renderer is not None:
+                        invoice_data["content_hash"] = renderer.cache_key(placeholders, items)
+                    invoices.append((period, invoice_data))
+            except ValueError as e:
+                errors.append((definition["id"], str(e)))
+                continue
+            plans.append((definition, invoices, next_run))
+        return plans, errors
+
+    def render_all(self, plans):
+        """Render every invoice not already cached in one pool pass; return failed keys"""
+        renderer = self.get_renderer()
+        renderer.load_template()
+        jobs = {}
+        for definition, invoices, next_run in plans:
+            for period, invoice_data in invoices:
+                key = invoice_data["content_hash"]
+                if key not in jobs and not self.cache.contains(key):
+                    jobs[key] = invoice_data["render_data"]
+
+        def render_one(key):
+            render_data = jobs[key]
+            try:
+                renderer.render_cached(self.cache, render_data["placeholders"], render_data["items"], key)
+                return None
+            except Exception as e:
+                return key, str(e)
+
+        if not jobs:
+            return {}
+        with span("recurring.render", count=len(jobs)):
+            with ThreadPoolExecutor(max_workers=self.render_workers,
+                                    initializer=init_render_thread) as pool:
+                return dict(failure for failure in pool.map(render_one, jobs) if failure)
+
+    def run(self, as_of=None, dry_run=False):
+        """Generate everything due on or before as_of (a date, today by default)"""
+        result = RunResult()
+        with span("recurring.plan"):
+            plans, result.errors = self.plan(as_of)
+        if dry_run:
+            result.created = [invoice_data["invoice_id"] for _, invoices, _ in plans
+                              for _, invoice_data in invoices]
+            return result
+        if not plans:
+            return result
+
+        if self.render:
+            failed = self.render_all(plans)
+            if failed:
+                # Keep the periods before the first failure; the rest wait for the next run
+                kept = []
+                for definition, invoices, next_run in plans:
+                    for index, (period, invoice_data) in enumerate(invoices):
+                        if invoice_data["content_hash"] in failed:
+                            result.errors.append((definition["id"], failed[invoice_data["content_hash"]]))
+                            invoices, next_run = invoices[:index], period
+                            break
+                    if invoices:
+                        kept.append((definition, invoices, next_run))
+                plans = kept
+
+        now = datetime.now().isoformat()
+
+        def commit(c):
+            created = []
+            advanced = []
+            for definition, invoices, next_run in plans:
+                created += InvoiceDB.insert_invoices(
+                    c, [invoice_data for _, invoice_data in invoices], skip_existing=True)
+                # Guarded on the old date so a concurrent run can't move it twice
+                c.execute(
+                    """UPDATE recurring_invoices SET next_run = ?, updated_at = ?
+                       WHERE id = ? AND next_run = ?""",
+                    (next_run.isoformat(), now, definition["id"], definition["next_run"]),
+                )
+                if c.rowcount:
+                    advanced.append(definition["id"])
+            return created, advanced
+
+        with span("recurring.commit"):
+            created, advanced = InvoiceDB.run_write(commit)
+        created_ids = set(created)
+        for _, invoices, _ in plans:
+            for _, invoice_data in invoices:
+                target = result.created if invoice_data["invoice_id"] in created_ids else result.skipped
+                target.append(invoice_data["invoice_id"])
+        if created:
+            bus.publish(INVOICE, CREATED, created)
+        if advanced:
+            bus.publish(RECURRING, UPDATED, advanced)
+        return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m invoice_maker recurring",
+                                     description="Generate due recurring invoices")
+    parser.add_argument("--as-of", type=date.fromisoformat, default=None,
+                        help="bill periods up to this YYYY-MM-DD date (default: today)")
+    parser.add_argument("--dry-run", action="store_true", help="list what would be generated")
+    parser.add_argument("--no-render", action="store_true",
+                        help="store the invoices and render them on first download instead")
+    parser.add_argument("--render-workers", type=int, default=2)
+    parser.add_argument("--list", action="store_true", help="show the recurring definitions")
+    parser.add_argument("--pause", type=int, metavar="ID")
+    parser.add_argument("--resume", type=int, metavar="ID")
+    parser.add_argument("--delete", type=int, metavar="ID")
+    args = parser.parse_args(argv)
+
+    InvoiceDB.initialize()
+    if args.pause is not None or args.resume is not None:
+        RecurringDB.set_active(args.resume if args.pause is None else args.pause, args.pause is None)
+        return
+    if args.delete is not None:
+        RecurringDB.delete_definition(args.delete)
+        return
+    if args.list:
+        clients = {client["id"]: client["name"] for client in ClientDB.load_clients()}
+        print(f"{'id':>5}  {'next run':<10}  {'cadence':<9}  {'active':<6}  client")
+        for definition in RecurringDB.get_definitions():
+            print(f"{definition['id']:>5}  {definition['next_run']:<10}  {definition['cadence']:<9}  "
+                  f"{'yes' if definition['active'] else 'no':<6}  "
+                  f"{clients.get(definition['client_id'], definition['client_id'])}")
+        return
+
+    scheduler = RecurringScheduler(render=not args.no_render, render_workers=args.render_workers)
+    result = scheduler.run(args.as_of, dry_run=args.dry_run)
+    for invoice_id in result.created:
+        print(invoice_id)
+    for definition_id, message in result.errors:
+        print(f"Recurring invoice {definition_id}: {message}")
+    if args.dry_run:
+        print(f"Would create {len(result.created)} invoice(s)")
+    else:
+        print(result.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+
+def normalize_render_data(placeholders, items=()):
+    """Canonical form of the values that go into a render"""
+    return {
+        "placeholders": {str(k): str(v).strip() for k, v in placeholders.items()},
+        "items": [{str(k): str(v).strip() for k, v in item.items()} for item in items],
+    }
+
+
+def compute_key(placeholders, items, template_hash, backend_version):
+    payload = json.dumps(
+        {
+            "data": normalize_render_data(placeholders, items),
+            "template": template_hash,
+            "backend": backend_version,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """Content-addressed store of rendered PDFs with size-bounded LRU eviction.
+
+    Entries live at <cache_dir>/<key[:2]>/<key>.pdf. A hit bumps the file's
+    mtime, and eviction removes the least recently used files until the
+    cache is back under max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes=500 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pdf")
+
+    def contains(self, key):
+        return os.path.exists(self.path_for(key))
+
+    def lookup(self, key):
+        """Return the path of a cached PDF (marking it recently used), or None"""
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            return None
+        self._touch(path)
+        return path
+
+    def fetch(self, key, output_path):
+        """Copy a cached PDF to output_path; returns False on a miss"""
+        path = self.path_for(key)
+        try:
+            shutil.copyfile(path, output_path)
+        except FileNotFoundError:
+            return False
+        self._touch(path)
+        return True
+
+    def read(self, key):
+        path = self.path_for(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        self._touch(path)
+        return data
+
+    def store(self, key, source_path):
+        path = self.path_for(key)
+        if os.path.exists(path):
+            # Same key means same content; nothing to write
+            self._touch(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Copy next to the final name and rename, so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as dst, open(source_path, "rb") as src:
+                shutil.copyfileobj(src, dst)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+        with self._lock:
+            if self._size is not None:
+                self._size += os.path.getsize(path)
+            if self.current_size() > self.max_bytes:
+                self._evict()
+
+    def current_size(self):
+        if self._size is None:
+            self._size = sum(size for _, _, size in self._entries())
+        return self._size
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for bucket in os.scandir(self.cache_dir):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.name.endswith(".pdf"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._size = total
@@ -0,0 +1,216 @@
+import itertools
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from db import InvoiceDB
+from renderer import convert_to_pdf
+from tracing import tracer
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class RenderCancelled(Exception):
+    pass
+
+
+def init_render_thread():
+    # docx2pdf drives Word over COM on Windows, which needs per-thread setup
+    try:
+        import pythoncom
+        pythoncom.CoInitialize()
+    except ImportError:
+        pass
+
+
+class RenderJob:
+    def __init__(self, job_id, renderer, placeholders, output_path, invoice_data, items=(),
+                 content_hash=None):
+        self.job_id = job_id
+        self.renderer = renderer
+        self.placeholders = placeholders
+        self.items = items
+        self.output_path = output_path
+        self.invoice_data = invoice_data
+        self.content_hash = content_hash
+        self.status = QUEUED
+        self.progress = "Queued"
+        self.error = None
+        self.pdf_written = False
+        # Set once the PDF is in place and the job is being saved; cancel() refuses from then on
+        self.committed = False
+        self.future = None
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def invoice_id(self):
+        return self.placeholders.get("[invoice_id]", "")
+
+    @property
+    def is_reprint(self):
+        return self.invoice_data is None
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise RenderCancelled()
+
+
+class RenderQueue:
+    """Runs invoice renders on worker threads.
+
+    Workers never touch Tk; they push state changes onto a thread-safe queue
+    that the GUI drains with poll() from an after() callback. The invoice is
+    only saved to InvoiceDB once its PDF has been written.
+
+    With a RenderCache, finished PDFs are stored by content hash and
+    identical renders (including reprints) are copied from the cache.
+    """
+
+    def __init__(self, max_workers=2, cache=None):
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="render",
+            initializer=init_render_thread,
+        )
+        self._events = queue.Queue()
+        self._ids = itertools.count(1)
+        self.jobs = {}
+
+    def submit(self, renderer, placeholders, output_path, invoice_data, items=()):
+        job = RenderJob(next(self._ids), renderer, placeholders, output_path, invoice_data, items)
+        return self._enqueue(job)
+
+    def submit_reprint(self, renderer, render_data, output_path, content_hash=None):
+        """Write an already recorded invoice to output_path without saving it again"""
+        job = RenderJob(next(self._ids), renderer, render_data["placeholders"], output_path,
+                        None, render_data.get("items", ()), content_hash)
+        return self._enqueue(job)
+
+    def _enqueue(self, job):
+        self.jobs[job.job_id] = job
+        job.future = self._executor.submit(self._run, job)
+        self._events.put(job)
+        return job
+
+    def cancel(self, job_id):
+        """Ask a job to stop; False if it is finished or already saving"""
+        job = self.jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        with job._lock:
+            if job.committed:
+                return False
+            job._cancel_event.set()
+        # Jobs still waiting for a worker are dropped straight away
+        if job.future.cancel():
+            self._set_state(job, CANCELLED, "Cancelled")
+        return True
+
+    def poll(self):
+        """Return the jobs that changed since the last call (main thread only)"""
+        changed = {}
+        while True:
+            try:
+                job = self._events.get_nowait()
+            except queue.Empty:
+                break
+            changed[job.job_id] = job
+        return list(changed.values())
+
+    def forget(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is not None and job.finished:
+            del self.jobs[job_id]
+
+    def shutdown(self, wait=False):
+        for job in self.jobs.values():
+            if not job.finished:
+                job._cancel_event.set()
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _set_state(self, job, status, progress, error=None):
+        job.status = status
+        job.progress = progress
+        job.error = error
+        self._events.put(job)
+
+    @tracer.traced("render.job")
+    def _run(self, job):
+        try:
+            job.check_cancelled()
+            if not self._fetch_cached(job):
+                self._render(job)
+            # Past this point the job can no longer be cancelled
+            with job._lock:
+                job.check_cancelled()
+                job.committed = True
+
+            if job.is_reprint:
+                self._set_state(job, DONE, "Done")
+                return
+            self._set_state(job, RUNNING, "Saving")
+            InvoiceDB.save_invoice(job.invoice_data)
+            self._set_state(job, DONE, "Saved")
+        except RenderCancelled:
+            self._remove_output(job)
+            self._set_state(job, CANCELLED, "Cancelled")
+        except Exception as e:
+            self._remove_output(job)
+            self._set_state(job, FAILED, "Failed", str(e))
+
+    def _fetch_cached(self, job):
+        key = job.renderer.cache_key(job.placeholders, job.items)
+        if job.invoice_data is not None:
+            job.invoice_data["content_hash"] = key
+            job.invoice_data["render_data"] = {"placeholders": job.placeholders, "items": list(job.items)}
+        if self.cache is None:
+            return False
+        # Reprints look up the hash recorded at first render so they get the original bytes
+        for candidate in filter(None, (job.content_hash, key)):
+            if self.cache.fetch(candidate, job.output_path):
+                job.pdf_written = True
+                return True
+        job.content_hash = key
+        return False
+
+    def _render(self, job):
+        pool = job.renderer.pool
+        docx_buffer = pool.acquire()
+        try:
+            self._set_state(job, RUNNING, "Filling template")
+            job.renderer.render_docx(job.placeholders, docx_buffer, job.items)
+            job.check_cancelled()
+
+            self._set_state(job, RUNNING, "Converting to PDF")
+            convert_to_pdf(docx_buffer, job.output_path)
+            job.pdf_written = True
+            if self.cache is not None:
+                self.cache.store(job.content_hash, job.output_path)
+        finally:
+            pool.release(docx_buffer)
+
+    @staticmethod
+    def _remove_output(job):
+        # Don't leave a PDF behind for an invoice that was never recorded
+        if not job.pdf_written:
+            return
+        try:
+            os.remove(job.output_path)
+        except OSError:
+            pass
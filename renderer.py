@@ -0,0 +1,268 @@
+import copy
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+from render_cache import compute_key
+from tracing import span
+
+# python-docx and docx2pdf are slow to import, so they are only loaded on
+# first render; element names are spelled out to avoid needing docx.oxml.ns
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+# Bump when the way templates are filled changes, so cached renders expire
+ENGINE_VERSION = "2"
+
+W_TR = W_NS + "tr"
+W_P = W_NS + "p"
+W_T = W_NS + "t"
+W_TR_PR = W_NS + "trPr"
+
+# The table row holding these placeholders is cloned once per line item
+ITEM_ROW_MARKER = "[item]"
+ITEM_FIELDS = ("[item]", "[item_qty]", "[item_price]", "[item_total]")
+
+# Older templates have fixed [service1]..[serviceN] rows; the first one is
+# used as the repeating row and the rest are dropped
+LEGACY_ITEM_ROW = re.compile(r"\[service\d+\]")
+LEGACY_ITEM_FIELDS = (
+    (re.compile(r"\[service\d+\]"), "[item]"),
+    (re.compile(r"\[s\d+num\]"), "[item_qty]"),
+    (re.compile(r"\[s\d+pri\]"), "[item_price]"),
+    (re.compile(r"\[s\d+sum\]"), "[item_total]"),
+)
+
+# Directories backed by RAM on most Linux systems, tried in order
+TMPFS_DIRS = ("/dev/shm", "/run/shm")
+
+
+def get_temp_root():
+    """Return a tmpfs directory for per-job scratch files, or None for the OS default"""
+    for path in TMPFS_DIRS:
+        if os.path.isdir(path) and os.access(path, os.W_OK):
+            return path
+    return None
+
+
+def replace_placeholders(paragraph, placeholders):
+    text = paragraph.text
+    if "[" not in text:
+        return
+    for key, value in placeholders.items():
+        if key in text:
+            text = text.replace(key, value)
+    if text != paragraph.text:
+        paragraph.text = text
+
+
+def fill_document(doc, placeholders):
+    for p in doc.paragraphs:
+        replace_placeholders(p, placeholders)
+
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                for p in cell.paragraphs:
+                    replace_placeholders(p, placeholders)
+    return doc
+
+
+def _row_text(tr):
+    return "".join(t.text or "" for t in tr.iter(W_T))
+
+
+def _merge_placeholder_runs(tr):
+    # Word often splits "[item_qty]" across runs; join each paragraph's text
+    # into its first run (keeping that run's formatting) so it can be replaced
+    for p in tr.iter(W_P):
+        texts = list(p.iter(W_T))
+        full = "".join(t.text or "" for t in texts)
+        if "[" not in full:
+            continue
+        for pattern, field in LEGACY_ITEM_FIELDS:
+            full = pattern.sub(field, full)
+        texts[0].text = full
+        texts[0].set(XML_SPACE, "preserve")
+        for t in texts[1:]:
+            t.text = ""
+
+
+def _set_row_property(tr, tag):
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+
+    tr_pr = tr.find(W_TR_PR)
+    if tr_pr is None:
+        tr_pr = OxmlElement("w:trPr")
+        tr.insert(0, tr_pr)
+    if tr_pr.find(qn(tag)) is None:
+        tr_pr.append(OxmlElement(tag))
+
+
+def find_item_row(doc):
+    """Return (prototype_row, legacy_rows) for the repeating line-item row"""
+    prototype = None
+    legacy_rows = []
+    for tr in doc.element.body.iter(W_TR):
+        text = _row_text(tr)
+        if ITEM_ROW_MARKER in text:
+            return tr, []
+        if LEGACY_ITEM_ROW.search(text):
+            if prototype is None:
+                prototype = tr
+            else:
+                legacy_rows.append(tr)
+    return prototype, legacy_rows
+
+
+def expand_item_rows(doc, items):
+    """Clone the template's line-item row once per item.
+
+    Each clone is a deep copy of the prototype row's XML with the item
+    fields substituted in its text nodes, so the cost per item is a copy and
+    a handful of string replacements rather than a document re-parse. Rows
+    are marked as non-splitting and the table header repeats, so Word breaks
+    long tables across pages cleanly.
+    """
+    prototype, legacy_rows = find_item_row(doc)
+    if prototype is None:
+        return doc
+
+    _merge_placeholder_runs(prototype)
+    table = prototype.getparent()
+    header = table.find(W_TR)
+    if header is not None and header is not prototype:
+        _set_row_property(header, "w:tblHeader")
+    _set_row_property(prototype, "w:cantSplit")
+
+    for item in items:
+        row = copy.deepcopy(prototype)
+        for t in row.iter(W_T):
+            text = t.text
+            if text and "[" in text:
+                for field in ITEM_FIELDS:
+                    if field in text:
+                        text = text.replace(field, item.get(field, ""))
+                t.text = text
+        prototype.addprevious(row)
+
+    for tr in [prototype] + legacy_rows:
+        tr.getparent().remove(tr)
+    return doc
+
+
+def backend_version():
+    """Identify the PDF converter, since its output changes between releases"""
+    try:
+        from importlib.metadata import version
+        return f"docx2pdf-{version('docx2pdf')}"
+    except Exception:
+        return "docx2pdf-unknown"
+
+
+def convert_to_pdf(docx_buffer, output_path=None, pdf_buffer=None):
+    """Convert an in-memory DOCX to PDF.
+
+    docx2pdf only works on files, so the DOCX is spilled into a private
+    temp directory (on tmpfs when available) that is removed afterwards.
+    The PDF is copied to output_path and/or read into pdf_buffer.
+    """
+    from docx2pdf import convert
+
+    job_dir = tempfile.mkdtemp(prefix="invoice-", dir=get_temp_root())
+    try:
+        docx_path = os.path.join(job_dir, "invoice.docx")
+        pdf_path = os.path.join(job_dir, "invoice.pdf")
+        with open(docx_path, "wb") as f:
+            f.write(docx_buffer.getbuffer())
+        with span("pdf.convert"):
+            convert(docx_path, pdf_path)
+
+        if pdf_buffer is not None:
+            with open(pdf_path, "rb") as f:
+                pdf_buffer.seek(0)
+                pdf_buffer.truncate(0)
+                shutil.copyfileobj(f, pdf_buffer)
+            pdf_buffer.seek(0)
+        if output_path:
+            shutil.copyfile(pdf_path, output_path)
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+    return pdf_buffer
+
+
+class InvoiceRenderer:
+    """Renders invoices from a DOCX template without touching the working directory.
+
+    The template is read from disk once and every render works on BytesIO
+    buffers, so one renderer can be reused for a whole batch.
+    """
+
+    def __init__(self, template_path):
+        self.template_path = template_path
+        self._template_bytes = None
+        self._template_hash = None
+
+    @property
+    def template_hash(self):
+        """Hash of the template contents and the engine that compiles it"""
+        if self._template_hash is None:
+            digest = hashlib.sha256(self.load_template())
+            digest.update(ENGINE_VERSION.encode())
+            self._template_hash = digest.hexdigest()
+        return self._template_hash
+
+    def cache_key(self, placeholders, items=()):
+        return compute_key(placeholders, items, self.template_hash, backend_version())
+
+    def load_template(self):
+        # Raises FileNotFoundError if the template is missing
+        if self._template_bytes is None:
+            with open(self.template_path, "rb") as f:
+                self._template_bytes = f.read()
+        return self._template_bytes
+
+    def render_docx(self, placeholders, buffer=None, items=()):
+        from docx import Document
+
+        with span("template.load"):
+            doc = Document(io.BytesIO(self.load_template()))
+        # Fill the shared placeholders first so the cloned rows aren't rescanned
+        with span("template.fill"):
+            fill_document(doc, placeholders)
+        with span("template.items", count=len(items)):
+            expand_item_rows(doc, items)
+        buffer = buffer if buffer is not None else io.BytesIO()
+        buffer.seek(0)
+        buffer.truncate(0)
+        with span("template.save"):
+            doc.save(buffer)
+        buffer.seek(0)
+        return buffer
+
+    def render(self, placeholders, output_path=None, pdf_buffer=None, items=()):
+        docx_buffer = self.render_docx(placeholders, items=items)
+        return convert_to_pdf(docx_buffer, output_path, pdf_buffer)
+
+    def render_cached(self, cache, placeholders, items=(), key=None):
+        """Return the path of this invoice's PDF in a RenderCache, rendering it on a miss"""
+        key = key or self.cache_key(placeholders, items)
+        path = cache.lookup(key)
+        if path is None:
+            job_dir = tempfile.mkdtemp(prefix="invoice-render-", dir=get_temp_root())
+            try:
+                output_path = os.path.join(job_dir, "invoice.pdf")
+                self.render(placeholders, output_path, items=items)
+                cache.store(key, output_path)
+            finally:
+                shutil.rmtree(job_dir, ignore_errors=True)
+            path = cache.lookup(key)
+        return path
+
+    def render_batch(self, jobs):
+        """Render (placeholders, items, output_path) jobs, reusing the same buffers"""
+        for placeholders, items, output_path in jobs:
+            self.render(placeholders, output_path, items=items)
@@ -0,0 +1,482 @@
+"""Local HTTP/JSON API for creating and querying invoices from other systems.
+
+    python -m invoice_maker serve --port 8765
+
+Endpoints (JSON in and out unless noted):
+
+    GET    /health
+    GET    /clients?q=&limit=          list or search clients
+    POST   /clients                    add a client
+    GET    /clients/<id>
+    PUT    /clients/<id>               update; include "version" to reject stale edits
+    DELETE /clients/<id>?version=
+    GET    /invoices?client_name=&status=&date_from=&date_to=&order_by=&limit=&offset=
+    POST   /invoices                   create (and by default render) an invoice
+    GET    /invoices/<id>
+    GET    /invoices/<id>/pdf          application/pdf
+"""
+import argparse
+import asyncio
+import json
+import queue
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from config import app_config
+from db import INVOICE_STATUSES, ClientDB, ClientConflictError, InvoiceDB
+from invoice_data import build_invoice
+from render_cache import RenderCache
+from render_queue import init_render_thread
+from renderer import InvoiceRenderer
+
+DEFAULT_PORT = 8765
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+# Seconds an idle keep-alive connection is kept open
+KEEP_ALIVE_TIMEOUT = 30
+MAX_PAGE_SIZE = 500
+# Attempts at a fresh generated invoice ID if the first one is taken
+ID_ATTEMPTS = 3
+STATUS_TEXT = {
+    200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 401: "Unauthorized",
+    404: "Not Found", 405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+    500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers
+
+
+class Response:
+    def __init__(self, status=200, body=None, content_type="application/json", headers=None):
+        self.status = status
+        self.headers = dict(headers or {})
+        if body is None:
+            self.body = b""
+        elif isinstance(body, bytes):
+            self.body = body
+        else:
+            self.body = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.content_type = content_type
+
+
+class ConnectionPool:
+    """Fixed set of read connections shared by the DB worker threads"""
+
+    def __init__(self, size):
+        self._idle = queue.Queue()
+        for _ in range(size):
+            conn = InvoiceDB.connect(check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._idle.put(conn)
+        self.size = size
+
+    @contextmanager
+    def connection(self):
+        conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        for _ in range(self.size):
+            self._idle.get().close()
+
+
+class InvoiceService:
+    """asyncio HTTP server in front of ClientDB, InvoiceDB and the renderer.
+
+    Requests are handled concurrently on the event loop; blocking work runs
+    on two thread pools, one for database/file access with a pooled
+    connection per thread and one for rendering. When max_inflight requests
+    or max_pending_renders renders are already queued, new ones get an
+    immediate 503 with Retry-After instead of piling up.
+    """
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, db_workers=4, render_workers=2,
+                 max_inflight=64, max_pending_renders=16, token=None):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.max_inflight = max_inflight
+        self.max_pending_renders = max_pending_renders
+        self.inflight = 0
+        self.pending_renders = 0
+        self.db_executor = ThreadPoolExecutor(db_workers, thread_name_prefix="service-db")
+        self.render_executor = ThreadPoolExecutor(render_workers, thread_name_prefix="service-render",
+                                                  initializer=init_render_thread)
+        self.pool = ConnectionPool(db_workers)
+        self.cache = RenderCache(
+            app_config.get_str("render_cache_dir", "render_cache"),
+            app_config.get_int("render_cache_max_mb", 500) * 1024 * 1024,
+        )
+        self._renderer = None
+        self._renderer_lock = threading.Lock()
+        self.routes = [
+            ("GET", r"/health", self.health),
+            ("GET", r"/clients", self.list_clients),
+            ("POST", r"/clients", self.create_client),
+            ("GET", r"/clients/([^/]+)", self.get_client),
+            ("PUT", r"/clients/([^/]+)", self.update_client),
+            ("DELETE", r"/clients/([^/]+)", self.delete_client),
+            ("GET", r"/invoices", self.list_invoices),
+            ("POST", r"/invoices", self.create_invoice),
+            ("GET", r"/invoices/([^/]+)", self.get_invoice),
+            ("GET", r"/invoices/([^/]+)/pdf", self.get_invoice_pdf),
+        ]
+        self.routes = [(method, re.compile(pattern + "$"), handler) for method, pattern, handler in self.routes]
+
+    async def run(self):
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        print(f"Serving on http://{self.host}:{self.port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        self.db_executor.shutdown(wait=True)
+        self.render_executor.shutdown(wait=True)
+        self.pool.close()
+
+    # ---- HTTP plumbing ----
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self.read_request(reader), KEEP_ALIVE_TIMEOUT)
+                except HTTPError as e:
+                    await self.write_response(writer, Response(e.status, {"error": str(e)}), False)
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                response = await self.dispatch(method, target, headers, body)
+                await self.write_response(writer, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+        headers = {}
+        size = len(line)
+        while True:
+            line = await reader.readline()
+            size += len(line)
+            if size > MAX_HEADER_BYTES:
+                raise HTTPError(413, "Headers too large")
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HTTPError(400, "Bad Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "Body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, headers, body
+
+    async def write_response(self, writer, response, keep_alive):
+        head = [f"HTTP/1.1 {response.status} {STATUS_TEXT.get(response.status, '')}",
+                f"Content-Type: {response.content_type}",
+                f"Content-Length: {len(response.body)}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        head += [f"{name}: {value}" for name, value in response.headers.items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + response.body)
+        await writer.drain()
+
+    async def dispatch(self, method, target, headers, body):
+        if self.token and headers.get("authorization") != f"Bearer {self.token}":
+            return Response(401, {"error": "Missing or wrong bearer token"})
+        if self.inflight >= self.max_inflight:
+            return Response(503, {"error": "Server busy"}, headers={"Retry-After": "1"})
+        url = urlsplit(target)
+        path = url.path.rstrip("/") or "/"
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            match = pattern.match(path)
+            if not match:
+                continue
+            allowed = True
+            if route_method != method:
+                continue
+            self.inflight += 1
+            try:
+                payload = json.loads(body) if body else {}
+                if not isinstance(payload, dict):
+                    return Response(400, {"error": "Body must be a JSON object"})
+                return await handler(query, payload, *[unquote(group) for group in match.groups()])
+            except json.JSONDecodeError:
+                return Response(400, {"error": "Body is not valid JSON"})
+            except HTTPError as e:
+                return Response(e.status, {"error": str(e)}, headers=e.headers)
+            except FileNotFoundError as e:
+                # Most likely the invoice template configured in app_config.json
+                return Response(500, {"error": f"File not found: {e.filename}"})
+            except ClientConflictError as e:
+                return Response(409, {"error": str(e)})
+            except ValueError as e:
+                # The DB layer reports missing records as ValueError("... not found")
+                return Response(404 if "not found" in str(e) else 400, {"error": str(e)})
+            except Exception as e:
+                print(f"Error handling {method} {path}: {str(e)}")
+                return Response(500, {"error": "Internal error"})
+            finally:
+                self.inflight -= 1
+        if allowed:
+            return Response(405, {"error": f"{method} not allowed on {path}"})
+        return Response(404, {"error": f"No route for {path}"})
+
+    def run_db(self, func, *args, **kwargs):
+        return asyncio.get_running_loop().run_in_executor(self.db_executor, partial(func, *args, **kwargs))
+
+    def run_read(self, func, *args):
+        """Run func(*args, conn=...) on a DB worker with a pooled connection"""
+        def call():
+            with self.pool.connection() as conn:
+                return func(*args, conn=conn)
+        return self.run_db(call)
+
+    async def run_render(self, func, *args):
+        if self.pending_renders >= self.max_pending_renders:
+            raise HTTPError(503, "Render queue is full", {"Retry-After": "5"})
+        self.pending_renders += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.render_executor, partial(func, *args))
+        finally:
+            self.pending_renders -= 1
+
+    # ---- Clients ----
+
+    async def health(self, query, payload):
+        return Response(200, {"status": "ok", "inflight": self.inflight, "pending_renders": self.pending_renders})
+
+    async def list_clients(self, query, payload):
+        limit = _int_param(query, "limit", 100, 1, 10_000)
+        if query.get("q"):
+            clients = await self.run_db(ClientDB.search_clients, query["q"])
+        else:
+            clients = await self.run_db(ClientDB.load_clients)
+        return Response(200, {"total": len(clients), "items": clients[:limit]})
+
+    async def create_client(self, query, payload):
+        data = _client_fields(payload)
+        client_id = await self.run_db(ClientDB.add_client, data)
+        return Response(201, await self.run_db(ClientDB.get_client, client_id))
+
+    async def get_client(self, query, payload, client_id):
+        client = await self.run_db(ClientDB.get_client, client_id)
+        if client is None:
+            raise HTTPError(404, f"Client with ID {client_id} not found")
+        return Response(200, client)
+
+    async def update_client(self, query, payload, client_id):
+        data = _client_fields(payload, partial_update=True)
+        version = _int_param(payload, "version", None, 0, None)
+        await self.run_db(ClientDB.update_client, client_id, data, version)
+        return Response(200, await self.run_db(ClientDB.get_client, client_id))
+
+    async def delete_client(self, query, payload, client_id):
+        version = _int_param(query, "version", None, 0, None)
+        await self.run_db(ClientDB.delete_client, client_id, version)
+        return Response(204)
+
+    # ---- Invoices ----
+
+    async def list_invoices(self, query, payload):
+        filters = {key: query[key] for key in ("client_name", "status", "date_from", "date_to") if query.get(key)}
+        order_by = query.get("order_by", "invoice_date DESC")
+        limit = _int_param(query, "limit", 50, 1, MAX_PAGE_SIZE)
+        offset = _int_param(query, "offset", 0, 0, None)
+
+        def fetch(conn):
+            total = InvoiceDB.count_invoices(filters, conn=conn)
+            rows = InvoiceDB.get_invoices_page(filters, order_by, limit, offset, conn=conn)
+            return total, [dict(row) for row in rows]
+
+        total, items = await self.run_read(fetch)
+        return Response(200, {"total": total, "limit": limit, "offset": offset, "items": items})
+
+    async def get_invoice(self, query, payload, invoice_id):
+        def fetch(conn):
+            row = conn.execute("SELECT * FROM invoices WHERE invoice_id = ?", (invoice_id,)).fetchone()
+            if row is None:
+                raise ValueError(f"Invoice with ID {invoice_id} not found")
+            invoice = dict(row)
+            invoice.pop("render_data", None)
+            return invoice
+
+        return Response(200, await self.run_read(fetch))
+
+    async def create_invoice(self, query, payload):
+        """Body: {"client_id" | "client": {...}, "lines": [{"description", "quantity",
+        "unit_price"}], "tax_rate", "payment": {...}, "invoice_date", "payment_terms_days",
+        "status", "render"}"""
+        if payload.get("client_id"):
+            client = await self.run_db(ClientDB.get_client, payload["client_id"])
+            if client is None:
+                raise HTTPError(404, f"Client with ID {payload['client_id']} not found")
+        elif isinstance(payload.get("client"), dict) and payload["client"].get("name"):
+            client = payload["client"]
+        else:
+            raise HTTPError(400, "client_id or client.name is required")
+        raw_lines = payload.get("lines")
+        if not isinstance(raw_lines, list) or not raw_lines:
+            raise HTTPError(400, "lines must be a non-empty list")
+        if not all(isinstance(line, dict) for line in raw_lines):
+            raise HTTPError(400, "each entry in lines must be an object")
+        if not isinstance(payload.get("payment") or {}, dict):
+            raise HTTPError(400, "payment must be an object")
+        if payload.get("status") and payload["status"] not in INVOICE_STATUSES:
+            raise HTTPError(400, f"status must be one of {', '.join(INVOICE_STATUSES)}")
+        lines = [(str(line.get("description", "")), line.get("quantity"), line.get("unit_price"))
+                 for line in raw_lines]
+
+        for attempt in range(ID_ATTEMPTS):
+            placeholders, items, invoice_data = build_invoice(
+                client, lines, payload.get("tax_rate", 0), payload.get("payment") or {},
+                app_config["business_info"], invoice_date=payload.get("invoice_date"),
+                payment_terms_days=payload.get("payment_terms_days"))
+            if payload.get("status"):
+                invoice_data["status"] = payload["status"]
+            try:
+                if payload.get("render", True):
+                    await self.run_render(self.render_and_save, placeholders, items, invoice_data)
+                else:
+                    # Recorded now; the PDF is rendered the first time it is downloaded
+                    invoice_data["render_data"] = {"placeholders": placeholders, "items": items}
+                    await self.run_db(InvoiceDB.save_invoice, invoice_data)
+                break
+            except ValueError as e:
+                if "already exists" not in str(e) or attempt == ID_ATTEMPTS - 1:
+                    raise
+        invoice_id = invoice_data["invoice_id"]
+        return Response(201, {
+            "invoice_id": invoice_id,
+            "total_amount": invoice_data["total_amount"],
+            "tax_amount": invoice_data["tax_amount"],
+            "due_date": invoice_data["due_date"],
+            "pdf": f"/invoices/{invoice_id}/pdf",
+        })
+
+    async def get_invoice_pdf(self, query, payload, invoice_id):
+        content_hash, render_data = await self.run_db(InvoiceDB.get_render_data, invoice_id)
+        # Read on a worker; an eviction in the meantime is just a miss
+        pdf = await self.run_db(self.cache.read, content_hash) if content_hash else None
+        if pdf is None:
+            if not render_data:
+                raise HTTPError(404, f"No PDF was recorded for {invoice_id}")
+            pdf = await self.run_render(self.render_pdf, render_data["placeholders"],
+                                        render_data.get("items", ()))
+        return Response(200, pdf, "application/pdf",
+                        {"Content-Disposition": f'attachment; filename="{invoice_id}.pdf"'})
+
+    # ---- Render workers ----
+
+    def get_renderer(self):
+        template_path = app_config["template_path"]
+        with self._renderer_lock:
+            if self._renderer is None or self._renderer.template_path != template_path:
+                self._renderer = InvoiceRenderer(template_path)
+            return self._renderer
+
+    def render_cached(self, placeholders, items):
+        """Return the render cache path for this content, rendering it on a miss"""
+        return self.get_renderer().render_cached(self.cache, placeholders, items)
+
+    def render_pdf(self, placeholders, items):
+        """PDF bytes for this content; rendered again if evicted before it could be read"""
+        renderer = self.get_renderer()
+        key = renderer.cache_key(placeholders, items)
+        for _ in range(2):
+            renderer.render_cached(self.cache, placeholders, items, key)
+            pdf = self.cache.read(key)
+            if pdf is not None:
+                return pdf
+        raise HTTPError(503, "The render cache is too busy to keep this PDF; try again", {"Retry-After": "5"})
+
+    def render_and_save(self, placeholders, items, invoice_data):
+        renderer = self.get_renderer()
+        invoice_data["content_hash"] = renderer.cache_key(placeholders, items)
+        invoice_data["render_data"] = {"placeholders": placeholders, "items": list(items)}
+        self.render_cached(placeholders, items)
+        InvoiceDB.save_invoice(invoice_data)
+
+
+def _int_param(query, name, default, minimum, maximum):
+    """An integer from the query string or a JSON body; 400 if it isn't one"""
+    raw = query.get(name)
+    if raw is None:
+        return default
+    try:
+        if isinstance(raw, bool) or (isinstance(raw, float) and not raw.is_integer()):
+            raise ValueError(raw)
+        value = int(raw)
+    except (TypeError, ValueError, OverflowError):
+        raise HTTPError(400, f"{name} must be an integer")
+    if value < minimum or (maximum is not None and value > maximum):
+        raise HTTPError(400, f"{name} is out of range")
+    return value
+
+
+def _client_fields(payload, partial_update=False):
+    data = {field: str(payload[field]) for field in ("name", "email", "phone", "address") if field in payload}
+    if not partial_update and not data.get("name"):
+        raise HTTPError(400, "name is required")
+    if partial_update and "name" in data and not data["name"]:
+        raise HTTPError(400, "name cannot be empty")
+    return data
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m invoice_maker serve",
+                                     description="Serve the invoice HTTP/JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--db-workers", type=int, default=4, help="threads (and pooled connections) for DB access")
+    parser.add_argument("--render-workers", type=int, default=2, help="threads converting invoices to PDF")
+    parser.add_argument("--max-inflight", type=int, default=64, help="requests handled at once before answering 503")
+    parser.add_argument("--max-pending-renders", type=int, default=16)
+    parser.add_argument("--trace", action="store_true", help="record timing spans to the trace file")
+    args = parser.parse_args(argv)
+
+    from main import configure_instrumentation
+    configure_instrumentation(args.trace)
+    InvoiceDB.initialize()
+    service = InvoiceService(args.host, args.port, args.db_workers, args.render_workers,
+                             args.max_inflight, args.max_pending_renders,
+                             app_config.get_str("service_token", "") or None)
+    try:
+        asyncio.run(service.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+CENT = Decimal("0.01")
+ZERO = Decimal("0")
+HUNDRED = Decimal("100")
+
+InvoiceTotals = namedtuple("InvoiceTotals", ["line_totals", "subtotal", "discount", "tax", "total"])
+# Column-wise results of compute_totals_batch, one entry per invoice
+BatchTotals = namedtuple("BatchTotals", ["subtotals", "discounts", "taxes", "totals"])
+
+
+def to_decimal(value):
+    """Parse a quantity, price or rate; blank counts as zero"""
+    if isinstance(value, Decimal):
+        return value
+    if value is None:
+        return ZERO
+    if isinstance(value, float):
+        # Go through repr so 0.1 stays 0.1 rather than its binary expansion
+        value = repr(value)
+    text = str(value).strip()
+    if not text:
+        return ZERO
+    try:
+        number = Decimal(text)
+    except InvalidOperation:
+        raise ValueError(f"Invalid number: {value!r}")
+    if not number.is_finite():
+        raise ValueError(f"Invalid number: {value!r}")
+    return number
+
+
+def round_money(value):
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _finish(subtotal, tax_rate, discount, discount_percent):
+    # Percentage discounts apply first, then the fixed amount; never below zero
+    discount = round_money(subtotal * discount_percent / HUNDRED) + round_money(discount)
+    discount = min(discount, subtotal) if subtotal > ZERO else ZERO
+    taxable = subtotal - discount
+    tax = round_money(taxable * tax_rate / HUNDRED)
+    return discount, tax, taxable + tax
+
+
+def compute_totals(items, tax_rate=0, discount=0, discount_percent=0):
+    """Compute line totals, subtotal, discount, tax and grand total in one pass.
+
+    items is an iterable of (quantity, unit_price) pairs. Every amount is a
+    Decimal rounded half-up to cents; the subtotal is the sum of the rounded
+    line totals, so the printed lines always add up to it.
+    """
+    tax_rate = to_decimal(tax_rate)
+    line_totals = []
+    subtotal = ZERO
+    for quantity, unit_price in items:
+        line_total = round_money(to_decimal(quantity) * to_decimal(unit_price))
+        line_totals.append(line_total)
+        subtotal += line_total
+    discount, tax, total = _finish(subtotal, tax_rate, to_decimal(discount),
+                                   to_decimal(discount_percent))
+    return InvoiceTotals(line_totals, subtotal, discount, tax, total)
+
+
+def compute_totals_batch(quantities, unit_prices, offsets, tax_rates, discounts=None,
+                         discount_percents=None):
+    """Compute totals for many invoices from flat, column-wise inputs.
+
+    quantities and unit_prices hold every line item of every invoice back
+    to back; invoice i owns items offsets[i]:offsets[i + 1], so offsets has
+    one more entry than there are invoices. tax_rates, discounts and
+    discount_percents hold one value per invoice. Results match
+    compute_totals exactly, invoice by invoice.
+    """
+    count = len(offsets) - 1
+    if len(quantities) != len(unit_prices):
+        raise ValueError("quantities and unit_prices must have the same length")
+    if len(tax_rates) != count:
+        raise ValueError("tax_rates must have one value per invoice")
+    discounts = discounts if discounts is not None else [ZERO] * count
+    discount_percents = discount_percents if discount_percents is not None else [ZERO] * count
+
+    # Line totals are computed for the whole column first, then summed per
+    # invoice through the offsets, so there is no per-invoice item list
+    line_totals = [round_money(to_decimal(q) * to_decimal(p))
+                   for q, p in zip(quantities, unit_prices)]
+    result = BatchTotals([], [], [], [])
+    for i in range(count):
+        subtotal = sum(line_totals[offsets[i]:offsets[i + 1]], ZERO)
+        discount, tax, total = _finish(subtotal, to_decimal(tax_rates[i]), to_decimal(discounts[i]),
+                                       to_decimal(discount_percents[i]))
+        result.subtotals.append(subtotal)
+        result.discounts.append(discount)
+        result.taxes.append(tax)
+        result.totals.append(total)
+    return result
+
+
+def line_item_placeholders(description, quantity, unit_price, line_total):
+    """Template values for one repeated [item] row"""
+    return {
+        "[item]": description,
+        # Rounded like the totals; format() alone would round half-even (2.125 -> 2.12)
+        "[item_qty]": f"{round_money(to_decimal(quantity)):.2f}",
+        "[item_price]": f"{round_money(to_decimal(unit_price)):.2f}",
+        "[item_total]": f"{line_total:.2f}",
+    }
+
+
+def invoice_placeholders(lines, tax_rate=0, discount=0, discount_percent=0):
+    """Build [item] rows and totals placeholders for (description, qty, price) lines.
+
+    Returns (items, totals_placeholders, totals) so the GUI, the render
+    service and scheduled jobs fill templates from the same numbers.
+    """
+    lines = list(lines)
+    totals = compute_totals(((qty, price) for _, qty, price in lines),
+                            tax_rate, discount, discount_percent)
+    items = [line_item_placeholders(desc, qty, price, line_total)
+             for (desc, qty, price), line_total in zip(lines, totals.line_totals)]
+    placeholders = {
+        "[subtotal]": f"{totals.subtotal:.2f}",
+        "[discount]": f"{totals.discount:.2f}",
+        "[iva]": f"{totals.tax:.2f}",
+        "[total_iva]": f"{totals.total:.2f}",
+    }
+    return items, placeholders, totals
@@ -0,0 +1,196 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Recent durations kept per operation for the diagnostics window
+RECENT_SPANS = 500
+# Upper bounds (ms) of the histogram buckets; the last bucket is open-ended
+HISTOGRAM_BOUNDS_MS = (1, 5, 20, 100, 500, 2000)
+
+
+class _NullSpan:
+    """Shared no-op span handed out while tracing is disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.parent = None
+        self.start = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        self.tracer._stack().pop()
+        self.tracer.record(self, duration, exc)
+        return False
+
+
+class Tracer:
+    """Monotonic timing spans around slow paths, off unless configured.
+
+    While disabled, span() returns a shared no-op object and traced()
+    functions only pay for one attribute check. When enabled, each
+    finished span is appended to a JSONL file that rotates at max_bytes,
+    and its duration is kept in a per-operation ring buffer for stats().
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.max_bytes = 0
+        self.backups = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._recent = {}
+        self._file = None
+
+    def configure(self, enabled, path="trace.jsonl", max_mb=5, backups=3):
+        with self._lock:
+            self._close_file()
+            self.path = path
+            self.max_bytes = int(max_mb * 1024 * 1024)
+            self.backups = backups
+            self.enabled = bool(enabled)
+
+    def span(self, name, **attrs):
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, attrs)
+
+    def traced(self, name):
+        """Decorator that wraps every call in a span called name"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with Span(self, name, {}):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, span, duration, error=None):
+        duration_ms = duration * 1000
+        entry = {
+            "ts": round(time.time(), 6),
+            "name": span.name,
+            "ms": round(duration_ms, 3),
+            "thread": threading.current_thread().name,
+        }
+        if span.parent:
+            entry["parent"] = span.parent
+        if span.attrs:
+            entry["attrs"] = span.attrs
+        if error is not None:
+            entry["error"] = f"{type(error).__name__}: {error}"
+        line = json.dumps(entry, default=str) + "\n"
+        with self._lock:
+            recent = self._recent.get(span.name)
+            if recent is None:
+                recent = self._recent[span.name] = deque(maxlen=RECENT_SPANS)
+            recent.append(duration_ms)
+            if self.path:
+                try:
+                    self._write(line)
+                except OSError as e:
+                    print(f"Error writing trace: {str(e)}")
+                    self.path = None
+
+    def stats(self):
+        """Return {operation: {count, p50_ms, p95_ms, max_ms, histogram}} for recent spans"""
+        with self._lock:
+            snapshot = {name: sorted(values) for name, values in self._recent.items()}
+        stats = {}
+        for name, values in snapshot.items():
+            if not values:
+                continue
+            histogram = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+            for value in values:
+                bucket = 0
+                while bucket < len(HISTOGRAM_BOUNDS_MS) and value >= HISTOGRAM_BOUNDS_MS[bucket]:
+                    bucket += 1
+                histogram[bucket] += 1
+            stats[name] = {
+                "count": len(values),
+                "p50_ms": _percentile(values, 0.50),
+                "p95_ms": _percentile(values, 0.95),
+                "max_ms": values[-1],
+                "histogram": histogram,
+            }
+        return stats
+
+    def reset(self):
+        with self._lock:
+            self._recent.clear()
+
+    def close(self):
+        with self._lock:
+            self._close_file()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _write(self, line):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(line)
+        self._file.flush()
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        # trace.jsonl -> trace.jsonl.1 -> ... -> trace.jsonl.<backups>
+        self._close_file()
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+tracer = Tracer()
+span = tracer.span
+traced = tracer.traced